@@ -0,0 +1,90 @@
+import os
+
+"""serving: development (one process, auto reload) or production (SERVER_WORKERS processes, no reload), the address to
+bind, and the URL clients reach the service at, behind a load balancer the balancer's; empty takes it from each
+request"""
+SERVER_MODE = os.environ.get("SERVER_MODE", "development")
+SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", 8000))
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 1)) if SERVER_MODE == "production" else 1
+BASE_URL = os.environ.get("BASE_URL", "").rstrip("/") + "/" if os.environ.get("BASE_URL") else ""
+
+"""folder served under /static that holds the excel and docx session workspaces; put it on storage every worker and
+node mounts at the same path. The session registry is shared the same way: sqlite:///path/to/sessions.db, or empty
+to go by the session folders alone"""
+WORKSPACE_ROOT = os.path.abspath(os.environ.get(
+    "WORKSPACE_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")))
+SESSION_REGISTRY = os.environ.get("SESSION_REGISTRY", "")
+SESSION_REGISTRY_TIMEOUT = float(os.environ.get("SESSION_REGISTRY_TIMEOUT", 30))
+
+"""worker pool used for the blocking parts of a comparison; the cpu workers of a node are split between its server
+workers"""
+COMPARE_IO_WORKERS = int(os.environ.get("COMPARE_IO_WORKERS", 8))
+COMPARE_CPU_WORKERS = int(os.environ.get("COMPARE_CPU_WORKERS", max(1, (os.cpu_count() or 1) // SERVER_WORKERS)))
+COMPARE_QUEUE_DEPTH = int(os.environ.get("COMPARE_QUEUE_DEPTH", 16))
+COMPARE_JOB_TIMEOUT = float(os.environ.get("COMPARE_JOB_TIMEOUT", 600))
+
+"""content-addressed cache of finished comparisons, and how many input file digests each process remembers"""
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+RESULT_CACHE_MAX_AGE = float(os.environ.get("RESULT_CACHE_MAX_AGE", 7 * 24 * 3600))
+RESULT_CACHE_DIGEST_ENTRIES = int(os.environ.get("RESULT_CACHE_DIGEST_ENTRIES", 10000))
+
+"""number of changed cells listed in an Excel comparison_summary.json"""
+SUMMARY_CHANGE_LIMIT = int(os.environ.get("SUMMARY_CHANGE_LIMIT", 10000))
+
+"""Excel results with more aligned rows than this get the paginated view"""
+EXCEL_INLINE_ROW_LIMIT = int(os.environ.get("EXCEL_INLINE_ROW_LIMIT", 5000))
+EXCEL_PAGE_SIZE = int(os.environ.get("EXCEL_PAGE_SIZE", 200))
+EXCEL_MAX_WINDOW = int(os.environ.get("EXCEL_MAX_WINDOW", 2000))
+
+"""jinja templates: optional on-disk bytecode cache folder, and whether edited templates are picked up without a restart"""
+TEMPLATE_BYTECODE_CACHE = os.environ.get("TEMPLATE_BYTECODE_CACHE", "")
+TEMPLATE_AUTO_RELOAD = os.environ.get("TEMPLATE_AUTO_RELOAD", "0") == "1"
+
+"""how input documents are placed in a session: auto (reflink, then copy), reflink, hardlink (shares the file with
+the caller, so later edits of the source show in the session), reference or copy"""
+WORKSPACE_STRATEGY = os.environ.get("WORKSPACE_STRATEGY", "auto")
+
+"""background removal of abandoned sessions: age limit, total byte quota and how often to check"""
+SESSION_REAPER_ENABLED = os.environ.get("SESSION_REAPER_ENABLED", "1") == "1"
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 24 * 3600))
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", 20 * 1024 ** 3))
+SESSION_REAP_INTERVAL = float(os.environ.get("SESSION_REAP_INTERVAL", 300))
+
+"""xlsx reader used when a request does not pick one: openpyxl, or the faster sax or calamine (needs python-calamine)
+readers to opt in to"""
+EXCEL_READER = os.environ.get("EXCEL_READER", "openpyxl")
+
+"""rows per chunk when streaming delimited files, and input bytes per partition the rows are matched in; memory
+follows these two, not the size of the files"""
+CSV_CHUNK_ROWS = int(os.environ.get("CSV_CHUNK_ROWS", 100000))
+CSV_PARTITION_BYTES = int(os.environ.get("CSV_PARTITION_BYTES", 64 * 1024 * 1024))
+
+"""docx comparison engine used when a request does not pick one: spire (layout-faithful) or native (python-docx text diff)"""
+DOCX_ENGINE = os.environ.get("DOCX_ENGINE", "spire")
+
+"""batch comparisons: pairs compared at once, and the most pairs one request may carry"""
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", COMPARE_CPU_WORKERS))
+BATCH_MAX_PAIRS = int(os.environ.get("BATCH_MAX_PAIRS", 10000))
+
+"""documents uploaded into a session: largest accepted body, and how much is buffered per disk write"""
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 2 * 1024 ** 3))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", 1024 ** 2))
+
+"""precompressed result artifacts: encodings written beside each one (br needs the brotli package), compression levels,
+the smallest file worth compressing and how many folder manifests the static server keeps in memory"""
+STATIC_ENCODINGS = os.environ.get("STATIC_ENCODINGS", "br,gzip").split(",")
+STATIC_GZIP_LEVEL = int(os.environ.get("STATIC_GZIP_LEVEL", 6))
+STATIC_BROTLI_QUALITY = int(os.environ.get("STATIC_BROTLI_QUALITY", 5))
+STATIC_MIN_COMPRESS_BYTES = int(os.environ.get("STATIC_MIN_COMPRESS_BYTES", 1024))
+STATIC_MANIFEST_CACHE = int(os.environ.get("STATIC_MANIFEST_CACHE", 4096))
+
+"""metrics: the /metrics endpoint and request timing, a Server-Timing header on responses, and cProfile dumps of
+pool jobs slower than this many seconds (0 disables profiling) written to a folder. Metrics, cache and session stats
+are kept per process: with SERVER_WORKERS above 1 a scrape returns the figures of whichever worker answered it, named
+by docomp_process_info and the stats' process field, not totals for the node"""
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "0") == "1"
+METRICS_PROFILE_SLOW_SECONDS = float(os.environ.get("METRICS_PROFILE_SLOW_SECONDS", 0))
+METRICS_PROFILE_FOLDER = os.environ.get("METRICS_PROFILE_FOLDER", "profiles")
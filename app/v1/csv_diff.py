@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+import shutil
+import json
+import os
+
+from app.v1.excel_diff import ROW_STATES, EQUAL, MODIFIED, INSERTED, DELETED, occurrence_index
+from app.v1.excel_row_store import RowStoreWriter
+from app.v1.timing import StageTimer
+
+"""delimiter by file extension when a request does not name one"""
+DELIMITERS = {".csv": ",", ".tsv": "\t", ".tab": "\t", ".txt": ","}
+"""scratch folder of a comparison: hash partitions, memory-mapped per-row results and parked rows"""
+MATCH_FOLDER = ".match"
+SIDE_ROWS_FILE = "side_1.ndjson"
+HASH_RECORD = np.dtype([("key", np.uint64), ("hash", np.uint64), ("row", np.int64)])
+
+
+class CsvSource:
+    """a delimited file read as text in fixed-size chunks, so memory does not grow with the file"""
+    def __init__(self, path: str, delimiter: str, encoding: str, chunk_rows: int):
+        self.path = path
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.chunk_rows = chunk_rows
+        self.columns = list(self.read_csv(nrows=0).columns)
+
+    def read_csv(self, **options):
+        """every cell stays a string: exports are compared as written, not as parsed numbers"""
+        return pd.read_csv(self.path, sep=self.delimiter, encoding=self.encoding, dtype=str,
+                           keep_default_na=False, na_filter=False, **options)
+
+    def chunks(self, columns: list, default_value: str):
+        """(first row number, chunk) with the chunk laid out on the given columns"""
+        start = 0
+        for chunk in self.read_csv(chunksize=self.chunk_rows):
+            yield start, chunk.reindex(columns=columns, fill_value=default_value)
+            start += len(chunk)
+
+    def spill_hashes(self, columns: list, shared_columns: list, key_columns: list, default_value: str, folder: str,
+                     side: int, partitions: int) -> int:
+        """append (key hash, row hash, row number) of every row to the partition file its key hash falls in; returns
+        the number of rows. Rows are hashed on the columns both files have; without key columns that is the key"""
+        rows = 0
+        for start, chunk in self.chunks(columns, default_value):
+            records = np.empty(len(chunk), dtype=HASH_RECORD)
+            records["hash"] = pd.util.hash_pandas_object(chunk[shared_columns], index=False).to_numpy() \
+                if shared_columns else 0
+            records["key"] = pd.util.hash_pandas_object(chunk[key_columns], index=False).to_numpy() \
+                if key_columns else records["hash"]
+            records["row"] = np.arange(start, start + len(chunk))
+            parts = records["key"] % np.uint64(partitions)
+            order = np.argsort(parts, kind="stable")
+            bounds = np.searchsorted(parts[order], np.arange(partitions + 1, dtype=np.uint64))
+            for partition in np.flatnonzero(np.diff(bounds)).tolist():
+                with open(partition_path(folder, side, partition), "ab") as file:
+                    file.write(records[order[bounds[partition]:bounds[partition + 1]]].tobytes())
+            rows = start + len(chunk)
+        return rows
+
+
+def partition_path(folder: str, side: int, partition: int) -> str:
+    return os.path.join(folder, f"{side}_{partition}.bin")
+
+
+def read_partition(folder: str, side: int, partition: int) -> np.ndarray:
+    path = partition_path(folder, side, partition)
+    return np.fromfile(path, dtype=HASH_RECORD) if os.path.isfile(path) else np.empty(0, dtype=HASH_RECORD)
+
+
+def disk_array(folder: str, name: str, length: int, dtype, fill) -> np.ndarray:
+    """a per-row array memory-mapped from the match folder, so it is paged in and out instead of held in memory"""
+    if not length:
+        return np.full(0, fill, dtype=dtype)
+    array = np.lib.format.open_memmap(os.path.join(folder, f"{name}.npy"), mode="w+", dtype=dtype, shape=(length,))
+    array[:] = fill
+    return array
+
+
+def match_rows(values_1: np.ndarray, values_2: np.ndarray):
+    """partner position on the other side for every row, -1 when it has none; duplicates pair up in order"""
+    if not len(values_1) or not len(values_2):
+        return np.full(len(values_1), -1), np.full(len(values_2), -1)
+    partners_1 = occurrence_index(values_2).get_indexer(occurrence_index(values_1))
+    partners_2 = np.full(len(values_2), -1)
+    matched = partners_1 >= 0
+    partners_2[partners_1[matched]] = np.flatnonzero(matched)
+    return partners_1, partners_2
+
+
+def compare_csv_files(source_1: CsvSource, source_2: CsvSource, session_path: str, key_columns: list = None,
+                      default_value: str = "N/A", change_limit: int = 10000, timer=None,
+                      partition_bytes: int = 64 * 1024 * 1024) -> dict:
+    """hash both files, then stream them again writing only the rows that differ to the session row store.
+
+    The row hashes are spilled to disk in partitions of about partition_bytes of input each and matched one partition
+    at a time; the per-row results are memory-mapped. Without key columns rows are matched by content, so a changed
+    row shows up as one deleted and one inserted row.
+    """
+    timer = timer or StageTimer()
+    columns = source_1.columns + [column for column in source_2.columns if column not in set(source_1.columns)]
+    key_columns = key_columns or []
+    match_folder = os.path.join(session_path, MATCH_FOLDER)
+    shutil.rmtree(match_folder, ignore_errors=True)
+    os.makedirs(match_folder)
+    try:
+        return compare_partitioned(source_1, source_2, session_path, match_folder, columns, key_columns,
+                                   default_value, change_limit, timer, partition_bytes)
+    finally:
+        shutil.rmtree(match_folder, ignore_errors=True)
+
+
+def compare_partitioned(source_1: CsvSource, source_2: CsvSource, session_path: str, match_folder: str, columns: list,
+                        key_columns: list, default_value: str, change_limit: int, timer,
+                        partition_bytes: int) -> dict:
+    input_bytes = os.path.getsize(source_1.path) + os.path.getsize(source_2.path)
+    partitions = max(1, -(-input_bytes // partition_bytes))
+    """added and removed columns are column changes, reported on their own, so they never make a row modified"""
+    shared_columns = [column for column in source_1.columns if column in set(source_2.columns)]
+    shared_positions = [columns.index(column) for column in shared_columns]
+    with timer.stage("parse"):
+        rows_1 = source_1.spill_hashes(columns, shared_columns, key_columns, default_value, match_folder, 1,
+                                       partitions)
+        rows_2 = source_2.spill_hashes(columns, shared_columns, key_columns, default_value, match_folder, 2,
+                                       partitions)
+
+    with timer.stage("diff"):
+        states_1 = disk_array(match_folder, "states_1", rows_1, np.int8, DELETED)
+        states_2 = disk_array(match_folder, "states_2", rows_2, np.int8, INSERTED)
+        partners_2 = disk_array(match_folder, "partners_2", rows_2, np.int64, -1)
+        """without shared columns there is nothing to match rows on: all are deleted or inserted"""
+        for partition in range(partitions if shared_columns else 0):
+            records_1 = read_partition(match_folder, 1, partition)
+            records_2 = read_partition(match_folder, 2, partition)
+            _, found = match_rows(records_1["key"], records_2["key"])
+            paired = found >= 0
+            matched_1, matched_2 = records_1[found[paired]], records_2[paired]
+            same = matched_1["hash"] == matched_2["hash"]
+            partners_2[matched_2["row"]] = matched_1["row"]
+            states_1[matched_1["row"]] = np.where(same, EQUAL, MODIFIED)
+            states_2[matched_2["row"]] = np.where(same, EQUAL, MODIFIED)
+
+    with timer.stage("render"):
+        """rows of the first file that are needed later are parked on disk, addressed by their row number"""
+        side_starts = disk_array(match_folder, "side_starts", rows_1, np.int64, -1)
+        side_path = os.path.join(match_folder, SIDE_ROWS_FILE)
+        writer = RowStoreWriter(session_path)
+        empty_row = [default_value] * len(columns)
+        rows_per_state = np.zeros(len(ROW_STATES), dtype=np.int64)
+        with open(side_path, "wb") as side_file:
+            for start, chunk in source_1.chunks(columns, default_value):
+                chunk_states = np.asarray(states_1[start:start + len(chunk)])
+                rows_per_state[DELETED] += np.count_nonzero(chunk_states == DELETED)
+                offsets = np.flatnonzero(chunk_states != EQUAL)
+                for offset, values in zip(offsets, chunk.iloc[offsets].values.tolist()):
+                    if chunk_states[offset] == DELETED:
+                        writer.write(DELETED, values, empty_row, [], start + int(offset))
+                        continue
+                    side_starts[start + offset] = side_file.tell()
+                    side_file.write(json.dumps(values).encode() + b"\n")
+
+        """deleted rows lead the store, then modified and inserted rows in the order of the second file"""
+        changes = []
+        changed_cells = 0
+        cells_per_column = np.zeros(len(columns), dtype=np.int64)
+        with open(side_path, "rb") as side_file:
+            for start, chunk in source_2.chunks(columns, default_value):
+                chunk_states = np.asarray(states_2[start:start + len(chunk)])
+                rows_per_state += np.bincount(chunk_states, minlength=len(ROW_STATES))
+                offsets = np.flatnonzero(chunk_states != EQUAL)
+                for offset, values_2 in zip(offsets, chunk.iloc[offsets].values.tolist()):
+                    if chunk_states[offset] == INSERTED:
+                        writer.write(INSERTED, empty_row, values_2, [], row_2=start + int(offset))
+                        continue
+                    row_1 = int(partners_2[start + offset])
+                    side_file.seek(int(side_starts[row_1]))
+                    values_1 = json.loads(side_file.readline())
+                    cells = [column for column in shared_positions if values_1[column] != values_2[column]]
+                    cells_per_column[cells] += 1
+                    changed_cells += len(cells)
+                    for column in cells:
+                        if len(changes) < change_limit:
+                            changes.append({"row": len(writer.offsets) - 1, "row_1": row_1, "row_2": start + int(offset),
+                                            "column": columns[column], "value_1": values_1[column],
+                                            "value_2": values_2[column]})
+                    writer.write(MODIFIED, values_1, values_2, cells, row_1, start + int(offset))
+
+        added_columns = [column for column in columns if column not in set(source_1.columns)]
+        removed_columns = [column for column in columns if column not in set(source_2.columns)]
+        column_states = ["added" if column in added_columns else "removed" if column in removed_columns else None
+                         for column in columns]
+        writer.close({"file_1": source_1.path, "file_2": source_2.path}, columns, column_states)
+
+    return {
+        "header": columns,
+        "column_states": column_states,
+        "rows_compared": int(rows_per_state.sum()),
+        "rows_in_file_1": rows_1,
+        "rows_in_file_2": rows_2,
+        "changed_rows": len(writer.offsets) - 1,
+        "changed_cells": changed_cells,
+        **{f"{state}_rows": int(count) for state, count in zip(ROW_STATES, rows_per_state)},
+        "added_columns": added_columns,
+        "removed_columns": removed_columns,
+        "changed_cells_per_column": {columns[column]: int(count) for column, count in enumerate(cells_per_column)
+                                     if count},
+        "changes": changes,
+        "changes_truncated": changed_cells > change_limit,
+    }
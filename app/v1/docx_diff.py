@@ -0,0 +1,148 @@
+from difflib import SequenceMatcher
+from docx import Document as WordDocument
+from docx.enum.style import WD_STYLE_TYPE
+import hashlib
+import json
+import re
+
+from app.v1.timing import StageTimer
+
+"""block states, named like the Excel row states"""
+EQUAL = "equal"
+MODIFIED = "modified"
+INSERTED = "inserted"
+DELETED = "deleted"
+BLOCK_STATES = (EQUAL, MODIFIED, INSERTED, DELETED)
+"""paired blocks sharing less of their words than this are shown as a deletion and an insertion"""
+MODIFIED_RATIO = 0.5
+WORDS = re.compile(r"\w+|\s+|[^\w\s]")
+
+
+def block_hash(*parts) -> bytes:
+    return hashlib.blake2b(json.dumps(parts).encode(), digest_size=8).digest()
+
+
+def paragraph_block(paragraph, style_names: dict, default_style: str) -> dict:
+    runs = [[run.text, bool(run.bold), bool(run.italic), bool(run.underline)] for run in paragraph.runs if run.text]
+    style = style_names.get(paragraph._p.style, default_style)
+    text = paragraph.text
+    return {"kind": "paragraph", "style": style, "text": text, "runs": runs,
+            "text_hash": block_hash("paragraph", text), "hash": block_hash("paragraph", style, runs)}
+
+
+def table_block(table) -> dict:
+    rows = [[cell.text for cell in row.cells] for row in table.rows]
+    text = "\n".join("\t".join(row) for row in rows)
+    return {"kind": "table", "rows": rows, "text": text,
+            "text_hash": block_hash("table", rows), "hash": block_hash("table", rows)}
+
+
+def read_blocks(path: str) -> list:
+    """paragraphs and tables of the document body in reading order"""
+    document = WordDocument(path)
+    """Paragraph.style searches the whole styles part on every call, so names are looked up once per document"""
+    style_names = {style.style_id: style.name for style in document.styles}
+    default_style = document.styles.default(WD_STYLE_TYPE.PARAGRAPH)
+    default_style = default_style.name if default_style is not None else None
+    blocks = []
+    for item in document.iter_inner_content():
+        blocks.append(table_block(item) if hasattr(item, "rows") else paragraph_block(item, style_names, default_style))
+    return blocks
+
+
+def word_segments(text_1: str, text_2: str) -> tuple:
+    """[text, changed] runs for each side of a modified paragraph"""
+    words_1, words_2 = WORDS.findall(text_1), WORDS.findall(text_2)
+    segments_1, segments_2 = [], []
+    for tag, start_1, end_1, start_2, end_2 in SequenceMatcher(None, words_1, words_2, autojunk=False).get_opcodes():
+        if end_1 > start_1:
+            segments_1.append(["".join(words_1[start_1:end_1]), tag != "equal"])
+        if end_2 > start_2:
+            segments_2.append(["".join(words_2[start_2:end_2]), tag != "equal"])
+    return segments_1, segments_2
+
+
+def changed_table_cells(rows_1: list, rows_2: list) -> list:
+    """[row, column] of every cell that differs, comparing the tables position by position"""
+    cells = []
+    for row in range(max(len(rows_1), len(rows_2))):
+        cells_1 = rows_1[row] if row < len(rows_1) else []
+        cells_2 = rows_2[row] if row < len(rows_2) else []
+        for column in range(max(len(cells_1), len(cells_2))):
+            if (cells_1[column] if column < len(cells_1) else None) != (cells_2[column] if column < len(cells_2) else None):
+                cells.append([row, column])
+    return cells
+
+
+def similar(block_1: dict, block_2: dict) -> bool:
+    if block_1["kind"] != block_2["kind"]:
+        return False
+    if block_1["text_hash"] == block_2["text_hash"]:
+        return True
+    matcher = SequenceMatcher(None, WORDS.findall(block_1["text"]), WORDS.findall(block_2["text"]), autojunk=False)
+    return matcher.quick_ratio() >= MODIFIED_RATIO and matcher.ratio() >= MODIFIED_RATIO
+
+
+def modified_entry(block_1: dict, block_2: dict) -> dict:
+    entry = {"state": MODIFIED, "block_1": block_1, "block_2": block_2}
+    if block_1["kind"] == "table":
+        entry["changed_cells"] = changed_table_cells(block_1["rows"], block_2["rows"])
+    elif block_1["text_hash"] == block_2["text_hash"]:
+        """same words, different style or run formatting"""
+        entry["formatting_only"] = True
+        entry["segments_1"] = [[block_1["text"], False]]
+        entry["segments_2"] = [[block_2["text"], False]]
+    else:
+        entry["segments_1"], entry["segments_2"] = word_segments(block_1["text"], block_2["text"])
+    return entry
+
+
+def align_blocks(blocks_1: list, blocks_2: list) -> list:
+    """match blocks on their 8-byte hashes, then pair up the replaced runs one block at a time"""
+    aligned = []
+    matcher = SequenceMatcher(None, [block["hash"] for block in blocks_1], [block["hash"] for block in blocks_2],
+                              autojunk=False)
+    for tag, start_1, end_1, start_2, end_2 in matcher.get_opcodes():
+        if tag == "equal":
+            aligned += [{"state": EQUAL, "block_1": blocks_1[i], "block_2": blocks_2[j]}
+                        for i, j in zip(range(start_1, end_1), range(start_2, end_2))]
+            continue
+        i, j = start_1, start_2
+        while i < end_1 and j < end_2:
+            if similar(blocks_1[i], blocks_2[j]):
+                aligned.append(modified_entry(blocks_1[i], blocks_2[j]))
+                i, j = i + 1, j + 1
+            elif end_1 - i >= end_2 - j:
+                aligned.append({"state": DELETED, "block_1": blocks_1[i], "block_2": None})
+                i += 1
+            else:
+                aligned.append({"state": INSERTED, "block_1": None, "block_2": blocks_2[j]})
+                j += 1
+        aligned += [{"state": DELETED, "block_1": block, "block_2": None} for block in blocks_1[i:end_1]]
+        aligned += [{"state": INSERTED, "block_1": None, "block_2": block} for block in blocks_2[j:end_2]]
+    return aligned
+
+
+def public_block(block: dict):
+    """a block without its hashes, as written to the change list"""
+    if block is None:
+        return None
+    return {key: value for key, value in block.items() if key not in ("hash", "text_hash")}
+
+
+def compare_blocks(blocks_1: list, blocks_2: list, timer: StageTimer = None) -> dict:
+    """aligned blocks of both documents plus counts per state"""
+    timer = timer or StageTimer()
+    with timer.stage("diff"):
+        aligned = align_blocks(blocks_1, blocks_2)
+        for position, entry in enumerate(aligned):
+            entry["block"] = position
+            entry["block_1"] = public_block(entry["block_1"])
+            entry["block_2"] = public_block(entry["block_2"])
+
+    counts = {f"{state}_blocks": 0 for state in BLOCK_STATES}
+    for entry in aligned:
+        counts[f"{entry['state']}_blocks"] += 1
+    return {"summary": {"blocks_in_file_1": len(blocks_1), "blocks_in_file_2": len(blocks_2),
+                        "changed_blocks": len(aligned) - counts["equal_blocks"], **counts},
+            "blocks": aligned}
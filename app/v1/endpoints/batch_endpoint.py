@@ -0,0 +1,107 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Literal, Union
+import asyncio
+import json
+
+from app.v1.worker_pool import io_pool
+from app.v1.public_urls import rebase_urls
+from app.v1.endpoints import excel_endpoint, doc_endpoint, csv_endpoint
+from app.v1 import config
+
+router = APIRouter()
+
+
+class ExcelBatchPair(excel_endpoint.ExcelFilePath):
+    kind: Literal["excel"]
+
+class ExcelWorkbookBatchPair(excel_endpoint.ExcelWorkbookPath):
+    kind: Literal["excel_workbook"]
+
+class DocxBatchPair(doc_endpoint.DocxFilePath):
+    kind: Literal["docx"]
+
+class CsvBatchPair(csv_endpoint.CsvFilePath):
+    kind: Literal["csv"]
+
+"""the body of the matching single-pair endpoint plus its kind"""
+ComparisonPair = Annotated[Union[ExcelBatchPair, ExcelWorkbookBatchPair, DocxBatchPair, CsvBatchPair],
+                           Field(discriminator="kind")]
+
+class BatchRequest(BaseModel):
+    pairs: List[ComparisonPair]
+
+
+"""cache lookup and comparison endpoint per kind of pair"""
+PAIR_HANDLERS = {
+    "excel": (excel_endpoint.find_cached_comparison, excel_endpoint.generate_url),
+    "excel_workbook": (excel_endpoint.find_cached_workbook_comparison, excel_endpoint.generate_workbook_url),
+    "docx": (doc_endpoint.find_cached_comparison, doc_endpoint.generate_url),
+    "csv": (csv_endpoint.find_cached_comparison, csv_endpoint.generate_url),
+}
+
+
+class BatchRun:
+    """compares the pairs of one batch, running each distinct comparison once"""
+    def __init__(self, pairs: list):
+        self.pairs = pairs
+        self.slots = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+        self.comparisons = {}
+
+    async def comparison_key(self, pair):
+        """the result cache key identifies equal inputs; without the cache the request body does"""
+        find_cached, _ = PAIR_HANDLERS[pair.kind]
+        cache_key, cached_result = None, None
+        if config.RESULT_CACHE_ENABLED:
+            cache_key, cached_result = await io_pool.run(find_cached, pair)
+        return cache_key or f"{pair.kind}:{pair.model_dump_json()}", cached_result
+
+    async def compare(self, pair) -> dict:
+        _, generate = PAIR_HANDLERS[pair.kind]
+        async with self.slots:
+            return await generate(pair)
+
+    async def run_pair(self, index: int) -> dict:
+        pair = self.pairs[index]
+        line = {"index": index, "kind": pair.kind}
+        try:
+            async with self.slots:
+                key, cached_result = await self.comparison_key(pair)
+            if cached_result is not None:
+                return {**line, "status": "done", **rebase_urls(cached_result), "cached": True}
+
+            """later pairs with the same inputs wait for the first one instead of comparing again"""
+            if key in self.comparisons:
+                first_index, comparison = self.comparisons[key]
+                line["duplicate_of"] = first_index
+            else:
+                comparison = asyncio.ensure_future(self.compare(pair))
+                self.comparisons[key] = (index, comparison)
+            return {**line, "status": "done", **await asyncio.shield(comparison)}
+        except HTTPException as error:
+            return {**line, "status": "failed", "status_code": error.status_code, "detail": error.detail}
+        except Exception as error:
+            return {**line, "status": "failed", "status_code": 500, "detail": str(error)}
+
+    async def results(self):
+        """one NDJSON line per pair, in completion order"""
+        tasks = [asyncio.ensure_future(self.run_pair(index)) for index in range(len(self.pairs))]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished, default=str) + "\n"
+        finally:
+            """a client that hangs up stops the comparisons that have not started yet"""
+            for task in tasks:
+                task.cancel()
+            for _, comparison in self.comparisons.values():
+                comparison.cancel()
+
+
+@router.post("/compare_batch")
+async def compare_batch(batch: BatchRequest):
+    if not batch.pairs:
+        raise HTTPException(status_code=400, detail="No document pairs given")
+    if len(batch.pairs) > config.BATCH_MAX_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {config.BATCH_MAX_PAIRS} pairs per batch")
+    return StreamingResponse(BatchRun(batch.pairs).results(), media_type="application/x-ndjson")
@@ -0,0 +1,106 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+import os
+import json
+
+from app.v1.timing import StageTimer
+from app.v1.csv_diff import CsvSource, DELIMITERS, compare_csv_files
+from app.v1.rendering import render_to_file
+from app.v1.static_files import precompress
+from app.v1.metrics import instrumented
+from app.v1.result_cache import ResultCache, file_digest
+from app.v1.endpoints.excel_endpoint import HtmlGenerator, excel_result_cache, compare_in_session, serve_comparison
+from app.v1 import config
+
+"""delimited files share the Excel session workspace, so its rows, status and remove endpoints serve them too"""
+router = APIRouter()
+
+
+class CsvFilePath(BaseModel):
+    csv_file_1_path: str
+    csv_file_2_path: str
+    """taken from the file extension when not given"""
+    delimiter: Optional[str] = None
+    encoding: str = "utf-8"
+    """rows are matched by these columns; without them by whole-row content"""
+    key_columns: List[str] = []
+
+    def column_delimiter(self, path: str) -> str:
+        return self.delimiter or DELIMITERS.get(os.path.splitext(path)[1].lower(), ",")
+
+class CsvComparator:
+    def __init__(self, file_paths: CsvFilePath):
+        self.document_1 = file_paths.csv_file_1_path
+        self.document_2 = file_paths.csv_file_2_path
+        self.file_paths = file_paths
+
+    def validate_documents(self, timer: StageTimer):
+        """check both files and read their headers only; the rows are streamed later"""
+        with timer.stage("validate"):
+            for document in (self.document_1, self.document_2):
+                if not os.path.isfile(document):
+                    raise HTTPException(status_code=404, detail=f"{document} not found.")
+            try:
+                sources = [CsvSource(document, self.file_paths.column_delimiter(document), self.file_paths.encoding,
+                                     config.CSV_CHUNK_ROWS) for document in (self.document_1, self.document_2)]
+            except Exception as error:
+                raise HTTPException(status_code=400, detail=f"Invalid delimited document: {error}")
+            for name in self.file_paths.key_columns:
+                if name not in sources[0].columns or name not in sources[1].columns:
+                    raise HTTPException(status_code=400, detail=f"Key column {name} not found in both files")
+        return sources
+
+def compare_csv_documents(file_paths: CsvFilePath, session_workspace: str, timer: StageTimer = None):
+    """stream, hash and diff two delimited files; runs in the process pool"""
+    timer = timer or StageTimer()
+    source_1, source_2 = CsvComparator(file_paths).validate_documents(timer)
+    summary = compare_csv_files(source_1, source_2, session_workspace, file_paths.key_columns, "N/A",
+                                config.SUMMARY_CHANGE_LIMIT, timer, config.CSV_PARTITION_BYTES)
+
+    with timer.stage("render"):
+        header, column_states = summary.pop("header"), summary.pop("column_states")
+        render_to_file(
+            "excel_comparison_paginated.html",
+            f"{session_workspace}/comparison_result.html",
+            title="Contentverse CSV Document Comparision",
+            document_label="CSV Document Path",
+            rows_url=f"/v1/excel_session/{os.path.basename(session_workspace)}/rows",
+            file1=file_paths.csv_file_1_path,
+            file2=file_paths.csv_file_2_path,
+            header=header,
+            column_states=column_states,
+            row_classes=HtmlGenerator.ROW_CLASSES,
+            page_size=config.EXCEL_PAGE_SIZE,
+            total_rows=summary["changed_rows"],
+            changed_rows=summary["changed_rows"]
+        )
+        with open(f"{session_workspace}/comparison_summary.json", "w") as file:
+            json.dump({"file_1": {"path": file_paths.csv_file_1_path}, "file_2": {"path": file_paths.csv_file_2_path},
+                       **summary}, file, default=str)
+        precompress(f"{session_workspace}/comparison_summary.json")
+
+    counts = {key: value for key, value in summary.items() if key != "changes"}
+    return {"timings": timer.timings, "summary": counts}
+
+def find_cached_comparison(file_paths: CsvFilePath):
+    """hash both inputs and look up an earlier session for them; runs on the I/O pool"""
+    if not os.path.isfile(file_paths.csv_file_1_path) or not os.path.isfile(file_paths.csv_file_2_path):
+        return None, None
+    cache_key = ResultCache.make_key("csv",
+                                     file_digest(file_paths.csv_file_1_path),
+                                     file_paths.column_delimiter(file_paths.csv_file_1_path),
+                                     file_digest(file_paths.csv_file_2_path),
+                                     file_paths.column_delimiter(file_paths.csv_file_2_path),
+                                     file_paths.encoding, file_paths.key_columns)
+    return cache_key, excel_result_cache.lookup(cache_key)
+
+@instrumented("csv")
+async def run_csv_comparison(file_paths: CsvFilePath, session_id: str, timer: StageTimer, cache_key: str = None):
+    return await compare_in_session(compare_csv_documents, file_paths.csv_file_1_path, file_paths.csv_file_2_path,
+                                    file_paths, session_id, timer, cache_key)
+
+@router.post("/generate_url_for_csv")
+async def generate_url(file_paths: CsvFilePath, job: bool = False):
+    """reuse an earlier session when the same inputs were already compared"""
+    return await serve_comparison(run_csv_comparison, find_cached_comparison, file_paths, job)
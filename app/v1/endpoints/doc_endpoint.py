@@ -1,24 +1,61 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
-from pathlib import Path
-from docx import Document
+from fastapi.responses import JSONResponse, FileResponse
+from typing import Literal, Optional
 from spire.doc import *
 from spire.doc.common import *
 import os
 import uuid
 import shutil
-from jinja2 import Template
+import zipfile
+import json
+from fastapi.responses import HTMLResponse, RedirectResponse
+from urllib.parse import urlencode
+
+from app.v1.timing import StageTimer
+from app.v1.worker_pool import io_pool, cpu_pool, session_pool, remove_folder
+from app.v1.jobs import JobProgress, start_job, read_job_status, read_json, write_json, record_done
+from app.v1.metrics import instrumented
+from app.v1.public_urls import base_url, rebase_urls
+from app.v1.result_cache import ResultCache, file_digest
+from app.v1.session_reaper import SessionReaper
+from app.v1.workspace import place_document, resolve_document, session_document
+from app.v1.docx_diff import read_blocks, compare_blocks
+from app.v1.rendering import render, render_to_file
+from app.v1.static_files import precompress, precompress_export
+from app.v1 import config
 
 
 router = APIRouter()
-DOCX_WORKSPACE = os.path.abspath("app\\v1\\static\\docx\\")
-BASE_URL = "http://192.168.1.44:8000/"
+"""the wrapper page used to be a static file in the session; links to it are redirected to the rendered page"""
+legacy_router = APIRouter()
+DOCX_WORKSPACE = os.path.join(config.WORKSPACE_ROOT, "docx")
+COMPARE_AUTHOR = "E-ICEBLUE"
+DOCX_PAGE_TITLE = "Contentverse Docx Document Comparision"
+"""HTML exports of unmodified documents, one folder per content hash, shared by every session"""
+ORIGINALS_FOLDER = ".originals"
+ORIGINAL_HTML = "original.html"
+"""path and sha256 of the first document as it was compared, so the original pane shows that content, and the input
+paths the wrapper page displays when its URL does not carry them"""
+ORIGINAL_PIN = ".original.json"
+RESULT_HTML = "result.html"
+"""change list written by the native engine; its presence marks a native session"""
+CHANGES_FILE = "changes.json"
+BLOCK_CLASSES = {"equal": "", "modified": "table-warning", "inserted": "table-success", "deleted": "table-secondary"}
+docx_result_cache = ResultCache(DOCX_WORKSPACE, config.RESULT_CACHE_MAX_BYTES, config.RESULT_CACHE_MAX_AGE)
+docx_session_reaper = SessionReaper(DOCX_WORKSPACE, config.SESSION_TTL, config.SESSION_MAX_BYTES,
+                                   config.SESSION_REAP_INTERVAL, shared_folders=(ORIGINALS_FOLDER,))
 
 
 class DocxFilePath(BaseModel):
     docx_file_1_path: str
     docx_file_2_path: str
+    """spire keeps the layout; native diffs paragraphs and tables as text and is much faster"""
+    engine: Optional[Literal["spire", "native"]] = None
+
+    @property
+    def docx_engine(self) -> str:
+        return self.engine or config.DOCX_ENGINE
 
 class RemoveDocxSession(BaseModel):
     session_id: str
@@ -37,11 +74,15 @@ class DocxComparator:
             raise HTTPException(status_code=500, detail=f"Invalid docx document format")
 
     def validate_docx_format(self) -> bool:
+        """only the package structure is checked here; each document is parsed once, by the comparison itself"""
+        return self.is_docx_package(self.document_1) and self.is_docx_package(self.document_2)
+
+    @staticmethod
+    def is_docx_package(document: str) -> bool:
         try:
-            document_1 = Document(self.document_1)
-            document_2 = Document(self.document_2)
-            return True
-        except Exception as error:
+            with zipfile.ZipFile(document) as package:
+                return "word/document.xml" in package.namelist()
+        except (zipfile.BadZipFile, OSError):
             return False
 
 class Workspace:
@@ -50,166 +91,260 @@ class Workspace:
         session_id = str(uuid.uuid4())
         session_folder = os.path.join(DOCX_WORKSPACE, session_id)
         os.makedirs(session_folder)
+        docx_session_reaper.register(session_id)
         return session_id
 
     @staticmethod
     def copy_documents_to_session_workspace(file1_path: str, file2_path: str, session_workspace_path: str):
         try:
-            shutil.copy(file1_path, session_workspace_path)
-            shutil.copy(file2_path, session_workspace_path)
+            place_document(file1_path, session_workspace_path, 1)
+            place_document(file2_path, session_workspace_path, 2)
             return True
         except Exception as error:
             return False
 
-class HtmlGenerator:
-    @staticmethod
-    def generate_html_file(session_path, session_id, title, file1, file2):
-        template_str = '''<!DOCTYPE html>
-        <html>
-            <head>
-                <title>{{ title }}</title>
-                <!-- Bootstrap CSS -->
-                <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/css/bootstrap.min.css" rel="stylesheet" integrity="sha384-EVSTQN3/azprG1Anm3QDgpJLIm9Nao0Yz1ztcQTwFspd3yD65VohhpuuCOmLASjC" crossorigin="anonymous">
-                <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.7.1/jquery.min.js"></script>
-                <style>
-                .table-responsive {
-                    max-height: 600px;
-                    overflow-y: auto;
-                    overflow-x: auto;
-                }
-                .table-responsive table {
-                    width: 100%;
-                }
-                .table-container {
-                    display: flex;
-                    overflow-x: auto;
-                }
-                .table-container .table-responsive {
-                    flex: 0 0 auto;
-                    margin-right: 10px;
-                }
-                .square-badge {
-                    border-radius: 0;
-                }
-                .divScrollDiv {
-                    display: inline-block;
-                    width: 100%;
-                    border: 1px solid black;
-                    height: 94vh;
-                    overflow: scroll;
-                }
-                .tableNoScroll {
-                    overflow: hidden;
-                }
-            </style>
-        </head>
-        <body>
-        <div class="col-lg mx-auto p-3 py-md-3">
-            <header class="d-flex align-items-center pb-3 mb-5 border-bottom">
-                <a href="#" class="d-flex align-items-center text-dark text-decoration-none">
-                    <img src="/static/images/logo.jpeg" width="32" height="32" class="p-1">
-                    <span class="fs-6">Document Comparison and Analysis (Demo)</span>
-                </a>
-            </header>
-            <div class="container-fluid">
-                <div class="row">
-                    <div class="col">
-                        <div class="table-container">
-                            <!-- First Document -->
-                            <div class="table table-responsive">
-                                <span class="badge bg-primary square-badge mb-3">Docx Document Path</span><span class="badge bg-success square-badge">{{ file1 }}</span>
-                                <iframe src="/static/docx/{{session_id}}/original.html" style="width:100%; height:500px;"></iframe>
-                            </div> 
-                        </div>
-                    </div>
-                    <div class="col">
-                        <div class="table-container">
-                            <div class="table table-responsive">
-                                <!-- Second Document -->
-                                <span class="badge bg-primary square-badge mb-3">Excel Document Path</span><span class="badge bg-success square-badge">{{ file2 }}</span><br>
-                                <iframe src="/static/docx/{{session_id}}/result.html" style="width:100%; height:500px;"></iframe>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        <!-- Bootstrap JS (optional) -->
-        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/js/bootstrap.bundle.min.js" integrity="sha384-MrcW6ZMFYlzcLA8Nl+NtUVF0sA7MsXsP1UyJoMp4YLEuNSfAP+JcXn/tWtIaxVXM" crossorigin="anonymous"></script>
-    </body>
-    </html>'''
-        template = Template(template_str)
-        rendered_html = template.render(
-            title=title,
-            session_path = session_path,
-            session_id = session_id,
-            file1=file1,
-            file2=file2
-        )
-        with open(f"{session_path}/comparison_result.html", "w") as file:
-            file.write(rendered_html)
-
 @router.post("/remove_docx_session")
 async def remove_docx_session(sessionid: RemoveDocxSession):
     docx_session_id = sessionid.session_id
     
     """check if session workspace is available"""
-    SESSION_WORKSPACE = os.path.join(DOCX_WORKSPACE, docx_session_id)
-    if not Path(SESSION_WORKSPACE):
+    if not docx_session_reaper.is_session(docx_session_id):
         raise HTTPException(status_code=404, detail=f"Session id {docx_session_id} not available")
     else:
         data = {"message": f"Session id {docx_session_id} removed successfully."}
         try:
-            shutil.rmtree(SESSION_WORKSPACE)
+            """a cached session is shared with every client that got it from the cache: only this client's use of it
+            ends, and the cache expires the session itself"""
+            if not await session_pool.run(docx_result_cache.holds, docx_session_id):
+                await docx_session_reaper.remove(docx_session_id)
             return JSONResponse(content=data, status_code=200)
         except Exception as error:
             raise HTTPException(status_code=500, detail=f"Session id {docx_session_id} not available")
 
-@router.post("/generate_url_for_docx")
-async def generate_url(file_paths: DocxFilePath):
-    comparator = DocxComparator(file_paths)
+def compare_docx_documents(file_paths: DocxFilePath, session_workspace: str, timer: StageTimer = None):
+    """run the Spire comparison for a session; runs in the process pool"""
+    timer = timer or StageTimer()
 
-    """validate document"""
-    comparator.validate_documents()
+    """updated document path"""
+    new_doc1_path = resolve_document(session_document(session_workspace, 1, file_paths.docx_file_1_path))
+    new_doc2_path = resolve_document(session_document(session_workspace, 2, file_paths.docx_file_2_path))
 
-    """create session workspace"""
-    session_id = Workspace.create_session_workspace()
+    """load both documents; the original view is exported separately, on first request, from the pinned content"""
+    with timer.stage("parse"):
+        write_json(os.path.join(session_workspace, ORIGINAL_PIN),
+                   {"document": new_doc1_path, "digest": file_digest(new_doc1_path),
+                    "file_1": file_paths.docx_file_1_path, "file_2": file_paths.docx_file_2_path})
+        firstDoc = load_document(new_doc1_path)
+        secondDoc = load_document(new_doc2_path)
+
+    """compare documents"""
+    with timer.stage("diff"):
+        firstDoc.Compare(secondDoc, COMPARE_AUTHOR)
+
+    """save comparision result in HTML format"""
+    with timer.stage("render"):
+        result_file = os.path.join(session_workspace, RESULT_HTML)
+        firstDoc.SaveToFile(result_file, FileFormat.Html)
+        precompress_export(result_file)
+    return timer.timings
+
+def compare_docx_native(file_paths: DocxFilePath, session_workspace: str, timer: StageTimer = None):
+    """paragraph and table diff with python-docx, written as a change list and a side-by-side page; runs in the process pool"""
+    timer = timer or StageTimer()
+    new_doc1_path = resolve_document(session_document(session_workspace, 1, file_paths.docx_file_1_path))
+    new_doc2_path = resolve_document(session_document(session_workspace, 2, file_paths.docx_file_2_path))
+
+    with timer.stage("parse"):
+        try:
+            blocks_1 = read_blocks(new_doc1_path)
+            blocks_2 = read_blocks(new_doc2_path)
+        except Exception:
+            raise HTTPException(status_code=500, detail=f"Invalid docx document format")
+    result = compare_blocks(blocks_1, blocks_2, timer)
+
+    with timer.stage("render"):
+        with open(os.path.join(session_workspace, CHANGES_FILE), "w") as file:
+            json.dump({"file_1": file_paths.docx_file_1_path, "file_2": file_paths.docx_file_2_path, **result}, file)
+        precompress(os.path.join(session_workspace, CHANGES_FILE))
+        for entry in result["blocks"]:
+            entry["changed_cell_set"] = {tuple(cell) for cell in entry.get("changed_cells", [])}
+        render_to_file("docx_native_comparison.html", os.path.join(session_workspace, RESULT_HTML),
+                       title=DOCX_PAGE_TITLE, file1=file_paths.docx_file_1_path, file2=file_paths.docx_file_2_path,
+                       summary=result["summary"], blocks=result["blocks"], block_classes=BLOCK_CLASSES)
+    return {"timings": timer.timings, "summary": result["summary"]}
+
+def load_document(path: str):
+    try:
+        return Document(path)
+    except Exception:
+        raise HTTPException(status_code=500, detail=f"Invalid docx document format")
+
+def export_original(document_path: str, original_folder: str):
+    """export an unmodified document to HTML once per content hash; runs in the process pool"""
+    if os.path.isfile(os.path.join(original_folder, ORIGINAL_HTML)):
+        return
+    staging_folder = f"{original_folder}.{uuid.uuid4().hex}"
+    os.makedirs(staging_folder)
+    try:
+        load_document(document_path).SaveToFile(os.path.join(staging_folder, ORIGINAL_HTML), FileFormat.Html)
+        precompress_export(os.path.join(staging_folder, ORIGINAL_HTML))
+        """publish the folder in one rename; when another worker won the race its export is kept"""
+        try:
+            os.rename(staging_folder, original_folder)
+        except OSError:
+            pass
+    finally:
+        shutil.rmtree(staging_folder, ignore_errors=True)
+
+def prepare_original(session_id: str) -> tuple:
+    """source, shared export folder and static URL for the first document of a session; runs on the I/O pool"""
+    pin = read_json(os.path.join(DOCX_WORKSPACE, session_id, ORIGINAL_PIN))
+    if pin is None:
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} has no original document")
+    document_path, digest = pin["document"], pin["digest"]
+    original_folder = os.path.join(DOCX_WORKSPACE, ORIGINALS_FOLDER, digest)
+    if os.path.isdir(original_folder):
+        """the folder mtime is what the session reaper ages shared exports by"""
+        os.utime(original_folder)
+    elif not os.path.isfile(document_path) or file_digest(document_path) != digest:
+        """never export content other than the one that was compared"""
+        raise HTTPException(status_code=410, detail=f"The first document of session {session_id} changed after it "
+                                                    f"was compared")
+    return document_path, original_folder, f"/static/docx/{ORIGINALS_FOLDER}/{digest}/{ORIGINAL_HTML}"
+
+def generate_result_url(session_id: str, file_paths: DocxFilePath) -> str:
+    """the wrapper page is rendered on request from one template, so only the displayed paths travel in the URL"""
+    query = urlencode({"file1": file_paths.docx_file_1_path, "file2": file_paths.docx_file_2_path})
+    return f"{base_url()}v1/docx_session/{session_id}/comparison_result?{query}"
+
+def find_cached_comparison(file_paths: DocxFilePath):
+    """hash both inputs and look up an earlier session for them; runs on the I/O pool"""
+    if not os.path.isfile(file_paths.docx_file_1_path) or not os.path.isfile(file_paths.docx_file_2_path):
+        return None, None
+    cache_key = ResultCache.make_key("docx", file_digest(file_paths.docx_file_1_path),
+                                     file_digest(file_paths.docx_file_2_path), file_paths.docx_engine, COMPARE_AUTHOR)
+    return cache_key, docx_result_cache.lookup(cache_key)
+
+@instrumented("docx")
+async def run_docx_comparison(file_paths: DocxFilePath, session_id: str, timer: StageTimer, cache_key: str = None):
     session_workspace = os.path.join(DOCX_WORKSPACE, session_id)
+    comparator = DocxComparator(file_paths)
 
-    if not Workspace.copy_documents_to_session_workspace(file_paths.docx_file_1_path,
-                                                         file_paths.docx_file_2_path,
-                                                         session_workspace):
+    """validate document"""
+    with timer.stage("validate"):
+        await io_pool.run(comparator.validate_documents)
+
+    with timer.stage("copy"):
+        copied = await io_pool.run(Workspace.copy_documents_to_session_workspace, file_paths.docx_file_1_path,
+                                   file_paths.docx_file_2_path, session_workspace, session=session_workspace)
+    if not copied:
         raise HTTPException(status_code=500, detail="Error while copying the documents to session workspace")
 
-    """updated document path"""
-    new_doc1_path = os.path.join(session_workspace, os.path.basename(file_paths.docx_file_1_path))
-    new_doc2_path = os.path.join(session_workspace, os.path.basename(file_paths.docx_file_2_path))
+    """load, compare and export the documents in a worker process"""
+    result = {"session_id": session_id, "comparison_result_url": generate_result_url(session_id, file_paths)}
+    if file_paths.docx_engine == "native":
+        compare_result = await cpu_pool.run(compare_docx_native, file_paths, session_workspace, timer,
+                                            session=session_workspace)
+        timer.timings.update(compare_result["timings"])
+        result.update({"changes_url": f"{base_url()}v1/docx_session/{session_id}/changes",
+                       "summary": compare_result["summary"]})
+    else:
+        timer.timings.update(await cpu_pool.run(compare_docx_documents, file_paths, session_workspace, timer,
+                                                   session=session_workspace))
 
-    """load the first document while initializing the Document object"""
-    firstDoc = Document(new_doc1_path)
+    if cache_key is not None:
+        await io_pool.run(docx_result_cache.store, cache_key, session_id, result)
+    
+    return {**result, "timings_ms": timer.timings}
 
-    """convert the first document to HTML format"""
-    original_html_file = rf"{session_workspace}\original.html"
-    firstDoc.SaveToFile(original_html_file, FileFormat.Html)
+@router.post("/generate_url_for_docx")
+async def generate_url(file_paths: DocxFilePath, job: bool = False):
+    """reuse an earlier session when the same inputs were already compared"""
+    cache_key = None
+    if config.RESULT_CACHE_ENABLED:
+        cache_key, cached_result = await io_pool.run(find_cached_comparison, file_paths)
+        if cached_result is not None:
+            cached_result = rebase_urls(cached_result)
+            cached_result["cached"] = True
+            cached_result["comparison_result_url"] = generate_result_url(cached_result["session_id"], file_paths)
+            if job:
+                """answered as a finished job, with a status URL that resolves"""
+                session_id = cached_result["session_id"]
+                await session_pool.run(record_done, os.path.join(DOCX_WORKSPACE, session_id), cached_result)
+                cached_result.update(status="done", status_url=f"{base_url()}v1/docx_session/{session_id}/status")
+            return cached_result
 
-    """load the second document while initializing the Document object"""
-    secondDoc = Document(new_doc2_path )
+    if job:
+        cpu_pool.ensure_capacity()
 
-    """compare documents"""
-    firstDoc.Compare(secondDoc, "E-ICEBLUE")
+    """create session workspace"""
+    session_id = await io_pool.run(Workspace.create_session_workspace)
+    if not job:
+        try:
+            return await run_docx_comparison(file_paths, session_id, StageTimer(), cache_key)
+        except Exception:
+            await remove_folder(os.path.join(DOCX_WORKSPACE, session_id))
+            raise
 
-    """save comparision result in HTML format"""
-    result_file = rf"{session_workspace}\result.html"
-    firstDoc.SaveToFile(result_file, FileFormat.Html)
+    """job mode: hand back the session id straight away and let the client poll the status"""
+    progress = JobProgress(os.path.join(DOCX_WORKSPACE, session_id))
+    progress.queued()
+    start_job(progress, run_docx_comparison(file_paths, session_id, progress, cache_key))
+    return {"session_id": session_id, "status": "queued",
+            "status_url": f"{base_url()}v1/docx_session/{session_id}/status"}
 
-    """generate html"""
-    generate_html = HtmlGenerator()
-    generate_html.generate_html_file(session_workspace, session_id, "Contentverse Docx Document Comparision", file_paths.docx_file_1_path, 
-                                     file_paths.docx_file_2_path)
-    
-    """generate URL"""
-    comparison_result_url = f"{BASE_URL}static/docx/{session_id}/comparison_result.html"
-    
-    return {"session_id": session_id, "comparison_result_url": comparison_result_url}
+@router.get("/docx_cache/stats")
+async def docx_cache_stats():
+    return docx_result_cache.stats()
+
+@router.get("/docx_sessions/stats")
+async def docx_sessions_stats():
+    return docx_session_reaper.stats()
+
+@router.get("/docx_session/{session_id}/status")
+async def docx_session_status(session_id: str):
+    job_status = read_job_status(os.path.join(DOCX_WORKSPACE, session_id))
+    if job_status is None:
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} not available")
+    await session_pool.run(docx_session_reaper.touch, session_id)
+    return {"session_id": session_id, **rebase_urls(job_status)}
+
+@router.get("/docx_session/{session_id}/comparison_result", response_class=HTMLResponse)
+async def docx_comparison_result(session_id: str, file1: str = "", file2: str = ""):
+    if not docx_session_reaper.is_session(session_id):
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} not available")
+    await session_pool.run(docx_session_reaper.touch, session_id)
+    session_workspace = os.path.join(DOCX_WORKSPACE, session_id)
+    if os.path.isfile(os.path.join(session_workspace, CHANGES_FILE)):
+        """the native engine rendered the whole side-by-side page already; the static mount serves it precompressed"""
+        return RedirectResponse(f"/static/docx/{session_id}/{RESULT_HTML}")
+    if not file1 and not file2:
+        pin = await session_pool.run(read_json, os.path.join(session_workspace, ORIGINAL_PIN)) or {}
+        file1, file2 = pin.get("file_1", ""), pin.get("file_2", "")
+    original_url = f"/v1/docx_session/{session_id}/original?{urlencode({'file1': file1})}"
+    return render("docx_comparison.html", title=DOCX_PAGE_TITLE, session_id=session_id, file1=file1, file2=file2,
+                  original_url=original_url, result_html=RESULT_HTML)
+
+@legacy_router.get("/static/docx/{session_id}/comparison_result.html")
+async def legacy_docx_comparison_result(session_id: str):
+    return RedirectResponse(f"/v1/docx_session/{session_id}/comparison_result", status_code=301)
 
+@router.get("/docx_session/{session_id}/changes")
+async def docx_session_changes(session_id: str):
+    changes_file = os.path.join(DOCX_WORKSPACE, session_id, CHANGES_FILE)
+    if not docx_session_reaper.is_session(session_id) or not os.path.isfile(changes_file):
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} has no change list")
+    await session_pool.run(docx_session_reaper.touch, session_id)
+    return FileResponse(changes_file, media_type="application/json")
 
+@router.get("/docx_session/{session_id}/original")
+async def docx_session_original(session_id: str, file1: str = ""):
+    """export the first document on first view and hand out the copy shared by all sessions with the same input;
+    file1 is only displayed by the wrapper page, the document itself is the one pinned at compare time"""
+    if not docx_session_reaper.is_session(session_id):
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} not available")
+    await session_pool.run(docx_session_reaper.touch, session_id)
+    document_path, original_folder, original_url = await session_pool.run(prepare_original, session_id)
+    if not os.path.isfile(os.path.join(original_folder, ORIGINAL_HTML)):
+        await cpu_pool.run(export_original, document_path, original_folder)
+    return RedirectResponse(original_url)
@@ -1,25 +1,68 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
-from openpyxl import load_workbook
-from pathlib import Path
+from typing import List, Literal, Optional
+from fastapi.responses import JSONResponse, StreamingResponse
 import pandas as pd
 import os
 import uuid
-import shutil
-from jinja2 import Template
+import asyncio
+import json
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+from app.v1.timing import StageTimer
+from app.v1.excel_diff import ExcelDiff, compute_diff
+from app.v1.excel_row_store import read_row_meta, read_row_window, export_row_store
+from app.v1.excel_frames import write_frames, open_frames, export_csv, read_frame_window
+from app.v1.rendering import render_to_file
+from app.v1.static_files import precompress
+from app.v1.xlsx_readers import open_reader, reader_available
+from app.v1.worker_pool import io_pool, cpu_pool, session_pool, remove_folder
+from app.v1.jobs import JobProgress, start_job, read_job_status, record_done
+from app.v1.metrics import instrumented
+from app.v1.public_urls import base_url, rebase_urls
+from app.v1.result_cache import ResultCache, file_digest
+from app.v1.session_reaper import SessionReaper
+from app.v1.workspace import place_document
+from app.v1 import config
 
 router = APIRouter()
-EXCEL_WORKSPACE = os.path.abspath("app\\v1\static\excel\\")
-BASE_URL = "http://192.168.1.44:8000/"
-
-
-class ExcelFilePath(BaseModel):
+EXCEL_WORKSPACE = os.path.join(config.WORKSPACE_ROOT, "excel")
+"""workbook sessions keep one folder per compared sheet pair and the parsed sheets until the diff is done"""
+SHEETS_FOLDER = "sheets"
+PARSED_FOLDER = ".parsed"
+excel_result_cache = ResultCache(EXCEL_WORKSPACE, config.RESULT_CACHE_MAX_BYTES, config.RESULT_CACHE_MAX_AGE)
+excel_session_reaper = SessionReaper(EXCEL_WORKSPACE, config.SESSION_TTL, config.SESSION_MAX_BYTES,
+                                    config.SESSION_REAP_INTERVAL)
+
+
+class ExcelOptions(BaseModel):
+    """rows are matched by position unless key columns or row hashing are asked for"""
+    alignment: Optional[Literal["position", "key", "hash"]] = None
+    key_columns: List[str] = []
+    """xlsx reader backend; the EXCEL_READER setting when not given"""
+    reader: Optional[Literal["openpyxl", "sax", "calamine"]] = None
+
+    @property
+    def row_alignment(self) -> str:
+        return self.alignment or ("key" if self.key_columns else "position")
+
+    @property
+    def xlsx_reader(self) -> str:
+        return self.reader or config.EXCEL_READER
+
+class ExcelFilePath(ExcelOptions):
     excel_file_1_path: str
     excel_file_1_sheet_number: int = 1
     excel_file_2_path: str
     excel_file_2_sheet_number: int = 1
 
+class ExcelWorkbookPath(ExcelOptions):
+    excel_file_1_path: str
+    excel_file_2_path: str
+    """pair sheets by name, or by position in the workbook"""
+    match_sheets: Literal["name", "index"] = "name"
+
 class RemoveExcelSession(BaseModel):
     session_id: str
 
@@ -29,60 +72,81 @@ class ExcelComparator:
         self.document_1_sheet_number = file_paths.excel_file_1_sheet_number
         self.document_2 = file_paths.excel_file_2_path
         self.document_2_sheet_number = file_paths.excel_file_2_sheet_number
-
-    def validate_documents(self):
-        if not os.path.isfile(self.document_1):
-            raise HTTPException(status_code=404, detail=f"{self.document_1} not found.")
-        if not os.path.isfile(self.document_2):
-            raise HTTPException(status_code=404, detail=f"{self.document_2} not found.")
-
-        if not self.validate_xlsx_format():
-            raise HTTPException(status_code=400, detail="Invalid document format")
-
-        if not self.validate_excel_sheet_number():
-            raise HTTPException(status_code=400, detail="Invalid document sheet number")
-
-        if self.is_excel_sheet_blank():
-            raise HTTPException(status_code=400, detail="Document is blank")
+        self.reader = file_paths.xlsx_reader
+        self.dataframe_1 = None
+        self.dataframe_2 = None
+
+    def validate_documents(self, timer: StageTimer = None):
+        """open each workbook once in read-only mode and load the requested sheets from that handle"""
+        timer = timer or StageTimer()
+        workbook_1 = workbook_2 = None
+        try:
+            with timer.stage("validate"):
+                if not os.path.isfile(self.document_1):
+                    raise HTTPException(status_code=404, detail=f"{self.document_1} not found.")
+                if not os.path.isfile(self.document_2):
+                    raise HTTPException(status_code=404, detail=f"{self.document_2} not found.")
+
+                if not self.validate_xlsx_format():
+                    raise HTTPException(status_code=400, detail="Invalid document format")
+
+                workbook_1 = self.open_workbook(self.document_1, self.reader)
+                workbook_2 = self.open_workbook(self.document_2, self.reader)
+                if workbook_1 is None or workbook_2 is None:
+                    raise HTTPException(status_code=400, detail="Invalid document format")
+
+                if not self.validate_excel_sheet_number(workbook_1, workbook_2):
+                    raise HTTPException(status_code=400, detail="Invalid document sheet number")
+
+            with timer.stage("parse"):
+                rows_1, has_content_1 = self.read_sheet_rows(workbook_1, self.document_1_sheet_number)
+                rows_2, has_content_2 = self.read_sheet_rows(workbook_2, self.document_2_sheet_number)
+                self.dataframe_1 = rows_to_dataframe(rows_1)
+                self.dataframe_2 = rows_to_dataframe(rows_2)
+
+            if not has_content_1 and not has_content_2:
+                raise HTTPException(status_code=400, detail="Document is blank")
+        finally:
+            if workbook_1 is not None:
+                workbook_1.close()
+            if workbook_2 is not None:
+                workbook_2.close()
 
     def validate_xlsx_format(self) -> bool:
-        if not self.document_1.endswith(".xlsx") or not self.document_2.endswith(".xlsx"):
-            return False
+        return self.document_1.endswith(".xlsx") and self.document_2.endswith(".xlsx")
+
+    @staticmethod
+    def open_workbook(document, reader: str):
+        if not reader_available(reader):
+            raise HTTPException(status_code=400, detail=f"Excel reader {reader} is not available")
         try:
-            load_workbook(self.document_1)
-            load_workbook(self.document_2)
-            return True
+            return open_reader(document, reader)
         except Exception as error:
-            return False
-
-    def validate_excel_sheet_number(self) -> bool:
-        workbook_1 = load_workbook(self.document_1)
-        workbook_2 = load_workbook(self.document_2)
+            return None
 
+    def validate_excel_sheet_number(self, workbook_1, workbook_2) -> bool:
         if self.document_1_sheet_number < 1 or self.document_1_sheet_number > len(workbook_1.sheetnames):
             return False
         if self.document_2_sheet_number < 1 or self.document_2_sheet_number > len(workbook_2.sheetnames):
             return False
         return True
 
-    def is_excel_sheet_blank(self) -> bool:
-        workbook_1 = load_workbook(self.document_1)
-        workbook_2 = load_workbook(self.document_2)
-
-        doc_1_sheet = workbook_1.worksheets[self.document_1_sheet_number - 1]
-        doc_2_sheet = workbook_2.worksheets[self.document_2_sheet_number - 1]
-
-        for row in doc_1_sheet.iter_rows():
-            for cell in row:
-                if cell.value:
-                    return False
-
-        for row in doc_2_sheet.iter_rows():
-            for cell in row:
-                if cell.value:
-                    return False
-
-        return True
+    @staticmethod
+    def read_sheet_rows(workbook, sheet_number):
+        """stream the sheet rows, checking for content only until the first non-empty cell"""
+        rows = []
+        has_content = False
+        last_row_with_data = -1
+        for row in workbook.iter_rows(sheet_number):
+            if not has_content:
+                has_content = any(row)
+            converted_row = [convert_cell(value) for value in row]
+            while converted_row and converted_row[-1] == "":
+                converted_row.pop()
+            if converted_row:
+                last_row_with_data = len(rows)
+            rows.append(converted_row)
+        return rows[:last_row_with_data + 1], has_content
 
 
 class Workspace:
@@ -91,259 +155,488 @@ class Workspace:
         session_id = str(uuid.uuid4())
         session_folder = os.path.join(EXCEL_WORKSPACE, session_id)
         os.makedirs(session_folder)
+        excel_session_reaper.register(session_id)
         return session_id
 
     @staticmethod
     def copy_documents_to_session_workspace(file1_path: str, file2_path: str, session_workspace_path: str):
         try:
-            shutil.copy(file1_path, session_workspace_path)
-            shutil.copy(file2_path, session_workspace_path)
+            place_document(file1_path, session_workspace_path, 1)
+            place_document(file2_path, session_workspace_path, 2)
             return True
         except Exception as error:
             return False
 
 
 class HtmlGenerator:
+    """row classes indexed by excel_diff row state: equal, modified, inserted, deleted, moved"""
+    ROW_CLASSES = ["", "table-warning", "table-success", "table-secondary", "table-info"]
+
     @staticmethod
     def generate_html_file(session_path, title, file1, file1_sheet_number,
-                           data1, file2, file2_sheet_number,
-                           data2, highlighted_rows):
-        template_str = '''<!DOCTYPE html>
-        <html>
-            <head>
-                <title>{{ title }}</title>
-                <!-- Bootstrap CSS -->
-                <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/css/bootstrap.min.css" rel="stylesheet" integrity="sha384-EVSTQN3/azprG1Anm3QDgpJLIm9Nao0Yz1ztcQTwFspd3yD65VohhpuuCOmLASjC" crossorigin="anonymous">
-                <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.7.1/jquery.min.js"></script>
-                <style>
-                .table-responsive {
-                    overflow-x: unset;
-                }
-                .table-responsive table {
-                    width: 100%;
-                }
-                .table-container {
-                    display: flex;
-                }
-                .table-container .table-responsive {
-                    flex: 0 0 auto;
-                    margin-right: 10px;
-                }
-                .square-badge {
-                    border-radius: 0;
-                }
-                .divScrollDiv {
-                    display: inline-block;
-                    width: 100%;
-                    border: 1px solid black;
-                    height: 94vh;
-                    overflow: scroll;
-                }
-                .tableNoScroll {
-                    overflow: hidden;
-                }
-            </style>
-            <script>
-                $(document).ready(function () {
-                    var target_sec = $("#divFixed");
-                    $("#divLista").scroll(function () {
-                        target_sec.prop("scrollTop", this.scrollTop)
-                        .prop("scrollLeft", this.scrollLeft);
-                    });
-                    var target_first = $("#divLista");
-                    $("#divFixed").scroll(function () {
-                        target_first.prop("scrollTop", this.scrollTop)
-                        .prop("scrollLeft", this.scrollLeft);
-                    });
-                });
-            </script>
-        </head>
-        <body>
-        <div class="col-lg mx-auto p-1 py-md-1">
-            <header class="d-flex align-items-center pb-1">
-                <a href="#" class="d-flex align-items-center text-dark text-decoration-none">
-                    <img src="/static/images/logo.jpeg" width="32" height="32" class="p-1">
-                    <span class="fs-6">Document Comparison and Analysis (Demo)</span>
-                </a>
-            </header>
-            <div class="container-fluid">
-                <div class="row">
-                    <div class="col divScrollDiv border" id="divFixed">
-                        <div class="table-container">
-                            <!-- First Table -->
-                            <div class="table table-responsive mt-2">
-                                <span class="badge bg-primary square-badge">Excel Document Path</span><span class="badge bg-success square-badge">{{ file1 }}</span><br>
-                                <span class="badge bg-primary square-badge">Excel Sheet Number</span><span class="badge bg-success square-badge">{{ file1_sheet_number }}</span>
-                                <table class="table-sm table-bordered mt-2">
-                                    <thead class="table-dark">
-                                        <tr>
-                                            {% for i in data1[0].keys() %}
-                                                <th>{{ i }}</th>
-                                            {% endfor %}
-                                        </tr>
-                                    </thead>
-                                    <tbody>
-                                        {% for row in data1 %}
-                                            <tr {% if loop.index0 in highlighted_rows %}class="table-warning"{% endif %}>
-                                                {% for value in row.values() %}
-                                                    <td>{{ value }}</td>
-                                                {% endfor %}
-                                            </tr>
-                                        {% endfor %}
-                                    </tbody>
-                                </table>
-                            </div>
-                        </div>
-                    </div>
-                    <div class="col divScrollDiv border" id="divLista">
-                        <div class="table-container">
-                            <div class="table table-responsive mt-2">
-                                <!-- Second Table -->
-                                <span class="badge bg-primary square-badge">Excel Document Path</span><span class="badge bg-success square-badge">{{ file2 }}</span><br>
-                                <span class="badge bg-primary square-badge">Excel Sheet Number</span><span class="badge bg-success square-badge">{{ file2_sheet_number }}</span>
-                                <table class="table-sm table-bordered mt-2">
-                                    <thead class="table-dark">
-                                        <tr>
-                                            {% for i in data2[0].keys() %}
-                                                <th>{{ i }}</th>
-                                            {% endfor %}
-                                        </tr>
-                                    </thead>
-                                    <tbody>
-                                        {% for row in data2 %}
-                                            <tr {% if loop.index0 in highlighted_rows %}class="table-warning"{% endif %}>
-                                                {% for value in row.values() %}
-                                                    <td>{{ value }}</td>
-                                                {% endfor %}
-                                            </tr>
-                                        {% endfor %}
-                                    </tbody>
-                                </table>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        <!-- Bootstrap JS (optional) -->
-        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/js/bootstrap.bundle.min.js" integrity="sha384-MrcW6ZMFYlzcLA8Nl+NtUVF0sA7MsXsP1UyJoMp4YLEuNSfAP+JcXn/tWtIaxVXM" crossorigin="anonymous"></script>
-    </body>
-    </html>'''
-        template = Template(template_str)
-        rendered_html = template.render(
+                           file2, file2_sheet_number, diff: ExcelDiff):
+        render_to_file(
+            "excel_comparison.html",
+            f"{session_path}/comparison_result.html",
+            title=title,
+            file1=file1,
+            file1_sheet_number=file1_sheet_number,
+            file2=file2,
+            file2_sheet_number=file2_sheet_number,
+            header=diff.header,
+            column_states=diff.column_states,
+            row_classes=HtmlGenerator.ROW_CLASSES,
+            rows1=diff.marked_rows(1),
+            rows2=diff.marked_rows(2)
+        )
+
+    @staticmethod
+    def generate_paginated_html_file(session_path, rows_url, title, file1, file1_sheet_number,
+                                     file2, file2_sheet_number, diff: ExcelDiff):
+        """page shell for large sheets; rows are fetched in windows from the rows endpoint"""
+        render_to_file(
+            "excel_comparison_paginated.html",
+            f"{session_path}/comparison_result.html",
             title=title,
+            rows_url=rows_url,
             file1=file1,
             file1_sheet_number=file1_sheet_number,
-            data1=data1,
             file2=file2,
             file2_sheet_number=file2_sheet_number,
-            data2=data2,
-            highlighted_rows=highlighted_rows
+            header=diff.header,
+            column_states=diff.column_states,
+            row_classes=HtmlGenerator.ROW_CLASSES,
+            page_size=config.EXCEL_PAGE_SIZE,
+            total_rows=len(diff.row_states),
+            changed_rows=int(diff.row_changes.sum())
+        )
+
+    @staticmethod
+    def generate_workbook_files(session_path, title, file1, file2, match_sheets, sheets):
+        """index page and summary of a workbook comparison; each sheet links to its own result page"""
+        render_to_file(
+            "excel_workbook.html",
+            f"{session_path}/comparison_result.html",
+            title=title,
+            file1=file1,
+            file2=file2,
+            sheets=sheets
         )
-        with open(f"{session_path}/comparison_result.html", "w") as file:
-            file.write(rendered_html)
+        with open(f"{session_path}/comparison_summary.json", "w") as file:
+            json.dump({"file_1": {"path": file1}, "file_2": {"path": file2}, "match_sheets": match_sheets,
+                       "sheets": sheets}, file, default=str)
+        precompress(f"{session_path}/comparison_summary.json")
+
+    @staticmethod
+    def generate_summary_file(session_path, file1, file1_sheet_number, file2, file2_sheet_number, diff: ExcelDiff):
+        summary = {"file_1": {"path": file1, "sheet_number": file1_sheet_number},
+                   "file_2": {"path": file2, "sheet_number": file2_sheet_number},
+                   **diff.summary(config.SUMMARY_CHANGE_LIMIT)}
+        with open(f"{session_path}/comparison_summary.json", "w") as file:
+            json.dump(summary, file, default=str)
+        precompress(f"{session_path}/comparison_summary.json")
+        return summary
 
 @router.post("/remove_excel_session")
 async def remove_excel_session(sessionid: RemoveExcelSession):
     excel_session_id = sessionid.session_id
     
     """check if session workspace is available"""
-    SESSION_WORKSPACE = os.path.join(EXCEL_WORKSPACE, excel_session_id)
-    if not Path(SESSION_WORKSPACE):
+    if not excel_session_reaper.is_session(excel_session_id):
         raise HTTPException(status_code=404, detail=f"Session id {excel_session_id} not available")
     else:
         data = {"message": f"Session id {excel_session_id} removed successfully."}
         try:
-            shutil.rmtree(SESSION_WORKSPACE)
+            """a cached session is shared with every client that got it from the cache: only this client's use of it
+            ends, and the cache expires the session itself"""
+            if not await session_pool.run(excel_result_cache.holds, excel_session_id):
+                await excel_session_reaper.remove(excel_session_id)
             return JSONResponse(content=data, status_code=200)
         except Exception as error:
             raise HTTPException(status_code=500, detail=f"Session id {excel_session_id} not available")
             
-@router.post("/generate_url_for_excel_doc")
-async def generate_url(file_paths: ExcelFilePath):
-    comparator = ExcelComparator(file_paths)
+def diff_and_render(dataframe_1, dataframe_2, options: ExcelOptions, folder: str, rows_url: str,
+                    file1, file1_sheet_number, file2, file2_sheet_number, timer: StageTimer) -> dict:
+    """diff one sheet pair and write its frames, page and summary into folder"""
+    """mark changed cells and rows with vectorized masks"""
+    with timer.stage("diff"):
+        key_columns = None
+        if options.row_alignment == "key":
+            if not options.key_columns:
+                raise HTTPException(status_code=400, detail="Key alignment needs at least one key column")
+            key_columns = resolve_key_columns(dataframe_1, dataframe_2, options.key_columns)
+        diff = compute_diff(dataframe_1, dataframe_2, "N/A", options.row_alignment, key_columns)
 
-    """validate document"""
-    comparator.validate_documents()
+    """generate html"""
+    with timer.stage("render"):
+        """the aligned columns and masks, which the row windows, exports and later views reopen; big sheets get the
+        paginated page that reads from them"""
+        write_frames(folder, diff)
+        generate_html = HtmlGenerator()
+        if len(diff.row_states) > config.EXCEL_INLINE_ROW_LIMIT:
+            generate_html.generate_paginated_html_file(folder, rows_url, "Contentverse Excel Document Comparision",
+                                                       file1, file1_sheet_number, file2, file2_sheet_number, diff)
+        else:
+            generate_html.generate_html_file(folder, "Contentverse Excel Document Comparision",
+                                             file1, file1_sheet_number, file2, file2_sheet_number, diff)
+        summary = generate_html.generate_summary_file(folder, file1, file1_sheet_number, file2, file2_sheet_number, diff)
 
-    """create session workspace"""
-    session_id = Workspace.create_session_workspace()
+    """counts only; the change list stays in comparison_summary.json"""
+    return {key: value for key, value in summary.items() if key not in ("changes", "file_1", "file_2")}
+
+def compare_excel_documents(file_paths: ExcelFilePath, session_workspace: str, timer: StageTimer = None):
+    """validate, parse, diff and render one sheet pair; runs in the process pool"""
+    timer = timer or StageTimer()
+    comparator = ExcelComparator(file_paths)
+
+    """validate document and load both sheets"""
+    comparator.validate_documents(timer)
+
+    counts = diff_and_render(comparator.dataframe_1, comparator.dataframe_2, file_paths, session_workspace,
+                             f"/v1/excel_session/{os.path.basename(session_workspace)}/rows",
+                             file_paths.excel_file_1_path, file_paths.excel_file_1_sheet_number,
+                             file_paths.excel_file_2_path, file_paths.excel_file_2_sheet_number, timer)
+    return {"timings": timer.timings, "summary": counts}
+
+def parse_workbook(document: str, target_folder: str, reader: str) -> list:
+    """read every sheet in one pass over the workbook and keep each as a pickled dataframe; runs in the process pool"""
+    workbook = ExcelComparator.open_workbook(document, reader)
+    if workbook is None:
+        raise HTTPException(status_code=400, detail="Invalid document format")
+    try:
+        os.makedirs(target_folder, exist_ok=True)
+        sheets = []
+        for index, name in enumerate(workbook.sheetnames, start=1):
+            rows, has_content = ExcelComparator.read_sheet_rows(workbook, index)
+            path = os.path.join(target_folder, f"{index}.pkl")
+            rows_to_dataframe(rows).to_pickle(path)
+            sheets.append({"index": index, "name": name, "has_content": has_content, "path": path})
+        return sheets
+    finally:
+        workbook.close()
+
+def match_workbook_sheets(sheets_1: list, sheets_2: list, match_sheets: str) -> list:
+    """(sheet of workbook 1, sheet of workbook 2) pairs; None marks a sheet only one workbook has"""
+    if match_sheets == "index":
+        return [(sheets_1[i] if i < len(sheets_1) else None, sheets_2[i] if i < len(sheets_2) else None)
+                for i in range(max(len(sheets_1), len(sheets_2)))]
+    by_name = {sheet["name"]: sheet for sheet in sheets_2}
+    names_1 = {sheet["name"] for sheet in sheets_1}
+    return [(sheet, by_name.get(sheet["name"])) for sheet in sheets_1] + \
+        [(None, sheet) for sheet in sheets_2 if sheet["name"] not in names_1]
+
+def compare_sheet_pair(options: ExcelWorkbookPath, sheet_1: dict, sheet_2: dict, folder: str, rows_url: str):
+    """diff and render one matched sheet pair of a workbook comparison; runs in the process pool"""
+    timer = StageTimer()
+    os.makedirs(folder, exist_ok=True)
+    with timer.stage("parse"):
+        dataframe_1 = pd.read_pickle(sheet_1["path"])
+        dataframe_2 = pd.read_pickle(sheet_2["path"])
+    counts = diff_and_render(dataframe_1, dataframe_2, options, folder, rows_url,
+                             options.excel_file_1_path, sheet_1["index"], options.excel_file_2_path, sheet_2["index"],
+                             timer)
+    return {"timings": timer.timings, "summary": counts}
+
+def find_cached_comparison(file_paths: ExcelFilePath):
+    """hash both inputs and look up an earlier session for them; runs on the I/O pool"""
+    if not os.path.isfile(file_paths.excel_file_1_path) or not os.path.isfile(file_paths.excel_file_2_path):
+        return None, None
+    cache_key = ResultCache.make_key("excel",
+                                     file_digest(file_paths.excel_file_1_path), file_paths.excel_file_1_sheet_number,
+                                     file_digest(file_paths.excel_file_2_path), file_paths.excel_file_2_sheet_number,
+                                     file_paths.row_alignment, file_paths.key_columns, file_paths.xlsx_reader)
+    return cache_key, excel_result_cache.lookup(cache_key)
+
+def find_cached_workbook_comparison(file_paths: ExcelWorkbookPath):
+    if not os.path.isfile(file_paths.excel_file_1_path) or not os.path.isfile(file_paths.excel_file_2_path):
+        return None, None
+    cache_key = ResultCache.make_key("excel-workbook",
+                                     file_digest(file_paths.excel_file_1_path), file_digest(file_paths.excel_file_2_path),
+                                     file_paths.match_sheets, file_paths.row_alignment, file_paths.key_columns,
+                                     file_paths.xlsx_reader)
+    return cache_key, excel_result_cache.lookup(cache_key)
+
+async def compare_in_session(compare, document_1: str, document_2: str, file_paths, session_id: str,
+                             timer: StageTimer, cache_key: str = None):
+    """copy the inputs on a thread while a worker process runs compare(file_paths, session_workspace, timer), then
+    cache the result; shared by the single-sheet and delimited file comparisons"""
     session_workspace = os.path.join(EXCEL_WORKSPACE, session_id)
 
-    if not Workspace.copy_documents_to_session_workspace(file_paths.excel_file_1_path,
-                                                         file_paths.excel_file_2_path,
-                                                         session_workspace):
+    async def copy_documents():
+        with timer.stage("copy"):
+            return await io_pool.run(Workspace.copy_documents_to_session_workspace, document_1, document_2,
+                                     session_workspace, session=session_workspace)
+
+    compare_result, copy_result = await asyncio.gather(
+        cpu_pool.run(compare, file_paths, session_workspace, timer, session=session_workspace),
+        copy_documents(),
+        return_exceptions=True)
+
+    """a failed job keeps its workspace so the status stays readable"""
+    discard_session = not isinstance(timer, JobProgress)
+    for outcome in (compare_result, copy_result):
+        if isinstance(outcome, BaseException):
+            if discard_session:
+                await remove_folder(session_workspace)
+            raise outcome
+    if not copy_result:
+        if discard_session:
+            await remove_folder(session_workspace)
         raise HTTPException(status_code=500, detail="Error while copying the documents to session workspace")
+    timer.timings.update(compare_result["timings"])
 
-    new_doc1_path = os.path.join(session_workspace, os.path.basename(file_paths.excel_file_1_path))
-    new_doc2_path = os.path.join(session_workspace, os.path.basename(file_paths.excel_file_2_path))
-
-    df1 = pd.read_excel(new_doc1_path, sheet_name=file_paths.excel_file_1_sheet_number - 1)
-    df2 = pd.read_excel(new_doc2_path, sheet_name=file_paths.excel_file_2_sheet_number - 1)
-
-    """ensure both the dataframes have the same columns"""
-    columns = list(set(df1.columns) | set(df2.columns))
-    df1 = df1.reindex(columns=columns)
-    df2 = df2.reindex(columns=columns)
-
-    """find the length of each dataframe"""
-    len_df1 = len(df1)
-    len_df2 = len(df2)
-
-    """check which DataFrame has more rows """
-    if len_df1 > len_df2:
-        """append missing rows in df2 with None values"""
-        missing_rows = len_df1 - len_df2
-        df2 = pd.concat([df2, pd.DataFrame([[None]*len(columns)]*missing_rows, columns=columns)], ignore_index=True)
-    elif len_df2 > len_df1:
-        """Append missing rows in df1 with None values"""
-        missing_rows = len_df2 - len_df1
-        df1 = pd.concat([df1, pd.DataFrame([[None]*len(columns)]*missing_rows, columns=columns)], ignore_index=True)
-    
-    """heightlight the rows"""
-    diff_df = df1.compare(df2)
-    highlighted_rows = diff_df.index.tolist()
+    """generate URL"""
+    result = {"session_id": session_id,
+              "comparison_result_url": f"{base_url()}static/excel/{session_id}/comparison_result.html",
+              "comparison_summary_url": f"{base_url()}static/excel/{session_id}/comparison_summary.json",
+              "summary": compare_result["summary"]}
+    if cache_key is not None:
+        await io_pool.run(excel_result_cache.store, cache_key, session_id, result)
+
+    return {**result, "timings_ms": timer.timings}
+
+@instrumented("excel")
+async def run_excel_comparison(file_paths: ExcelFilePath, session_id: str, timer: StageTimer, cache_key: str = None):
+    return await compare_in_session(compare_excel_documents, file_paths.excel_file_1_path,
+                                    file_paths.excel_file_2_path, file_paths, session_id, timer, cache_key)
+
+@instrumented("excel_workbook")
+async def run_excel_workbook_comparison(file_paths: ExcelWorkbookPath, session_id: str, timer: StageTimer,
+                                        cache_key: str = None):
+    session_workspace = os.path.join(EXCEL_WORKSPACE, session_id)
+    parsed_folder = os.path.join(session_workspace, PARSED_FOLDER)
+    try:
+        with timer.stage("validate"):
+            for document in (file_paths.excel_file_1_path, file_paths.excel_file_2_path):
+                if not os.path.isfile(document):
+                    raise HTTPException(status_code=404, detail=f"{document} not found.")
+                if not document.endswith(".xlsx"):
+                    raise HTTPException(status_code=400, detail="Invalid document format")
+
+        """each workbook is opened once, in its own worker, while the inputs are copied"""
+        async def parse_documents():
+            with timer.stage("parse"):
+                return await asyncio.gather(
+                    cpu_pool.run(parse_workbook, file_paths.excel_file_1_path, os.path.join(parsed_folder, "1"),
+                                 file_paths.xlsx_reader, session=session_workspace),
+                    cpu_pool.run(parse_workbook, file_paths.excel_file_2_path, os.path.join(parsed_folder, "2"),
+                                 file_paths.xlsx_reader, session=session_workspace))
+
+        async def copy_documents():
+            with timer.stage("copy"):
+                return await io_pool.run(Workspace.copy_documents_to_session_workspace, file_paths.excel_file_1_path,
+                                         file_paths.excel_file_2_path, session_workspace, session=session_workspace)
+
+        parse_result, copy_result = await asyncio.gather(parse_documents(), copy_documents(), return_exceptions=True)
+        for outcome in (parse_result, copy_result):
+            if isinstance(outcome, BaseException):
+                raise outcome
+        if not copy_result:
+            raise HTTPException(status_code=500, detail="Error while copying the documents to session workspace")
+        sheets_1, sheets_2 = parse_result
+
+        """matched sheet pairs are diffed in parallel, at most one per worker process at a time"""
+        worker_slots = asyncio.Semaphore(cpu_pool.max_workers)
+
+        async def compare_pair(number: int, sheet_1: dict, sheet_2: dict) -> dict:
+            entry = {"sheet": number,
+                     "sheet_1": None if sheet_1 is None else {"index": sheet_1["index"], "name": sheet_1["name"]},
+                     "sheet_2": None if sheet_2 is None else {"index": sheet_2["index"], "name": sheet_2["name"]}}
+            if sheet_1 is None or sheet_2 is None:
+                entry["status"] = "added" if sheet_1 is None else "removed"
+                return entry
+            if not sheet_1["has_content"] and not sheet_2["has_content"]:
+                entry["status"] = "blank"
+                return entry
+
+            sheet_path = f"{SHEETS_FOLDER}/{number}"
+            async with worker_slots:
+                try:
+                    result = await cpu_pool.run(compare_sheet_pair, file_paths, sheet_1, sheet_2,
+                                                os.path.join(session_workspace, SHEETS_FOLDER, str(number)),
+                                                f"/v1/excel_session/{session_id}/rows?sheet={number}",
+                                                session=session_workspace)
+                except HTTPException as error:
+                    """a full queue or a timeout is the server's state, not the sheet's: the request fails and can be
+                    retried"""
+                    if error.status_code in (503, 504):
+                        raise
+                    entry.update(status="failed", error=error.detail)
+                    return entry
+                except Exception as error:
+                    entry.update(status="failed", error=str(error) or type(error).__name__)
+                    return entry
+            summary = result["summary"]
+            changed = summary["changed_rows"] or summary["added_columns"] or summary["removed_columns"]
+            entry.update(status="changed" if changed else "equal", summary=summary, timings_ms=result["timings"],
+                         path=f"{sheet_path}/comparison_result.html",
+                         comparison_result_url=f"{base_url()}static/excel/{session_id}/{sheet_path}/comparison_result.html",
+                         comparison_summary_url=f"{base_url()}static/excel/{session_id}/{sheet_path}/comparison_summary.json")
+            return entry
+
+        with timer.stage("diff"):
+            pairs = match_workbook_sheets(sheets_1, sheets_2, file_paths.match_sheets)
+            """every pair is awaited before an error is raised, so no sheet is still being written when the session
+            is cleaned up"""
+            sheets = await asyncio.gather(*(compare_pair(number, sheet_1, sheet_2)
+                                            for number, (sheet_1, sheet_2) in enumerate(pairs, start=1)),
+                                          return_exceptions=True)
+            for outcome in sheets:
+                if isinstance(outcome, BaseException):
+                    raise outcome
+
+        with timer.stage("render"):
+            await io_pool.run(HtmlGenerator.generate_workbook_files, session_workspace,
+                              "Contentverse Excel Workbook Comparision", file_paths.excel_file_1_path,
+                              file_paths.excel_file_2_path, file_paths.match_sheets, sheets, session=session_workspace)
+    except BaseException:
+        """a failed job keeps its workspace so the status stays readable"""
+        if not isinstance(timer, JobProgress):
+            await remove_folder(session_workspace)
+        raise
+    finally:
+        await remove_folder(parsed_folder)
+
+    result = {"session_id": session_id,
+              "comparison_result_url": f"{base_url()}static/excel/{session_id}/comparison_result.html",
+              "comparison_summary_url": f"{base_url()}static/excel/{session_id}/comparison_summary.json",
+              "sheets": [{key: value for key, value in sheet.items() if key not in ("timings_ms", "path")}
+                         for sheet in sheets]}
+    """a result with failed sheets is not cached, so the next identical request compares them again"""
+    if cache_key is not None and not any(sheet["status"] == "failed" for sheet in sheets):
+        await io_pool.run(excel_result_cache.store, cache_key, session_id, result)
+
+    return {**result, "timings_ms": timer.timings}
+
+async def answer_cached_job(cached_result: dict):
+    """a cached session answers a job request as a finished job, with a status URL that resolves"""
+    session_id = cached_result["session_id"]
+    await session_pool.run(record_done, os.path.join(EXCEL_WORKSPACE, session_id), cached_result)
+    cached_result.update(status="done", status_url=f"{base_url()}v1/excel_session/{session_id}/status")
+
+async def serve_comparison(run, find_cached, file_paths, job: bool):
+    """answer from the result cache, or compare in a new session; in job mode hand back the session id straight away
+    and let the client poll the status"""
+    cache_key = None
+    if config.RESULT_CACHE_ENABLED:
+        cache_key, cached_result = await io_pool.run(find_cached, file_paths)
+        if cached_result is not None:
+            cached_result = rebase_urls(cached_result)
+            cached_result["cached"] = True
+            if job:
+                await answer_cached_job(cached_result)
+            return cached_result
+
+    if job:
+        cpu_pool.ensure_capacity()
 
-    """get the indices of all rows that are different or present only in one dataframe"""
-    highlighted_rows = list(set(diff_df.index).union(set(df1.index).symmetric_difference(set(df2.index))))
+    """create session workspace"""
+    session_id = await io_pool.run(Workspace.create_session_workspace)
+    if not job:
+        return await run(file_paths, session_id, StageTimer(), cache_key)
 
-    """convert dataframes to dictionary"""
-    table1 = df1.to_dict(orient='records')
-    table2 = df2.to_dict(orient='records')
+    progress = JobProgress(os.path.join(EXCEL_WORKSPACE, session_id))
+    progress.queued()
+    start_job(progress, run(file_paths, session_id, progress, cache_key))
+    return {"session_id": session_id, "status": "queued",
+            "status_url": f"{base_url()}v1/excel_session/{session_id}/status"}
 
-    """update table1"""
-    new_table_1 = [convert_keys_to_strings(item) for item in table1]
-    new_table_1 = update_data_with_default(new_table_1, "N/A")
+@router.post("/generate_url_for_excel_doc")
+async def generate_url(file_paths: ExcelFilePath, job: bool = False):
+    """reuse an earlier session when the same inputs were already compared"""
+    return await serve_comparison(run_excel_comparison, find_cached_comparison, file_paths, job)
 
-    """update table2"""
-    new_table_2 = [convert_keys_to_strings(item) for item in table2]
-    new_table_2 = update_data_with_default(new_table_2, "N/A")
+@router.post("/generate_url_for_excel_workbook")
+async def generate_workbook_url(file_paths: ExcelWorkbookPath, job: bool = False):
+    """compare every sheet of two workbooks in one session"""
+    return await serve_comparison(run_excel_workbook_comparison, find_cached_workbook_comparison, file_paths, job)
 
-    """generate html"""
-    generate_html = HtmlGenerator()
-    generate_html.generate_html_file(session_workspace, "Contentverse Excel Document Comparision", file_paths.excel_file_1_path, 
-                       file_paths.excel_file_1_sheet_number, new_table_1,
-                        file_paths.excel_file_2_path, file_paths.excel_file_2_sheet_number, new_table_2, 
-                       highlighted_rows)
-    """generate URL"""
-    comparison_result_url = f"{BASE_URL}static/excel/{session_id}/comparison_result.html"
-    
-    return {"session_id": session_id, "comparison_result_url": comparison_result_url}
-
-"""func: convert integer keys to string"""
-def convert_keys_to_strings(dictionary):
-    updated_dict = {}
-    for key, value in dictionary.items():
-        if isinstance(key, int):
-            updated_dict["ID"] = value
-        else:
-            updated_dict[key] = value
-    return updated_dict
-
-"""func: update data with default value"""
-def update_data_with_default(data_list, default_value):
-    updated_data = []
-    for item in data_list:
-        updated_item = {key: value if value is not None else default_value for key, value in item.items()}
-        updated_data.append(updated_item)
-    return updated_data
+@router.get("/excel_cache/stats")
+async def excel_cache_stats():
+    return excel_result_cache.stats()
+
+@router.get("/excel_sessions/stats")
+async def excel_sessions_stats():
+    return excel_session_reaper.stats()
+
+def sheet_folder(session_id: str, sheet: int = None) -> str:
+    session_workspace = os.path.join(EXCEL_WORKSPACE, session_id)
+    if sheet is not None:
+        """a sheet pair of a workbook comparison"""
+        session_workspace = os.path.join(session_workspace, SHEETS_FOLDER, str(sheet))
+    return session_workspace
+
+def read_session_rows(session_workspace: str, start: int, end: int, changed_only: bool):
+    """xlsx sessions keep their rows in frames, csv sessions in the row store"""
+    window = read_frame_window(session_workspace, start, end, changed_only)
+    if window is None and read_row_meta(session_workspace) is not None:
+        window = read_row_window(session_workspace, start, end, changed_only)
+    return window
+
+@router.get("/excel_session/{session_id}/rows")
+async def excel_session_rows(session_id: str, start: int = Query(0, ge=0), end: int = Query(None, ge=0),
+                             changed_only: bool = False, sheet: int = Query(None, ge=1)):
+    """clamp the window so one request cannot pull the whole sheet"""
+    end = start + config.EXCEL_PAGE_SIZE if end is None else end
+    end = min(max(end, start), start + config.EXCEL_MAX_WINDOW)
+    window = await session_pool.run(read_session_rows, sheet_folder(session_id, sheet), start, end, changed_only)
+    if window is None:
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} not available")
+    await session_pool.run(excel_session_reaper.touch, session_id)
+    return window
+
+@router.get("/excel_session/{session_id}/export")
+async def excel_session_export(session_id: str, changed_only: bool = False, sheet: int = Query(None, ge=1)):
+    """the aligned rows of both sheets side by side as CSV, read from the session's frames. Delimited-file sessions
+    keep only their changed rows, so their export holds the changed rows either way"""
+    session_workspace = sheet_folder(session_id, sheet)
+    diff = await session_pool.run(open_frames, session_workspace)
+    if diff is not None:
+        rows = export_csv(diff, changed_only)
+    elif await session_pool.run(read_row_meta, session_workspace) is not None:
+        rows, changed_only = export_row_store(session_workspace), True
+    else:
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} not available")
+    await session_pool.run(excel_session_reaper.touch, session_id)
+    name = "comparison_changes" if changed_only else "comparison"
+    if sheet is not None:
+        name = f"{name}_sheet_{sheet}"
+    return StreamingResponse(rows, media_type="text/csv",
+                             headers={"content-disposition": f'attachment; filename="{name}.csv"'})
+
+@router.get("/excel_session/{session_id}/status")
+async def excel_session_status(session_id: str):
+    job_status = read_job_status(os.path.join(EXCEL_WORKSPACE, session_id))
+    if job_status is None:
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} not available")
+    await session_pool.run(excel_session_reaper.touch, session_id)
+    return {"session_id": session_id, **rebase_urls(job_status)}
+
+"""func: map requested key column names onto the column labels of both sheets"""
+def resolve_key_columns(dataframe_1, dataframe_2, key_columns: List[str]) -> list:
+    labels_1 = {str(column): column for column in dataframe_1.columns}
+    labels_2 = {str(column): column for column in dataframe_2.columns}
+    for name in key_columns:
+        if name not in labels_1 or name not in labels_2 or labels_1[name] != labels_2[name]:
+            raise HTTPException(status_code=400, detail=f"Key column {name} not found in both sheets")
+    return [labels_1[name] for name in key_columns]
+
+"""func: convert an openpyxl cell value the same way pandas' openpyxl reader does"""
+def convert_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+"""func: build a dataframe from sheet rows with the read_excel header and NA handling"""
+def rows_to_dataframe(rows):
+    if not rows:
+        return pd.DataFrame()
+    max_width = max(len(row) for row in rows)
+    if min(len(row) for row in rows) < max_width:
+        rows = [row + [""] * (max_width - len(row)) for row in rows]
+    try:
+        return TextParser(rows, header=0, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
@@ -0,0 +1,194 @@
+from fastapi import APIRouter, HTTPException, Request
+import hashlib
+import uuid
+import os
+
+from app.v1.timing import StageTimer
+from app.v1.worker_pool import io_pool, cpu_pool, session_pool, upload_pool
+from app.v1.jobs import JobProgress, start_job, record_done
+from app.v1.result_cache import remember_digest
+from app.v1.public_urls import base_url, rebase_urls
+from app.v1.csv_diff import DELIMITERS
+from app.v1.endpoints import excel_endpoint, doc_endpoint, csv_endpoint
+from app.v1.endpoints.batch_endpoint import ComparisonPair
+from app.v1 import config
+
+"""documents are streamed into a fresh session and compared where they landed, so nothing is copied twice"""
+router = APIRouter()
+PARTIAL_SUFFIX = ".part"
+"""written when a session's comparison starts; from then on its documents are fixed"""
+COMPARED_MARKER = ".compared"
+
+
+class UploadKind:
+    def __init__(self, workspace: str, create_session, reaper, path_fields: tuple, find_cached, run, status_path: str,
+                 extensions: tuple):
+        self.workspace = workspace
+        self.create_session = create_session
+        self.reaper = reaper
+        self.path_fields = path_fields
+        self.find_cached = find_cached
+        self.run = run
+        self.status_path = status_path
+        """documents of this kind only; every file a comparison generates has another extension, so an upload can
+        neither overwrite a result nor be served as a page from the session"""
+        self.extensions = extensions
+
+
+UPLOAD_KINDS = {
+    "excel": UploadKind(excel_endpoint.EXCEL_WORKSPACE, excel_endpoint.Workspace.create_session_workspace,
+                        excel_endpoint.excel_session_reaper, ("excel_file_1_path", "excel_file_2_path"),
+                        excel_endpoint.find_cached_comparison, excel_endpoint.run_excel_comparison, "excel_session",
+                        (".xlsx",)),
+    "excel_workbook": UploadKind(excel_endpoint.EXCEL_WORKSPACE, excel_endpoint.Workspace.create_session_workspace,
+                                 excel_endpoint.excel_session_reaper, ("excel_file_1_path", "excel_file_2_path"),
+                                 excel_endpoint.find_cached_workbook_comparison,
+                                 excel_endpoint.run_excel_workbook_comparison, "excel_session", (".xlsx",)),
+    "csv": UploadKind(excel_endpoint.EXCEL_WORKSPACE, excel_endpoint.Workspace.create_session_workspace,
+                      excel_endpoint.excel_session_reaper, ("csv_file_1_path", "csv_file_2_path"),
+                      csv_endpoint.find_cached_comparison, csv_endpoint.run_csv_comparison, "excel_session",
+                      tuple(DELIMITERS)),
+    "docx": UploadKind(doc_endpoint.DOCX_WORKSPACE, doc_endpoint.Workspace.create_session_workspace,
+                       doc_endpoint.docx_session_reaper, ("docx_file_1_path", "docx_file_2_path"),
+                       doc_endpoint.find_cached_comparison, doc_endpoint.run_docx_comparison, "docx_session",
+                       (".docx",)),
+}
+
+
+def upload_kind(kind: str) -> UploadKind:
+    if kind not in UPLOAD_KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown comparison kind {kind}")
+    return UPLOAD_KINDS[kind]
+
+
+def session_folder(kind: UploadKind, session_id: str) -> str:
+    if not kind.reaper.is_session(session_id):
+        raise HTTPException(status_code=404, detail=f"Session id {session_id} not available")
+    return os.path.join(kind.workspace, session_id)
+
+
+def is_compared(folder: str) -> bool:
+    return os.path.exists(os.path.join(folder, COMPARED_MARKER))
+
+
+def mark_compared(folder: str):
+    """claim the session for its one comparison; the marker is created exclusively, so a second claim fails"""
+    try:
+        open(os.path.join(folder, COMPARED_MARKER), "x").close()
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"Session {os.path.basename(folder)} was compared already")
+
+
+def write_chunk(file, digest, data: bytes):
+    """hash and write on a pool thread; both release the GIL for large buffers"""
+    digest.update(data)
+    file.write(data)
+
+
+def finish_upload(file, partial_path: str, path: str, digest) -> int:
+    """an upload that ends after the comparison started is discarded, never swapped in under it"""
+    file.close()
+    if is_compared(os.path.dirname(path)):
+        raise HTTPException(status_code=409, detail="Documents cannot change once the session was compared")
+    os.replace(partial_path, path)
+    remember_digest(path, digest.hexdigest())
+    return os.path.getsize(path)
+
+
+def discard_upload(file, partial_path: str):
+    file.close()
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+
+async def receive_document(request: Request, path: str) -> dict:
+    """stream the request body into the session in buffered chunks, hashing it on the way; the writes go to a pool of
+    their own, so a full comparison queue never cuts an upload short"""
+    partial_path = f"{path}.{uuid.uuid4().hex}{PARTIAL_SUFFIX}"
+    digest = hashlib.sha256()
+    file = await upload_pool.run(open, partial_path, "wb")
+    received, buffer, buffered = 0, [], 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > config.UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"Documents are limited to {config.UPLOAD_MAX_BYTES} bytes")
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= config.UPLOAD_CHUNK_BYTES:
+                await upload_pool.run(write_chunk, file, digest, b"".join(buffer))
+                buffer, buffered = [], 0
+        if buffer:
+            await upload_pool.run(write_chunk, file, digest, b"".join(buffer))
+        size = await upload_pool.run(finish_upload, file, partial_path, path, digest)
+    except BaseException:
+        await upload_pool.run(discard_upload, file, partial_path)
+        raise
+    return {"name": os.path.basename(path), "size": size, "sha256": digest.hexdigest()}
+
+
+@router.post("/uploads/{kind}")
+async def create_upload_session(kind: str):
+    """an empty session to upload the two documents of a comparison into"""
+    upload = upload_kind(kind)
+    session_id = await io_pool.run(upload.create_session)
+    return {"session_id": session_id, "upload_url": f"{base_url()}v1/uploads/{kind}/{session_id}/documents/",
+            "compare_url": f"{base_url()}v1/uploads/{kind}/{session_id}/compare"}
+
+
+@router.put("/uploads/{kind}/{session_id}/documents/{name}")
+async def upload_document(kind: str, session_id: str, name: str, request: Request):
+    """the raw request body is the document; a multipart form would be spooled to a temporary file first"""
+    upload = upload_kind(kind)
+    folder = session_folder(upload, session_id)
+    if os.path.basename(name) != name or name.startswith("."):
+        raise HTTPException(status_code=400, detail=f"Invalid document name {name}")
+    if not name.endswith(upload.extensions):
+        raise HTTPException(status_code=400, detail=f"{kind} documents must end in {', '.join(upload.extensions)}")
+    if await session_pool.run(is_compared, folder):
+        raise HTTPException(status_code=409, detail="Documents cannot change once the session was compared")
+    return await receive_document(request, os.path.join(folder, name))
+
+
+@router.post("/uploads/{kind}/{session_id}/compare")
+async def compare_uploaded_documents(kind: str, session_id: str, pair: ComparisonPair, job: bool = False):
+    """compare two uploaded documents, named in the usual request body by their upload names. A session is compared
+    once; uploads into it are refused from then on"""
+    upload = upload_kind(kind)
+    if pair.kind != kind:
+        raise HTTPException(status_code=400, detail=f"Session is for {kind} comparisons, not {pair.kind}")
+    folder = session_folder(upload, session_id)
+    file_paths = pair.model_copy(update={field: os.path.join(folder, os.path.basename(getattr(pair, field)))
+                                         for field in upload.path_fields})
+    await session_pool.run(mark_compared, folder)
+
+    """an earlier session with the same content answers straight away; the upload session is removed and named in
+    upload_session_id, since the answer carries the earlier session's id"""
+    cache_key = None
+    if config.RESULT_CACHE_ENABLED:
+        cache_key, cached_result = await io_pool.run(upload.find_cached, file_paths)
+        if cached_result is not None:
+            await upload.reaper.remove(session_id)
+            cached_result = rebase_urls(cached_result)
+            cached_result["cached"] = True
+            if job:
+                cached_session = cached_result["session_id"]
+                await session_pool.run(record_done, os.path.join(upload.workspace, cached_session), cached_result)
+                cached_result.update(status="done", status_url=f"{base_url()}v1/{upload.status_path}/"
+                                                               f"{cached_session}/status")
+            return {**cached_result, "upload_session_id": session_id}
+
+    if not job:
+        return await upload.run(file_paths, session_id, StageTimer(), cache_key)
+
+    try:
+        cpu_pool.ensure_capacity()
+    except HTTPException:
+        """turned away before it started: the session can be compared again later"""
+        await session_pool.run(os.remove, os.path.join(folder, COMPARED_MARKER))
+        raise
+    progress = JobProgress(folder)
+    progress.queued()
+    start_job(progress, upload.run(file_paths, session_id, progress, cache_key))
+    return {"session_id": session_id, "status": "queued",
+            "status_url": f"{base_url()}v1/{upload.status_path}/{session_id}/status"}
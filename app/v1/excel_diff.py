@@ -0,0 +1,278 @@
+from bisect import bisect_left
+import itertools
+import numpy as np
+import pandas as pd
+
+"""row states, stored as small integers in ExcelDiff.row_states"""
+ROW_STATES = ["equal", "modified", "inserted", "deleted", "moved"]
+EQUAL, MODIFIED, INSERTED, DELETED, MOVED = range(len(ROW_STATES))
+
+
+class ExcelDiff:
+    """aligned column arrays plus per-cell and per-row change flags for two sheets"""
+    def __init__(self, columns, columns_1, columns_2, cell_changes, row_changes, default_value,
+                 added_columns=(), removed_columns=(), row_states=None, positions_1=None, positions_2=None):
+        self.columns = columns
+        self.columns_1 = columns_1
+        self.columns_2 = columns_2
+        self.cell_changes = cell_changes
+        self.row_changes = row_changes
+        self.default_value = default_value
+        self.added_columns = list(added_columns)
+        self.removed_columns = list(removed_columns)
+        self.row_states = row_states
+        self.positions_1 = positions_1
+        self.positions_2 = positions_2
+
+    @property
+    def header(self):
+        """integer column labels are shown as ID, as the dict based renderer used to do"""
+        return ["ID" if isinstance(column, (int, np.integer)) else column for column in self.columns]
+
+    @property
+    def changed_rows(self):
+        return np.flatnonzero(self.row_changes)
+
+    @property
+    def column_states(self):
+        """added / removed / None per column, for header highlighting"""
+        added = set(self.added_columns)
+        removed = set(self.removed_columns)
+        return ["added" if column in added else "removed" if column in removed else None
+                for column in self.columns]
+
+    def side_length(self, side: int) -> int:
+        side_columns = self.columns_1 if side == 1 else self.columns_2
+        return len(side_columns[0]) if side_columns else 0
+
+    def source_length(self, side: int) -> int:
+        positions = self.positions_1 if side == 1 else self.positions_2
+        if positions is None:
+            return self.side_length(side)
+        return int(np.count_nonzero(positions >= 0))
+
+    def rows(self, side: int):
+        """yield display rows lazily from the column arrays, padding the shorter sheet"""
+        side_columns = self.columns_1 if side == 1 else self.columns_2
+        padding = len(self.row_changes) - self.side_length(side)
+        padding_row = (self.default_value,) * len(self.columns)
+        return itertools.chain(zip(*side_columns), itertools.repeat(padding_row, padding))
+
+    def row_slice(self, side: int, start: int, end: int) -> list:
+        """rows [start, end) as tuples of plain Python values, converted column-wise in C"""
+        side_columns = self.columns_1 if side == 1 else self.columns_2
+        rows = list(zip(*(column[start:end].tolist() for column in side_columns)))
+        padding = min(end, len(self.row_changes)) - max(start, self.side_length(side))
+        if padding > 0:
+            rows.extend([(self.default_value,) * len(self.columns)] * padding)
+        return rows
+
+    def marked_rows(self, side: int):
+        """yield (values, row state, cell change flags) for the template"""
+        return zip(self.rows(side), self.row_states, self.cell_changes)
+
+    def source_row(self, side: int, row: int):
+        """row number in the original sheet for an aligned row, or None when the sheet has no such row"""
+        positions = self.positions_1 if side == 1 else self.positions_2
+        if positions is None:
+            return row if row < self.side_length(side) else None
+        return int(positions[row]) if positions[row] >= 0 else None
+
+    def cell_value(self, side: int, row: int, column: int):
+        side_columns = self.columns_1 if side == 1 else self.columns_2
+        if row >= self.side_length(side):
+            return None
+        value = side_columns[column][row]
+        if isinstance(value, str) and value == self.default_value:
+            return None
+        return value.item() if isinstance(value, np.generic) else value
+
+    def summary(self, change_limit: int) -> dict:
+        """counts plus the first change_limit changed cells, for clients that do not want the HTML"""
+        changed_rows, changed_columns = np.nonzero(self.cell_changes)
+        cells_per_column = self.cell_changes.sum(axis=0)
+        rows_per_state = np.bincount(self.row_states, minlength=len(ROW_STATES))
+        changes = [{"row": int(row), "row_1": self.source_row(1, row), "row_2": self.source_row(2, row),
+                    "column": str(self.columns[column]),
+                    "value_1": self.cell_value(1, row, column), "value_2": self.cell_value(2, row, column)}
+                   for row, column in zip(changed_rows[:change_limit], changed_columns[:change_limit])]
+        return {
+            "rows_compared": len(self.row_changes),
+            "rows_in_sheet_1": self.source_length(1),
+            "rows_in_sheet_2": self.source_length(2),
+            "changed_rows": int(self.row_changes.sum()),
+            "changed_cells": len(changed_rows),
+            **{f"{state}_rows": int(count) for state, count in zip(ROW_STATES, rows_per_state)},
+            "added_columns": [str(column) for column in self.added_columns],
+            "removed_columns": [str(column) for column in self.removed_columns],
+            "changed_cells_per_column": {str(column): int(count)
+                                         for column, count in zip(self.columns, cells_per_column) if count},
+            "changes": changes,
+            "changes_truncated": len(changed_rows) > change_limit,
+        }
+
+
+def union_columns(df1: pd.DataFrame, df2: pd.DataFrame) -> list:
+    """columns of the first sheet in order, followed by the ones only the second sheet has"""
+    seen = set(df1.columns)
+    return list(df1.columns) + [column for column in df2.columns if column not in seen]
+
+
+def display_columns(df: pd.DataFrame, columns: list, default_value: str, positions=None) -> list:
+    """one array per column; only columns with missing cells are boxed into objects.
+
+    With positions the rows are taken in aligned order and -1 becomes an empty row.
+    """
+    row_count = len(df) if positions is None else len(positions)
+    gaps = None if positions is None else positions < 0
+    result = []
+    for column in columns:
+        if column not in df.columns or (positions is not None and len(df) == 0):
+            result.append(np.full(row_count, default_value, dtype=object))
+            continue
+        series = df[column]
+        values = series.to_numpy() if series.dtype.kind in "biuf" else series.to_numpy(dtype=object)
+        missing = series.isna().to_numpy()
+        if positions is not None:
+            safe_positions = np.where(gaps, 0, positions)
+            values = values.take(safe_positions)
+            missing = missing.take(safe_positions) | gaps
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = default_value
+        result.append(values)
+    return result
+
+
+def row_hashes(df: pd.DataFrame, columns: list) -> np.ndarray:
+    """64-bit hash per row; numbers are hashed as floats so 1 and 1.0 match across sheets"""
+    frame = pd.DataFrame({position: df[column].astype("float64") if df[column].dtype.kind in "biuf" else df[column]
+                          for position, column in enumerate(columns)}, index=df.index)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def occurrence_index(values: np.ndarray) -> pd.MultiIndex:
+    """(value, n-th occurrence) pairs, so duplicated rows or keys are matched in order"""
+    occurrence = pd.Series(values).groupby(values).cumcount().to_numpy()
+    return pd.MultiIndex.from_arrays([values, occurrence])
+
+
+def longest_increasing_subsequence(values: np.ndarray) -> np.ndarray:
+    """mask of one longest strictly increasing subsequence, O(n log n)"""
+    tails = []
+    tail_positions = []
+    previous = np.full(len(values), -1)
+    for position, value in enumerate(values):
+        slot = bisect_left(tails, value)
+        if slot == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[slot] = value
+            tail_positions[slot] = position
+        previous[position] = tail_positions[slot - 1] if slot else -1
+
+    mask = np.zeros(len(values), dtype=bool)
+    position = tail_positions[-1] if tail_positions else -1
+    while position >= 0:
+        mask[position] = True
+        position = previous[position]
+    return mask
+
+
+def align_rows(df1: pd.DataFrame, df2: pd.DataFrame, key_columns=None):
+    """match rows by key columns, or by whole-row hash when no keys are given.
+
+    Returns the row position in each sheet for every aligned row (-1 where the sheet
+    has no such row) and the row states; paired rows start out as EQUAL.
+    """
+    columns = key_columns or [column for column in df1.columns if column in set(df2.columns)]
+    if not columns or len(df1) == 0 or len(df2) == 0:
+        """nothing to match rows on: every row of the first sheet is deleted and every row of the second inserted"""
+        positions_1 = np.concatenate([np.arange(len(df1)), np.full(len(df2), -1)])
+        positions_2 = np.concatenate([np.full(len(df1), -1), np.arange(len(df2))])
+        row_states = np.full(len(df1) + len(df2), INSERTED, dtype=np.int8)
+        row_states[:len(df1)] = DELETED
+        return positions_1, positions_2, row_states
+    hashes_1, hashes_2 = row_hashes(df1, columns), row_hashes(df2, columns)
+
+    partner_1 = occurrence_index(hashes_2).get_indexer(occurrence_index(hashes_1))
+    matched_1 = np.flatnonzero(partner_1 >= 0)
+
+    """matches that keep their relative order are anchors, the rest moved"""
+    in_order = longest_increasing_subsequence(partner_1[matched_1])
+    anchors_1 = matched_1[in_order]
+    anchors_2 = partner_1[anchors_1]
+    moved_1 = np.zeros(len(df1), dtype=bool)
+    moved_1[matched_1[~in_order]] = True
+
+    if not key_columns:
+        """without keys, unmatched rows between the same two anchors are paired up as modified rows"""
+        has_partner_2 = np.zeros(len(df2), dtype=bool)
+        has_partner_2[partner_1[matched_1]] = True
+        unmatched_1 = np.flatnonzero(partner_1 < 0)
+        unmatched_2 = np.flatnonzero(~has_partner_2)
+        gaps_1 = np.searchsorted(anchors_1, unmatched_1)
+        gaps_2 = np.searchsorted(anchors_2, unmatched_2)
+        pairs = occurrence_index(gaps_2).get_indexer(occurrence_index(gaps_1))
+        partner_1[unmatched_1[pairs >= 0]] = unmatched_2[pairs[pairs >= 0]]
+
+    has_partner_1 = partner_1 >= 0
+    partner_2 = np.full(len(df2), -1)
+    partner_2[partner_1[has_partner_1]] = np.flatnonzero(has_partner_1)
+
+    """second sheet order; a deleted row follows the nearest earlier first-sheet row that has a partner"""
+    deleted_1 = np.flatnonzero(~has_partner_1)
+    last_paired = np.maximum.accumulate(np.where(has_partner_1, np.arange(len(df1)), -1))
+    follows = np.where(last_paired >= 0, partner_1[np.maximum(last_paired, 0)], -1)[deleted_1]
+    order = np.lexsort((np.concatenate([np.zeros(len(df2), dtype=int), deleted_1]),
+                        np.concatenate([np.zeros(len(df2), dtype=int), np.ones(len(deleted_1), dtype=int)]),
+                        np.concatenate([np.arange(len(df2)), follows])))
+    positions_1 = np.concatenate([partner_2, deleted_1])[order]
+    positions_2 = np.concatenate([np.arange(len(df2)), np.full(len(deleted_1), -1)])[order]
+
+    row_states = np.full(len(order), EQUAL, dtype=np.int8)
+    row_states[positions_1 < 0] = INSERTED
+    row_states[positions_2 < 0] = DELETED
+    row_states[(positions_1 >= 0) & moved_1[np.maximum(positions_1, 0)]] = MOVED
+    return positions_1, positions_2, row_states
+
+
+def compute_diff(df1: pd.DataFrame, df2: pd.DataFrame, default_value: str = "N/A",
+                 alignment: str = "position", key_columns=None) -> ExcelDiff:
+    """compare two sheets by position (shorter one padded with empty rows), by key columns or by row hash"""
+    columns = union_columns(df1, df2)
+    df1 = df1.reset_index(drop=True)
+    df2 = df2.reset_index(drop=True)
+
+    if alignment == "position":
+        row_count = max(len(df1), len(df2))
+        positions_1 = positions_2 = None
+        rows_1 = rows_2 = pd.RangeIndex(row_count)
+        row_states = np.full(row_count, EQUAL, dtype=np.int8)
+        row_states[len(df1):] = INSERTED
+        row_states[len(df2):] = DELETED
+    else:
+        positions_1, positions_2, row_states = align_rows(df1, df2, key_columns if alignment == "key" else None)
+        rows_1, rows_2 = positions_1, positions_2
+
+    aligned_1 = df1.reindex(index=rows_1, columns=columns).reset_index(drop=True)
+    aligned_2 = df2.reindex(index=rows_2, columns=columns).reset_index(drop=True)
+
+    """same rule as DataFrame.compare: a cell changed unless equal or missing on both sides. Added and removed
+    columns are column changes, reported on their own, so their cells do not mark every row modified"""
+    added_columns = [column for column in df2.columns if column not in df1.columns]
+    removed_columns = [column for column in df1.columns if column not in df2.columns]
+    shared = ~np.isin(np.arange(len(columns)), [columns.index(column) for column in added_columns + removed_columns])
+    both_missing = aligned_1.isna().to_numpy() & aligned_2.isna().to_numpy()
+    not_equal = aligned_1.ne(aligned_2).to_numpy(dtype=bool)
+    cell_changes = not_equal & ~both_missing & shared
+    row_changes = cell_changes.any(axis=1) | (row_states == INSERTED) | (row_states == DELETED)
+    row_states[(row_states == EQUAL) & row_changes] = MODIFIED
+
+    return ExcelDiff(columns,
+                     display_columns(df1, columns, default_value, positions_1),
+                     display_columns(df2, columns, default_value, positions_2),
+                     cell_changes, row_changes, default_value,
+                     added_columns=added_columns, removed_columns=removed_columns,
+                     row_states=row_states, positions_1=positions_1, positions_2=positions_2)
@@ -0,0 +1,182 @@
+import numpy as np
+import shutil
+import json
+import csv
+import io
+import os
+
+from app.v1.excel_diff import ExcelDiff, ROW_STATES, EQUAL
+
+"""the aligned columns and change masks of a diff as .npy files, so a session can be reopened without parsing the
+workbooks again. Numeric columns are memory-mapped as they are; other columns are one ASCII buffer of JSON values,
+each followed by a comma, plus the offset where each value starts."""
+FRAMES_FOLDER = "frames"
+FRAMES_META = "frames.json"
+FRAMES_VERSION = 1
+CHUNK_ROWS = 10000
+_encoder = json.JSONEncoder(default=lambda value: value.item() if isinstance(value, np.generic) else str(value))
+
+
+class TextColumn:
+    """an object column read back from its JSON buffer; slices are decoded with one json.loads call"""
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def decode(self, start: int, end: int) -> np.ndarray:
+        values = np.empty(max(end - start, 0), dtype=object)
+        if len(values):
+            chunk = self.data[self.offsets[start]:self.offsets[end] - 1].tobytes()
+            values[:] = json.loads(b"[" + chunk + b"]")
+        return values
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, end, step = index.indices(len(self))
+            return self.decode(start, end)[::step] if step != 1 else self.decode(start, end)
+        if np.ndim(index):
+            if len(index) and index[-1] - index[0] + 1 == len(index):
+                """a contiguous run of rows, as export chunks are"""
+                return self.decode(int(index[0]), int(index[-1]) + 1)
+            values = np.empty(len(index), dtype=object)
+            values[:] = [self[int(row)] for row in index]
+            return values
+        return json.loads(self.data[self.offsets[index]:self.offsets[index + 1] - 1].tobytes())
+
+    def __iter__(self):
+        for start in range(0, len(self), CHUNK_ROWS):
+            yield from self.decode(start, min(start + CHUNK_ROWS, len(self)))
+
+
+def encode_text_column(values: np.ndarray) -> tuple:
+    texts = [_encoder.encode(value) for value in values.tolist()]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) + 1 for text in texts], out=offsets[1:])
+    data = np.frombuffer(("".join(text + "," for text in texts)).encode("ascii"), dtype=np.uint8)
+    return data, offsets
+
+
+def write_frames(session_path: str, diff: ExcelDiff):
+    """written to a staging folder first, so a reader never sees half a set of frames"""
+    target = os.path.join(session_path, FRAMES_FOLDER)
+    staging = f"{target}.partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    kinds = {}
+    for side, side_columns in ((1, diff.columns_1), (2, diff.columns_2)):
+        kinds[side] = []
+        for index, values in enumerate(side_columns):
+            if values.dtype.kind in "biuf":
+                np.save(os.path.join(staging, f"{side}_{index}.npy"), values)
+                kinds[side].append("array")
+            else:
+                data, offsets = encode_text_column(values)
+                np.save(os.path.join(staging, f"{side}_{index}.npy"), data)
+                np.save(os.path.join(staging, f"{side}_{index}_offsets.npy"), offsets)
+                kinds[side].append("text")
+
+    np.save(os.path.join(staging, "cell_changes.npy"), diff.cell_changes)
+    np.save(os.path.join(staging, "row_changes.npy"), diff.row_changes)
+    np.save(os.path.join(staging, "row_states.npy"), diff.row_states)
+    for side, positions in ((1, diff.positions_1), (2, diff.positions_2)):
+        if positions is not None:
+            np.save(os.path.join(staging, f"positions_{side}.npy"), positions)
+
+    with open(os.path.join(staging, FRAMES_META), "w") as file:
+        json.dump({"version": FRAMES_VERSION, "columns": list(diff.columns), "added_columns": diff.added_columns,
+                   "removed_columns": diff.removed_columns, "default_value": diff.default_value, "kinds": kinds,
+                   "aligned": diff.positions_1 is not None}, file, default=_encoder.default)
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(staging, target)
+
+
+def open_frames(session_path: str):
+    """the ExcelDiff of a session with its arrays memory-mapped, or None when the session has no frames"""
+    folder = os.path.join(session_path, FRAMES_FOLDER)
+    try:
+        with open(os.path.join(folder, FRAMES_META)) as file:
+            meta = json.load(file)
+    except OSError:
+        return None
+    if meta["version"] != FRAMES_VERSION:
+        return None
+
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+
+    sides = {}
+    for side in (1, 2):
+        sides[side] = [load(f"{side}_{index}") if kind == "array"
+                       else TextColumn(load(f"{side}_{index}"), load(f"{side}_{index}_offsets"))
+                       for index, kind in enumerate(meta["kinds"][str(side)])]
+    positions_1 = load("positions_1") if meta["aligned"] else None
+    positions_2 = load("positions_2") if meta["aligned"] else None
+    return ExcelDiff(meta["columns"], sides[1], sides[2], load("cell_changes"), load("row_changes"),
+                     meta["default_value"], added_columns=meta["added_columns"],
+                     removed_columns=meta["removed_columns"], row_states=load("row_states"),
+                     positions_1=positions_1, positions_2=positions_2)
+
+
+def column_values(diff: ExcelDiff, side: int, rows: np.ndarray) -> list:
+    """columns of the given aligned rows as plain values, the default value where the sheet has no such row"""
+    side_columns = diff.columns_1 if side == 1 else diff.columns_2
+    present = rows < diff.side_length(side)
+    columns = []
+    for column in side_columns:
+        values = np.full(len(rows), diff.default_value, dtype=object)
+        values[present] = column[rows[present]]
+        columns.append(values.tolist())
+    return columns
+
+
+def side_values(diff: ExcelDiff, side: int, rows: np.ndarray) -> list:
+    """columns of the given aligned rows as plain values, empty where the sheet has no value"""
+    return [["" if isinstance(value, str) and value == diff.default_value else value for value in column]
+            for column in column_values(diff, side, rows)]
+
+
+def read_frame_window(session_path: str, start: int, end: int, changed_only: bool = False):
+    """rows [start, end) of the aligned diff, or of its changed rows only; None when the session has no frames"""
+    diff = open_frames(session_path)
+    if diff is None:
+        return None
+    states = np.asarray(diff.row_states)
+    rows = np.flatnonzero(states != EQUAL) if changed_only else np.arange(len(states))
+    window = rows[start:end]
+    columns_1, columns_2 = column_values(diff, 1, window), column_values(diff, 2, window)
+    cell_changes = np.asarray(diff.cell_changes[window])
+    row_changes = np.asarray(diff.row_changes[window])
+    return {"total": len(rows), "start": start, "end": start + len(window),
+            "rows": [{"row": row, "state": int(states[row]),
+                      "values_1": [column[position] for column in columns_1],
+                      "values_2": [column[position] for column in columns_2],
+                      "changed_cells": np.flatnonzero(cell_changes[position]).tolist()
+                      if row_changes[position] else []}
+                     for position, row in enumerate(window.tolist())]}
+
+
+def export_csv(diff: ExcelDiff, changed_only: bool = False):
+    """aligned rows side by side as CSV, in chunks of CHUNK_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["row", "state", "row_1", "row_2"] +
+                    [f"{label} ({side})" for label in diff.header for side in (1, 2)])
+    rows = np.flatnonzero(np.asarray(diff.row_states) != EQUAL) if changed_only else np.arange(len(diff.row_states))
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[start:start + CHUNK_ROWS]
+        columns_1, columns_2 = side_values(diff, 1, chunk), side_values(diff, 2, chunk)
+        for position, row in enumerate(chunk.tolist()):
+            source_1, source_2 = diff.source_row(1, row), diff.source_row(2, row)
+            values = [value for column_1, column_2 in zip(columns_1, columns_2)
+                      for value in (column_1[position], column_2[position])]
+            writer.writerow([row, ROW_STATES[diff.row_states[row]], "" if source_1 is None else source_1,
+                             "" if source_2 is None else source_2] + values)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,109 @@
+from array import array
+import numpy as np
+import json
+import csv
+import io
+import os
+
+from app.v1.excel_diff import ROW_STATES, EQUAL
+
+"""one JSON line per aligned row plus byte offsets, so any row window is a single seek and read. Streamed CSV diffs
+are written here; xlsx diffs keep their rows in the frames of excel_frames"""
+ROWS_FILE = "rows.ndjson"
+OFFSETS_FILE = "rows_offsets.npy"
+CHANGED_FILE = "rows_changed.npy"
+META_FILE = "rows_meta.json"
+EXPORT_BUFFER_BYTES = 1024 * 1024
+
+
+def write_row_meta(session_path: str, meta: dict, header: list, column_states: list, total_rows: int,
+                   changed_rows: int):
+    with open(os.path.join(session_path, META_FILE), "w") as file:
+        json.dump({**meta, "header": [str(column) for column in header], "column_states": column_states,
+                   "total_rows": total_rows, "changed_rows": changed_rows}, file)
+
+
+class RowStoreWriter:
+    """appends rows one at a time, for producers that never hold the whole diff in memory"""
+    def __init__(self, session_path: str):
+        self.session_path = session_path
+        self.file = open(os.path.join(session_path, ROWS_FILE), "wb")
+        self.offsets = array("q", [0])
+        self.changed = array("q")
+
+    def write(self, state: int, values_1, values_2, changed_cells, row_1: int = None, row_2: int = None):
+        """row_1 and row_2 are the row numbers in the source files, kept for exports"""
+        line = json.dumps([state, values_1, values_2, changed_cells, row_1, row_2], default=str).encode() + b"\n"
+        if state != EQUAL:
+            self.changed.append(len(self.offsets) - 1)
+        self.file.write(line)
+        self.offsets.append(self.offsets[-1] + len(line))
+
+    def close(self, meta: dict, header: list, column_states: list):
+        self.file.close()
+        np.save(os.path.join(self.session_path, OFFSETS_FILE), np.frombuffer(self.offsets, dtype=np.int64))
+        np.save(os.path.join(self.session_path, CHANGED_FILE), np.frombuffer(self.changed, dtype=np.int64))
+        write_row_meta(self.session_path, meta, header, column_states, len(self.offsets) - 1, len(self.changed))
+
+
+def read_row_meta(session_path: str):
+    try:
+        with open(os.path.join(session_path, META_FILE)) as file:
+            return json.load(file)
+    except OSError:
+        return None
+
+
+def read_row_window(session_path: str, start: int, end: int, changed_only: bool = False) -> dict:
+    """rows [start, end) of the aligned diff, or of its changed rows only"""
+    offsets = np.load(os.path.join(session_path, OFFSETS_FILE), mmap_mode="r")
+    if changed_only:
+        changed = np.load(os.path.join(session_path, CHANGED_FILE), mmap_mode="r")
+        total = len(changed)
+        row_numbers = np.asarray(changed[start:end])
+    else:
+        total = len(offsets) - 1
+        row_numbers = np.arange(min(start, total), min(end, total))
+
+    rows = []
+    with open(os.path.join(session_path, ROWS_FILE), "rb") as file:
+        if not changed_only and len(row_numbers):
+            """contiguous window: one read covers every row"""
+            file.seek(int(offsets[row_numbers[0]]))
+            chunk = file.read(int(offsets[row_numbers[-1] + 1] - offsets[row_numbers[0]]))
+            lines = chunk.splitlines()
+        else:
+            lines = []
+            for row in row_numbers:
+                file.seek(int(offsets[row]))
+                lines.append(file.read(int(offsets[row + 1] - offsets[row])))
+        for row, line in zip(row_numbers, lines):
+            state, values_1, values_2, changed_cells = json.loads(line)[:4]
+            rows.append({"row": int(row), "state": state, "values_1": values_1, "values_2": values_2,
+                         "changed_cells": changed_cells})
+    return {"total": total, "start": start, "end": start + len(rows), "rows": rows}
+
+
+def export_row_store(session_path: str, default_value: str = "N/A"):
+    """the stored rows side by side as CSV, in the layout of excel_frames.export_csv. A streamed diff stores its
+    changed rows only, so this is the changed rows whether or not the client asked for all of them"""
+    meta = read_row_meta(session_path)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["row", "state", "row_1", "row_2"] +
+                    [f"{label} ({side})" for label in meta["header"] for side in (1, 2)])
+    with open(os.path.join(session_path, ROWS_FILE), "rb") as file:
+        for row, line in enumerate(file):
+            record = json.loads(line)
+            state, values_1, values_2 = record[:3]
+            row_1, row_2 = (record[4:6] + [None, None])[:2]
+            values = ["" if value == default_value else value
+                      for value_1, value_2 in zip(values_1, values_2) for value in (value_1, value_2)]
+            writer.writerow([row, ROW_STATES[state], "" if row_1 is None else row_1, "" if row_2 is None else row_2]
+                            + values)
+            if buffer.tell() >= EXPORT_BUFFER_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from fastapi import HTTPException
+import asyncio
+import json
+import time
+import os
+
+from app.v1.timing import StageTimer
+
+JOB_STAGES = ["validate", "copy", "parse", "diff", "render"]
+JOB_FOLDER = ".job"
+
+
+def write_json(path: str, data: dict):
+    """write through a temporary file so readers never see a partial document"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def read_json(path: str):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+class JobProgress(StageTimer):
+    """stage timer that publishes progress as one file per stage, so the parent and a pool worker never race"""
+    def __init__(self, session_workspace: str):
+        super().__init__()
+        self.job_folder = os.path.join(session_workspace, JOB_FOLDER)
+
+    @contextmanager
+    def stage(self, name: str):
+        stage_file = os.path.join(self.job_folder, f"{name}.json")
+        started = time.time()
+        write_json(stage_file, {"state": "running", "started": started})
+        try:
+            with super().stage(name):
+                yield
+        except BaseException:
+            write_json(stage_file, {"state": "failed", "started": started})
+            raise
+        write_json(stage_file, {"state": "done", "started": started, "duration_ms": self.timings[name]})
+
+    def queued(self):
+        os.makedirs(self.job_folder, exist_ok=True)
+        write_json(os.path.join(self.job_folder, "job.json"), {"status": "queued", "submitted": time.time()})
+
+    def finish(self, status: str, **fields):
+        job_file = os.path.join(self.job_folder, "job.json")
+        job = read_json(job_file) or {}
+        job.update(fields, status=status, finished=time.time())
+        write_json(job_file, job)
+
+
+def record_done(session_workspace: str, result: dict):
+    """a finished job record for a session answered from the result cache, so its status URL resolves like that of a
+    fresh job; a record the session already has is kept"""
+    job_folder = os.path.join(session_workspace, JOB_FOLDER)
+    if read_json(os.path.join(job_folder, "job.json")) is not None:
+        return
+    os.makedirs(job_folder, exist_ok=True)
+    write_json(os.path.join(job_folder, "job.json"), {**result, "status": "done", "finished": time.time()})
+
+
+def read_job_status(session_workspace: str):
+    job_folder = os.path.join(session_workspace, JOB_FOLDER)
+    job = read_json(os.path.join(job_folder, "job.json"))
+    if job is None:
+        return None
+
+    stages = {}
+    for name in JOB_STAGES:
+        stages[name] = read_json(os.path.join(job_folder, f"{name}.json")) or {"state": "pending"}
+    completed = sum(1 for stage in stages.values() if stage["state"] == "done")
+
+    status = job["status"]
+    if status == "queued" and any(stage["state"] != "pending" for stage in stages.values()):
+        status = "running"
+    progress = 1 if status == "done" else round(completed / len(JOB_STAGES), 2)
+    job.update(status=status, stages=stages, progress=progress)
+    return job
+
+
+"""keep references to running jobs so the event loop does not garbage collect them"""
+running_jobs = set()
+
+
+def start_job(progress: JobProgress, comparison):
+    """run a comparison coroutine in the background and record its outcome"""
+    async def run():
+        try:
+            result = await comparison
+        except HTTPException as error:
+            progress.finish("failed", status_code=error.status_code, error=error.detail)
+        except Exception as error:
+            progress.finish("failed", status_code=500, error=str(error))
+        else:
+            progress.finish("done", **result)
+
+    task = asyncio.create_task(run())
+    running_jobs.add(task)
+    task.add_done_callback(running_jobs.discard)
+    return task
@@ -0,0 +1,265 @@
+from contextvars import ContextVar
+from fastapi import HTTPException
+import functools
+import cProfile
+import threading
+import bisect
+import time
+import os
+
+from app.v1.session_registry import node_name
+from app.v1 import config
+
+"""latency buckets in seconds, size buckets in bytes and count buckets for rows, blocks and cells"""
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BYTE_BUCKETS = tuple(1024 * 4 ** power for power in range(12))
+COUNT_BUCKETS = tuple(10 ** power for power in range(9))
+
+
+def label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def set(self, *label_values, value: float):
+        """for counters kept elsewhere and copied in at scrape time"""
+        with self._lock:
+            self.values[label_values] = value
+
+    def samples(self):
+        return [f"{self.name}{label_text(self.labels, key)} {value}" for key, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value: float):
+        with self._lock:
+            counts, total = self.values.get(label_values, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[label_values] = (counts, total + value)
+
+    def samples(self):
+        lines = []
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket = 'le="' + str(bound) + '"'
+                lines.append(f"{self.name}_bucket{label_text(self.labels, key, bucket)} {cumulative}")
+            lines.append(f"{self.name}_sum{label_text(self.labels, key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """metrics of this process in the Prometheus text format; collectors refresh gauges at scrape time"""
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines += metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+STAGE_SECONDS = registry.register(Histogram(
+    "docomp_stage_duration_seconds", "Duration of one comparison pipeline stage", ("kind", "stage")))
+COMPARISON_SECONDS = registry.register(Histogram(
+    "docomp_comparison_duration_seconds", "Duration of a whole comparison", ("kind",)))
+INPUT_BYTES = registry.register(Histogram(
+    "docomp_input_bytes", "Combined size of the two compared documents", ("kind",), BYTE_BUCKETS))
+COMPARED_ITEMS = registry.register(Histogram(
+    "docomp_compared_items", "Rows (sheets, csv) or blocks (docx native) compared", ("kind",), COUNT_BUCKETS))
+CHANGED_CELLS = registry.register(Histogram(
+    "docomp_changed_cells", "Cells that differ in a tabular comparison", ("kind",), COUNT_BUCKETS))
+COMPARISONS = registry.register(Counter(
+    "docomp_comparisons_total", "Comparisons that finished", ("kind",)))
+ERRORS = registry.register(Counter(
+    "docomp_comparison_errors_total", "Comparisons that failed, by HTTP status", ("kind", "status")))
+ACTIVE_COMPARISONS = registry.register(Gauge(
+    "docomp_active_comparisons", "Comparisons running right now", ("kind",)))
+ACTIVE_SESSIONS = registry.register(Gauge(
+    "docomp_active_sessions", "Session folders on disk as of the last reaper pass", ("workspace",)))
+POOL_PENDING = registry.register(Gauge(
+    "docomp_pool_pending_jobs", "Jobs running or queued in a worker pool", ("pool",)))
+PROCESS_INFO = registry.register(Gauge(
+    "docomp_process_info", "The server worker process whose figures a scrape returned", ("process",)))
+registry.collectors.append(lambda: PROCESS_INFO.set(node_name(), value=1))
+CACHE_LOOKUPS = registry.register(Counter(
+    "docomp_result_cache_lookups_total", "Result cache lookups by outcome", ("cache", "outcome")))
+REQUEST_SECONDS = registry.register(Histogram(
+    "docomp_http_request_duration_seconds", "HTTP request latency until the response starts", ("method", "route")))
+REQUESTS = registry.register(Counter(
+    "docomp_http_requests_total", "HTTP requests by response status", ("method", "route", "status")))
+
+"""stage timings of the comparison the current request ran, for its Server-Timing header"""
+request_timings = ContextVar("request_timings", default=None)
+
+
+def document_paths(file_paths) -> list:
+    """the documents of a request body are its fields named *_path"""
+    return [value for name, value in file_paths if name.endswith("_path") and isinstance(value, str)]
+
+
+def result_counts(result: dict) -> tuple:
+    """(items compared, changed cells, whether cells apply) of a result; workbook results add up their sheets"""
+    summaries = [result["summary"]] if "summary" in result else \
+        [sheet["summary"] for sheet in result.get("sheets", []) if "summary" in sheet]
+    items = sum(summary.get("rows_compared", summary.get("equal_blocks", 0) + summary.get("changed_blocks", 0))
+                for summary in summaries)
+    cells = sum(summary.get("changed_cells", 0) for summary in summaries)
+    return items, cells, any("changed_cells" in summary for summary in summaries)
+
+
+def observe_comparison(kind: str, file_paths, timings: dict, result: dict, seconds: float):
+    for stage, milliseconds in timings.items():
+        STAGE_SECONDS.observe(kind, stage, value=milliseconds / 1000)
+    COMPARISON_SECONDS.observe(kind, value=seconds)
+    try:
+        INPUT_BYTES.observe(kind, value=sum(os.path.getsize(path) for path in document_paths(file_paths)))
+    except OSError:
+        pass
+    items, cells, tabular = result_counts(result)
+    if items:
+        COMPARED_ITEMS.observe(kind, value=items)
+    if tabular:
+        CHANGED_CELLS.observe(kind, value=cells)
+    COMPARISONS.inc(kind)
+
+
+def instrumented(kind: str):
+    """record stage histograms, sizes, errors and in-flight count for a run_*_comparison coroutine"""
+    def decorate(run):
+        @functools.wraps(run)
+        async def run_instrumented(file_paths, session_id: str, timer, *args):
+            ACTIVE_COMPARISONS.inc(kind)
+            started = time.perf_counter()
+            try:
+                result = await run(file_paths, session_id, timer, *args)
+            except HTTPException as error:
+                ERRORS.inc(kind, str(error.status_code))
+                raise
+            except Exception:
+                ERRORS.inc(kind, "500")
+                raise
+            finally:
+                ACTIVE_COMPARISONS.dec(kind)
+            observe_comparison(kind, file_paths, timer.timings, result, time.perf_counter() - started)
+            timings = request_timings.get()
+            if timings is not None:
+                timings.update(timer.timings)
+            return result
+        return run_instrumented
+    return decorate
+
+
+def watch_sessions(name: str, reaper):
+    registry.collectors.append(lambda: ACTIVE_SESSIONS.set(name, value=reaper.live_sessions))
+
+
+def watch_pool(name: str, pool):
+    registry.collectors.append(lambda: POOL_PENDING.set(name, value=pool.pending))
+
+
+def watch_cache(name: str, cache):
+    def collect():
+        CACHE_LOOKUPS.set(name, "hit", value=cache.hits)
+        CACHE_LOOKUPS.set(name, "miss", value=cache.misses)
+    registry.collectors.append(collect)
+
+
+def profile_if_slow(func, *args):
+    """run a pool job under cProfile and keep the profile when it took longer than the configured threshold"""
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        return func(*args)
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        if elapsed >= config.METRICS_PROFILE_SLOW_SECONDS:
+            os.makedirs(config.METRICS_PROFILE_FOLDER, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{func.__name__}-{os.getpid()}-{round(elapsed * 1000)}ms.prof"
+            profiler.dump_stats(os.path.join(config.METRICS_PROFILE_FOLDER, name))
+
+
+def server_timing(timings: dict, total_seconds: float) -> str:
+    entries = [f"{stage};dur={milliseconds}" for stage, milliseconds in timings.items()]
+    entries.append(f"total;dur={round(total_seconds * 1000, 2)}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """times every request by route template and, when enabled, reports comparison stages as Server-Timing"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        timings = {}
+        token = request_timings.set(timings)
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                route = scope.get("route")
+                route = getattr(route, "path", None) or "unmatched"
+                REQUEST_SECONDS.observe(scope["method"], route, value=elapsed)
+                REQUESTS.inc(scope["method"], route, str(message["status"]))
+                if config.METRICS_SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(timings, elapsed).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            request_timings.reset(token)
@@ -0,0 +1,47 @@
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+from starlette.requests import Request
+
+from app.v1 import config
+
+"""links in responses start at the URL clients reach the service at: BASE_URL when it is set, otherwise the base URL
+of the request being answered, from its Host header, or from the forwarded headers of a proxy uvicorn trusts.
+Background jobs keep the base of the request that started them"""
+ROUTE_PREFIXES = ("v1/", "static/")
+request_base_url = ContextVar("request_base_url", default=None)
+
+
+def base_url() -> str:
+    return config.BASE_URL or request_base_url.get() or f"http://localhost:{config.SERVER_PORT}/"
+
+
+def rebase_urls(value):
+    """point the links of a stored result, made for an earlier request, at the base of this one"""
+    if isinstance(value, list):
+        return [rebase_urls(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    rebased = {}
+    for key, item in value.items():
+        if key.endswith("_url") and isinstance(item, str):
+            path = urlsplit(item)._replace(scheme="", netloc="").geturl().lstrip("/")
+            starts = [path.find(prefix) for prefix in ROUTE_PREFIXES if prefix in path]
+            item = base_url() + path[min(starts):] if starts else item
+        rebased[key] = rebase_urls(item)
+    return rebased
+
+
+class BaseUrlMiddleware:
+    """remembers the base URL of each request for the links built while answering it"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = request_base_url.set(str(Request(scope).base_url))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_base_url.reset(token)
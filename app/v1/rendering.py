@@ -0,0 +1,33 @@
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+import os
+
+from app.v1.static_files import precompress
+from app.v1 import config
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+
+def create_environment() -> Environment:
+    """one environment per process: templates are compiled on first use and kept in its cache"""
+    bytecode_cache = None
+    if config.TEMPLATE_BYTECODE_CACHE:
+        """compiled bytecode on disk lets freshly spawned pool workers skip compilation too"""
+        os.makedirs(config.TEMPLATE_BYTECODE_CACHE, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(config.TEMPLATE_BYTECODE_CACHE)
+    return Environment(loader=FileSystemLoader(TEMPLATE_FOLDER), autoescape=select_autoescape(["html"]),
+                       bytecode_cache=bytecode_cache,
+                       auto_reload=config.TEMPLATE_AUTO_RELOAD)
+
+
+environment = create_environment()
+
+
+def render_to_file(template_name: str, path: str, **context):
+    """stream the page to disk chunk by chunk instead of building it as one string"""
+    with open(path, "w") as file:
+        file.writelines(environment.get_template(template_name).generate(**context))
+    precompress(path)
+
+
+def render(template_name: str, **context) -> str:
+    return environment.get_template(template_name).render(**context)
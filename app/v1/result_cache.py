@@ -0,0 +1,163 @@
+from collections import OrderedDict
+import hashlib
+import shutil
+import threading
+import time
+import os
+
+from app.v1 import config
+from app.v1.jobs import write_json, read_json
+from app.v1.session_registry import node_name
+
+"""bump when the rendered output changes so older sessions are not served for new requests"""
+CACHE_FORMAT_VERSION = 12
+
+"""marks a session a cache entry points at; it is shared by every client the entry was handed to"""
+CACHED_MARKER = ".cached"
+
+"""least recently used digests last"""
+_digest_memo = OrderedDict()
+_digest_lock = threading.Lock()
+
+
+def memo_key(path: str) -> tuple:
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def memoize_digest(key: tuple, digest: str):
+    with _digest_lock:
+        _digest_memo[key] = digest
+        _digest_memo.move_to_end(key)
+        while len(_digest_memo) > config.RESULT_CACHE_DIGEST_ENTRIES:
+            _digest_memo.popitem(last=False)
+
+
+def file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """sha256 of a file, memoized on (inode, size, mtime) so unchanged inputs are hashed once"""
+    key = memo_key(path)
+    with _digest_lock:
+        if key in _digest_memo:
+            _digest_memo.move_to_end(key)
+            return _digest_memo[key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    memoize_digest(key, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def remember_digest(path: str, digest: str):
+    """record the sha256 of a file that was hashed while it was written, so it is not read again"""
+    memoize_digest(memo_key(path), digest)
+
+
+def folder_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResultCache:
+    def __init__(self, workspace: str, max_bytes: int, max_age: float):
+        self.workspace = workspace
+        self.index_folder = os.path.join(workspace, ".cache")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        key = hashlib.sha256(str(CACHE_FORMAT_VERSION).encode())
+        for part in parts:
+            key.update(b"\0" + str(part).encode())
+        return key.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.index_folder, f"{key}.json")
+
+    def lookup(self, key: str):
+        """return the cached result for a key, or None when it is missing, expired or its session is gone"""
+        entry_file = self.entry_path(key)
+        entry = read_json(entry_file)
+        if entry is not None:
+            session_workspace = os.path.join(self.workspace, entry["session_id"])
+            if time.time() - entry["created"] > self.max_age or not os.path.isdir(session_workspace):
+                self.remove(key, entry)
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        """entry and session mtimes double as last-used times for LRU eviction and the session reaper"""
+        os.utime(entry_file)
+        os.utime(os.path.join(self.workspace, entry["session_id"]))
+        self.hits += 1
+        return entry["result"]
+
+    def store(self, key: str, session_id: str, result: dict):
+        os.makedirs(self.index_folder, exist_ok=True)
+        entry = {"session_id": session_id, "created": time.time(), "result": result,
+                 "bytes": folder_size(os.path.join(self.workspace, session_id))}
+        write_json(os.path.join(self.workspace, session_id, CACHED_MARKER), {"key": key})
+        write_json(self.entry_path(key), entry)
+        self.evict()
+
+    def holds(self, session_id: str) -> bool:
+        """whether a cache entry still points at the session, so clients other than the asking one may be using it"""
+        marker = read_json(os.path.join(self.workspace, session_id, CACHED_MARKER))
+        if marker is None:
+            return False
+        entry = read_json(self.entry_path(marker["key"]))
+        return entry is not None and entry["session_id"] == session_id
+
+    def remove(self, key: str, entry: dict):
+        shutil.rmtree(os.path.join(self.workspace, entry["session_id"]), ignore_errors=True)
+        try:
+            os.remove(self.entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """drop expired sessions, then least recently used ones until the cache fits its byte budget"""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.index_folder):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            entry_file = self.entry_path(key)
+            entry = read_json(entry_file)
+            if entry is None:
+                continue
+            if now - entry["created"] > self.max_age:
+                self.remove(key, entry)
+                self.evictions += 1
+                continue
+            try:
+                last_used = os.path.getmtime(entry_file)
+            except OSError:
+                continue
+            entries.append((last_used, key, entry))
+
+        total_bytes = sum(entry["bytes"] for _, _, entry in entries)
+        for _, key, entry in sorted(entries, key=lambda item: item[0]):
+            if total_bytes <= self.max_bytes:
+                break
+            self.remove(key, entry)
+            self.evictions += 1
+            total_bytes -= entry["bytes"]
+
+    def stats(self) -> dict:
+        """the counters are this process's own"""
+        return {"enabled": config.RESULT_CACHE_ENABLED, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "process": node_name()}
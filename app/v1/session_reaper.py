@@ -0,0 +1,174 @@
+import asyncio
+import shutil
+import time
+import os
+
+from app.v1.jobs import read_job_status
+from app.v1.result_cache import folder_size
+from app.v1.worker_pool import session_pool, move_aside, overdue_jobs, remove_later, TRASH_FOLDER
+from app.v1.session_registry import session_registry, node_name
+from app.v1 import config
+
+
+"""a read marks its session used at most this often, so paging through rows costs one metadata write a minute"""
+TOUCH_INTERVAL = 60
+
+
+class SessionReaper:
+    """expires abandoned session folders by age and keeps their total size under a byte quota"""
+    def __init__(self, workspace: str, ttl: float, max_bytes: int, interval: float, shared_folders: tuple = ()):
+        self.workspace = workspace
+        """the name sessions are registered under, shared by every node that mounts the workspace"""
+        self.name = os.path.basename(os.path.normpath(workspace))
+        self.shared_folders = shared_folders
+        self.trash_folder = os.path.join(workspace, TRASH_FOLDER)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.live_sessions = 0
+        self.live_bytes = 0
+        self.reaped = 0
+        self.reaped_bytes = 0
+        self.last_run = None
+        self._sizes = {}
+        self._task = None
+
+    def scan(self) -> list:
+        """(last used, session id, bytes) per session; sizes are memoized on the folder mtime
+
+        Entries of the shared folders, which sessions reuse by content hash, age and count towards the quota too.
+        """
+        sessions = []
+        sizes = {}
+        entries = [(entry.name, entry) for entry in os.scandir(self.workspace) if not entry.name.startswith(".")]
+        for folder in self.shared_folders:
+            if os.path.isdir(os.path.join(self.workspace, folder)):
+                entries += [(os.path.join(folder, entry.name), entry)
+                            for entry in os.scandir(os.path.join(self.workspace, folder))]
+        for name, entry in entries:
+            if not entry.is_dir():
+                continue
+            try:
+                last_used = entry.stat().st_mtime
+            except OSError:
+                continue
+            size = self._sizes.get((name, last_used))
+            if size is None:
+                size = folder_size(entry.path)
+            sizes[(name, last_used)] = size
+            sessions.append((last_used, name, size))
+        self._sizes = sizes
+        return sessions
+
+    def in_use(self, session_id: str, last_used: float, now: float) -> bool:
+        """sessions a comparison may still be writing to are never reaped"""
+        if now - last_used < config.COMPARE_JOB_TIMEOUT:
+            job = read_job_status(os.path.join(self.workspace, session_id))
+            return job is None or job["status"] in ("queued", "running")
+        return False
+
+    def register(self, session_id: str):
+        session_registry.register(self.name, session_id)
+
+    def touch(self, session_id: str):
+        """mark a session as used by a read: sessions age from their last use, the folder mtime, and their registry
+        entry is renewed with it"""
+        if session_id.startswith(".") or os.path.basename(session_id) != session_id:
+            return
+        session_path = os.path.join(self.workspace, session_id)
+        try:
+            if time.time() - os.stat(session_path).st_mtime < TOUCH_INTERVAL:
+                return
+            os.utime(session_path)
+        except OSError:
+            return
+        session_registry.register(self.name, session_id)
+
+    def is_session(self, session_id: str) -> bool:
+        """a session folder directly under the workspace, never the workspace itself or its internal folders.
+
+        A session another node just created counts too, while its folder may not be visible here yet.
+        """
+        if session_id.startswith(".") or os.path.basename(session_id) != session_id:
+            return False
+        return os.path.isdir(os.path.join(self.workspace, session_id)) or \
+            session_registry.contains(self.name, session_id)
+
+    def discard(self, session_id: str) -> str:
+        """move a session out of the served tree; returns the folder left to delete"""
+        trash_path = move_aside(os.path.join(self.workspace, session_id), self.trash_folder)
+        session_registry.forget(self.name, session_id)
+        return trash_path
+
+    def empty_trash(self):
+        if os.path.isdir(self.trash_folder):
+            for name in os.listdir(self.trash_folder):
+                shutil.rmtree(os.path.join(self.trash_folder, name), ignore_errors=True)
+
+    def reap(self) -> int:
+        """drop expired sessions, then least recently used ones until the quota holds; runs on the I/O pool.
+
+        Workers sharing the workspace take turns through a lease, so one of them reaps at a time.
+        """
+        now = time.time()
+        if not session_registry.acquire_lease(f"reaper:{self.name}", self.interval * 3):
+            return 0
+        session_registry.expire(self.name, now - self.ttl)
+        sessions = sorted(self.scan())
+        total_bytes = sum(size for _, _, size in sessions)
+        removed = 0
+        """entries of the shared folders are not sessions; they count towards the quota only"""
+        live_sessions = sum(1 for _, session_id, _ in sessions if not os.path.dirname(session_id))
+        for last_used, session_id, size in sessions:
+            if now - last_used <= self.ttl and total_bytes <= self.max_bytes:
+                continue
+            if self.in_use(session_id, last_used, now):
+                continue
+            try:
+                self.discard(session_id)
+            except OSError:
+                continue
+            total_bytes -= size
+            removed += 1
+            self.reaped_bytes += size
+            if not os.path.dirname(session_id):
+                live_sessions -= 1
+        self.empty_trash()
+
+        self.reaped += removed
+        self.live_sessions = live_sessions
+        self.live_bytes = total_bytes
+        self.last_run = now
+        return removed
+
+    async def remove(self, session_id: str):
+        """take a session out of service straight away and delete its files in the background, once the timed-out
+        jobs of this session, if any, have ended"""
+        session_path = os.path.join(self.workspace, session_id)
+        overdue = overdue_jobs(session_path)
+        trash_path = await session_pool.run(self.discard, session_id)
+        remove_later(overdue, [trash_path, session_path] if overdue else [trash_path])
+
+    async def run(self):
+        while True:
+            try:
+                await session_pool.run(self.reap)
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None and os.path.isdir(self.workspace):
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        """the reaped counters are this process's own, from the runs it won the lease for; the live figures are from
+        the last of those runs, and registered_sessions is read from the shared registry"""
+        return {"live_sessions": self.live_sessions, "registered_sessions": session_registry.count(self.name),
+                "live_bytes": self.live_bytes, "reaped_sessions": self.reaped, "reaped_bytes": self.reaped_bytes,
+                "ttl": self.ttl, "max_bytes": self.max_bytes, "last_run": self.last_run, "process": node_name()}
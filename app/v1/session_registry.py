@@ -0,0 +1,105 @@
+import threading
+import sqlite3
+import socket
+import time
+import os
+
+from app.v1 import config
+
+"""sessions created by any worker or node, and leases that let one worker at a time do cluster-wide chores.
+
+A session folder stays the record of a session; the registry answers for sessions another node created whose folder
+this node cannot see yet, since network filesystems cache directory lookups. Entries are dropped once the session
+TTL has passed. Other backends subclass SessionRegistry and are picked in open_registry."""
+
+
+def node_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SessionRegistry:
+    """no shared registry: each worker goes by the session folders it can see"""
+    def register(self, workspace: str, session_id: str):
+        pass
+
+    def forget(self, workspace: str, session_id: str):
+        pass
+
+    def contains(self, workspace: str, session_id: str) -> bool:
+        return False
+
+    def expire(self, workspace: str, created_before: float):
+        pass
+
+    def count(self, workspace: str):
+        return None
+
+    def acquire_lease(self, name: str, seconds: float) -> bool:
+        return True
+
+
+class SqliteSessionRegistry(SessionRegistry):
+    """a SQLite file on shared storage. It uses the default rollback journal, because WAL needs shared memory, which
+    network filesystems do not provide"""
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS sessions (workspace TEXT NOT NULL, session_id TEXT NOT NULL, node TEXT NOT NULL, "
+        "created REAL NOT NULL, PRIMARY KEY (workspace, session_id))",
+        "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires REAL NOT NULL)",
+    )
+
+    def __init__(self, path: str, timeout: float):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """one autocommit connection per thread; every statement is its own transaction"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    def register(self, workspace: str, session_id: str):
+        self.connection().execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                                  (workspace, session_id, node_name(), time.time()))
+
+    def forget(self, workspace: str, session_id: str):
+        self.connection().execute("DELETE FROM sessions WHERE workspace = ? AND session_id = ?",
+                                  (workspace, session_id))
+
+    def contains(self, workspace: str, session_id: str) -> bool:
+        return self.connection().execute("SELECT 1 FROM sessions WHERE workspace = ? AND session_id = ?",
+                                         (workspace, session_id)).fetchone() is not None
+
+    def expire(self, workspace: str, created_before: float):
+        self.connection().execute("DELETE FROM sessions WHERE workspace = ? AND created < ?",
+                                  (workspace, created_before))
+
+    def count(self, workspace: str):
+        return self.connection().execute("SELECT COUNT(*) FROM sessions WHERE workspace = ?",
+                                         (workspace,)).fetchone()[0]
+
+    def acquire_lease(self, name: str, seconds: float) -> bool:
+        """take the lease when it is free or lapsed; the holder extends it each time it asks again"""
+        now = time.time()
+        cursor = self.connection().execute(
+            "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, "
+            "expires = excluded.expires WHERE leases.holder = excluded.holder OR leases.expires < ?",
+            (name, node_name(), now + seconds, now))
+        return cursor.rowcount == 1
+
+
+def open_registry(url: str) -> SessionRegistry:
+    """sqlite:///relative/path or sqlite:////absolute/path; empty for none"""
+    if not url:
+        return SessionRegistry()
+    if url.startswith("sqlite:///"):
+        return SqliteSessionRegistry(url[len("sqlite:///"):], config.SESSION_REGISTRY_TIMEOUT)
+    raise ValueError(f"Unsupported session registry {url}")
+
+
+session_registry = open_registry(config.SESSION_REGISTRY)
@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+import mimetypes
+import hashlib
+import gzip
+import os
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from app.v1.jobs import write_json, read_json
+from app.v1 import config
+
+"""content hash and compressed variants of every finished artifact in a folder"""
+MANIFEST_FILE = ".static.json"
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+"""a session never changes once its artifacts are written, and a new comparison gets a new session id"""
+IMMUTABLE = "public, max-age=31536000, immutable"
+"""what the static mount serves: artifacts with a manifest entry, and the stylesheets and images the exported pages
+link. Inputs, the result cache, job records, manifests and the other internal files are never served; the only
+dotted folder with public content is the docx exports shared by content hash"""
+ASSET_EXTENSIONS = (".css", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".bmp")
+PUBLIC_DOT_FOLDERS = (".originals",)
+CHUNK_BYTES = 1024 * 1024
+_manifests = {}
+
+
+def static_encodings() -> list:
+    return [encoding for encoding in config.STATIC_ENCODINGS
+            if encoding in ENCODING_SUFFIXES and (encoding != "br" or brotli is not None)]
+
+
+def precompress(path: str):
+    """write compressed variants next to a finished artifact and record its content hash for the ETag"""
+    encodings = static_encodings() if os.path.getsize(path) >= config.STATIC_MIN_COMPRESS_BYTES else []
+    digest = hashlib.sha256()
+    gzip_file = gzip.GzipFile(f"{path}.gz", "wb", compresslevel=config.STATIC_GZIP_LEVEL, mtime=0) \
+        if "gzip" in encodings else None
+    brotli_file = open(f"{path}.br", "wb") if "br" in encodings else None
+    compressor = brotli.Compressor(quality=config.STATIC_BROTLI_QUALITY) if brotli_file else None
+    try:
+        with open(path, "rb") as source:
+            while chunk := source.read(CHUNK_BYTES):
+                digest.update(chunk)
+                if gzip_file:
+                    gzip_file.write(chunk)
+                if compressor:
+                    brotli_file.write(compressor.process(chunk))
+        if compressor:
+            brotli_file.write(compressor.finish())
+    finally:
+        for file in (gzip_file, brotli_file):
+            if file:
+                file.close()
+
+    manifest_path = os.path.join(os.path.dirname(path), MANIFEST_FILE)
+    with locked(manifest_path):
+        manifest = read_json(manifest_path) or {}
+        manifest[os.path.basename(path)] = {"sha256": digest.hexdigest(), "encodings": encodings}
+        write_json(manifest_path, manifest)
+
+
+@contextmanager
+def locked(path: str):
+    """hold an exclusive lock on path.lock; the workers sharing a workspace update a manifest one at a time"""
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def precompress_export(html_path: str):
+    """an HTML export and the stylesheet Spire writes beside it"""
+    precompress(html_path)
+    stylesheet = f"{os.path.splitext(html_path)[0]}_styles.css"
+    if os.path.isfile(stylesheet):
+        precompress(stylesheet)
+
+
+def manifest_entry(path: str):
+    """manifests are cached per folder until the folder's manifest changes"""
+    folder, name = os.path.split(path)
+    manifest_path = os.path.join(folder, MANIFEST_FILE)
+    try:
+        modified = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _manifests.get(folder)
+    if cached is None or cached[0] != modified:
+        if len(_manifests) >= config.STATIC_MANIFEST_CACHE:
+            _manifests.clear()
+        cached = _manifests[folder] = (modified, read_json(manifest_path) or {})
+    return cached[1].get(name)
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, parameters = part.partition(";")
+        quality = parameters.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def is_public(directory: str, path: str) -> bool:
+    parts = path.split(os.sep)
+    if any(part.startswith(".") and part not in PUBLIC_DOT_FOLDERS for part in parts):
+        return False
+    if os.path.splitext(path)[1].lower() in ASSET_EXTENSIONS:
+        return True
+    return manifest_entry(os.path.join(directory, path)) is not None
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that hands out precompressed variants of artifacts, with strong ETags and immutable caching.
+
+    Only published artifacts are served; assets without a manifest entry, like the logo, are served the usual way.
+    """
+    async def get_response(self, path: str, scope):
+        if not is_public(str(self.directory), path):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        entry = manifest_entry(str(full_path))
+        if entry is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((encoding for encoding in ENCODING_SUFFIXES
+                         if encoding in entry["encodings"] and encoding in accepted), None)
+        """each representation has its own strong validator"""
+        etag = f'"{entry["sha256"]}-{encoding}"' if encoding else f'"{entry["sha256"]}"'
+        headers = {"etag": etag, "cache-control": IMMUTABLE, "vary": "Accept-Encoding"}
+        if etag in [tag.strip().removeprefix("W/") for tag in request_headers.get("if-none-match", "").split(",")]:
+            return NotModifiedResponse(Headers(headers))
+
+        if encoding is None:
+            return FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+        variant = f"{full_path}{ENCODING_SUFFIXES[encoding]}"
+        if not os.path.isfile(variant):
+            return FileResponse(full_path, status_code=status_code, headers={**headers, "etag": f'"{entry["sha256"]}"'},
+                                stat_result=stat_result)
+        return FileResponse(variant, status_code=status_code, headers={**headers, "content-encoding": encoding},
+                            media_type=mimetypes.guess_type(str(full_path))[0] or "text/plain")
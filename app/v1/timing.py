@@ -0,0 +1,17 @@
+from contextlib import contextmanager
+import time
+
+
+class StageTimer:
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """record wall-clock duration of a pipeline stage in milliseconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = round(self.timings.get(name, 0) + elapsed, 2)
@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+import multiprocessing
+import threading
+import asyncio
+import shutil
+import uuid
+import os
+
+from app.v1.metrics import profile_if_slow
+from app.v1 import config
+
+
+class RemoteHTTPException(Exception):
+    """picklable stand-in for an HTTPException raised inside a worker process"""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def invoke(func, *args):
+    try:
+        if config.METRICS_PROFILE_SLOW_SECONDS > 0:
+            return profile_if_slow(func, *args)
+        return func(*args)
+    except HTTPException as error:
+        raise RemoteHTTPException(error.status_code, error.detail)
+
+
+class WorkerPool:
+    def __init__(self, kind: str, max_workers: int, max_queue, timeout: float):
+        """max_queue None admits every job"""
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pending = 0
+        """timed-out jobs still running, with the session folder each one writes into"""
+        self.overdue = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                """spawn keeps native libraries (Spire, openpyxl C extensions) out of forked state"""
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="compare-io")
+        return self._executor
+
+    def ensure_capacity(self):
+        if self.max_queue is not None and self.pending >= self.max_workers + self.max_queue:
+            raise HTTPException(status_code=503, detail="Comparison queue is full, retry later",
+                                headers={"Retry-After": "5"})
+
+    def submit(self, func, *args):
+        """admit a job or reject it straight away when the queue is full"""
+        with self._lock:
+            self.ensure_capacity()
+            self.pending += 1
+        try:
+            future = self.executor.submit(invoke, func, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, func, *args, session: str = None):
+        """session is the folder the job writes into, if any; removing that folder waits for the job"""
+        future = self.submit(func, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            """a queued job is cancelled; a running one cannot be stopped without killing the workers of unrelated
+            jobs, so it keeps its slot and is tracked until it ends, and remove_folder of its session waits for it"""
+            if not future.cancel():
+                with self._lock:
+                    self.overdue[future] = session
+                future.add_done_callback(self._settle)
+            raise HTTPException(status_code=504, detail=f"Comparison did not finish within {self.timeout:g} seconds")
+        except RemoteHTTPException as error:
+            raise HTTPException(status_code=error.status_code, detail=error.detail)
+        except BrokenProcessPool:
+            self._executor = None
+            raise HTTPException(status_code=500, detail="Comparison worker crashed")
+
+    def _release(self, future=None):
+        with self._lock:
+            self.pending -= 1
+
+    def _settle(self, future):
+        with self._lock:
+            self.overdue.pop(future, None)
+
+    def overdue_jobs(self, path: str) -> list:
+        """timed-out jobs writing into path, into a folder inside it or into a folder that holds it"""
+        path = os.path.abspath(path)
+        with self._lock:
+            return [future for future, session in self.overdue.items()
+                    if session is not None and os.path.commonpath([path, os.path.abspath(session)]) in
+                    (path, os.path.abspath(session))]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+"""threads for GIL-releasing file work, processes for openpyxl/pandas/Spire, and threads of their own for the cheap
+session reads and removals and for the writes of uploads, which are never turned away by a full comparison queue"""
+io_pool = WorkerPool("thread", config.COMPARE_IO_WORKERS, config.COMPARE_QUEUE_DEPTH, config.COMPARE_JOB_TIMEOUT)
+cpu_pool = WorkerPool("process", config.COMPARE_CPU_WORKERS, config.COMPARE_QUEUE_DEPTH, config.COMPARE_JOB_TIMEOUT)
+session_pool = WorkerPool("thread", config.COMPARE_IO_WORKERS, None, config.COMPARE_JOB_TIMEOUT)
+upload_pool = WorkerPool("thread", config.COMPARE_IO_WORKERS, None, config.COMPARE_JOB_TIMEOUT)
+
+"""removed folders are renamed in here, beside them, first so they disappear at once and are deleted later"""
+TRASH_FOLDER = ".trash"
+"""keep references to deferred removals so the event loop does not garbage collect them"""
+_removals = set()
+
+
+def overdue_jobs(path: str) -> list:
+    return io_pool.overdue_jobs(path) + cpu_pool.overdue_jobs(path)
+
+
+def move_aside(path: str, trash_folder: str = None) -> str:
+    """rename a folder into a trash folder, by default the one next to it; returns the path left to delete"""
+    trash_folder = trash_folder or os.path.join(os.path.dirname(os.path.abspath(path)), TRASH_FOLDER)
+    os.makedirs(trash_folder, exist_ok=True)
+    trash_path = os.path.join(trash_folder, f"{os.path.basename(os.path.normpath(path))}-{uuid.uuid4().hex}")
+    os.rename(path, trash_path)
+    return trash_path
+
+
+async def remove_folders_after(futures: list, paths: list):
+    if futures:
+        await asyncio.wait([asyncio.wrap_future(future) for future in futures])
+    for path in paths:
+        await session_pool.run(shutil.rmtree, path, True)
+
+
+def remove_later(futures: list, paths: list):
+    """delete folders in the background once the given jobs have ended"""
+    task = asyncio.create_task(remove_folders_after(futures, paths))
+    _removals.add(task)
+    task.add_done_callback(_removals.discard)
+
+
+async def remove_folder(path: str):
+    """delete a session folder. While a timed-out job of that session may still write into it, the folder is moved
+    aside at once and deleted when the job ends, along with anything the job wrote back in its place"""
+    overdue = overdue_jobs(path)
+    if not overdue:
+        await session_pool.run(shutil.rmtree, path, True)
+        return
+    try:
+        trash_path = await session_pool.run(move_aside, path)
+    except OSError:
+        trash_path = None
+    remove_later(overdue, [folder for folder in (trash_path, path) if folder is not None])
+
+
+def shutdown():
+    io_pool.shutdown()
+    cpu_pool.shutdown()
+    session_pool.shutdown()
+    upload_pool.shutdown()
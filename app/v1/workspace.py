@@ -0,0 +1,106 @@
+from fastapi import HTTPException
+import shutil
+import errno
+import json
+import os
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from app.v1.result_cache import file_digest
+from app.v1 import config
+
+"""ioctl request number of FICLONE on Linux: share the extents of a file on copy-on-write filesystems"""
+FICLONE = 0x40049409
+REFERENCE_SUFFIX = ".ref.json"
+"""a hard link shares the file with the caller, so later edits of the source show up in the session; only on request"""
+STRATEGIES = {
+    "auto": ["reflink", "copy"],
+    "reflink": ["reflink", "copy"],
+    "hardlink": ["hardlink", "copy"],
+    "reference": ["reference", "copy"],
+    "copy": ["copy"],
+}
+
+
+def reflink(source: str, target: str):
+    """the target is created exclusively, so an existing file is never truncated; on failure only our file is removed"""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+    with open(source, "rb") as source_file, open(target, "xb") as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            target_file.close()
+            os.remove(target)
+            raise
+
+
+def hardlink(source: str, target: str):
+    os.link(source, target)
+
+
+def reference(source: str, target: str):
+    """record where the document lives instead of placing its bytes in the session"""
+    stat = os.stat(source)
+    with open(f"{target}{REFERENCE_SUFFIX}", "x") as file:
+        json.dump({"path": os.path.abspath(source), "sha256": file_digest(source),
+                   "signature": [stat.st_ino, stat.st_size, stat.st_mtime_ns]}, file)
+
+
+def copy(source: str, target: str):
+    with open(source, "rb") as source_file, open(target, "xb") as target_file:
+        try:
+            shutil.copyfileobj(source_file, target_file)
+        except OSError:
+            target_file.close()
+            os.remove(target)
+            raise
+    shutil.copymode(source, target)
+
+
+PLACEMENTS = {"reflink": reflink, "hardlink": hardlink, "reference": reference, "copy": copy}
+
+
+def session_document(session_workspace: str, side: int, source: str) -> str:
+    """where the document of one side lives in a session: uploads stay where they were written, other inputs get a
+    name of their own per side, so two inputs with the same file name never land on the same path"""
+    if os.path.dirname(os.path.abspath(source)) == os.path.abspath(session_workspace):
+        return source
+    return os.path.join(session_workspace, f"{side}_{os.path.basename(source)}")
+
+
+def place_document(source: str, session_workspace: str, side: int, strategy: str = None) -> str:
+    """put a document into a session with the cheapest method that works, copying only as a last resort"""
+    target = session_document(session_workspace, side, source)
+    if target == source:
+        """uploaded straight into the session"""
+        return "in_place"
+    methods = STRATEGIES[strategy or config.WORKSPACE_STRATEGY]
+    for method in methods:
+        try:
+            PLACEMENTS[method](source, target)
+            return method
+        except OSError as error:
+            if method == methods[-1] or error.errno == errno.ENOENT:
+                raise
+
+
+def resolve_document(path: str) -> str:
+    """path to read a placed document from; references are checked against the content hash they were made with"""
+    reference_file = f"{path}{REFERENCE_SUFFIX}"
+    if os.path.exists(path) or not os.path.exists(reference_file):
+        return path
+
+    with open(reference_file) as file:
+        document = json.load(file)
+    try:
+        stat = os.stat(document["path"])
+    except OSError:
+        raise HTTPException(status_code=404, detail=f"{document['path']} not found.")
+    """an unchanged stat signature is taken as proof, otherwise the content has to match"""
+    if [stat.st_ino, stat.st_size, stat.st_mtime_ns] != document["signature"] and \
+            file_digest(document["path"]) != document["sha256"]:
+        raise HTTPException(status_code=409, detail=f"{document['path']} changed during the comparison")
+    return document["path"]
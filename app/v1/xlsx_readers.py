@@ -0,0 +1,214 @@
+from xml.etree.ElementTree import iterparse
+from openpyxl import load_workbook
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.numbers import builtin_format_code, is_date_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import from_excel, from_ISO8601, WINDOWS_EPOCH, MAC_EPOCH
+import posixpath
+import zipfile
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+from app.v1 import config
+
+"""SpreadsheetML and relationship namespaces used inside the xlsx package"""
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+"""sheets are numbered among the worksheets only, as pandas' read_excel numbers them; chartsheets hold no cells"""
+WORKSHEET_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+DIGITS = "0123456789"
+COLUMN_INDEXES = {}
+
+
+class OpenpyxlReader:
+    """openpyxl in read-only mode; slowest, but the reference the other readers are checked against"""
+    def __init__(self, path: str):
+        self.workbook = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+        self.sheetnames = [sheet.title for sheet in self.workbook.worksheets]
+
+    def iter_rows(self, sheet_number: int):
+        sheet = self.workbook.worksheets[sheet_number - 1]
+        sheet.reset_dimensions()
+        return sheet.iter_rows(values_only=True)
+
+    def close(self):
+        self.workbook.close()
+
+
+class SaxReader:
+    """streams one worksheet part straight out of the zip, producing the values openpyxl would"""
+    def __init__(self, path: str):
+        self.archive = zipfile.ZipFile(path)
+        try:
+            self.sheetnames, self.sheet_parts, self.epoch = self.read_workbook()
+            self.date_formats = self.read_styles()
+            self.shared_strings = None
+        except Exception:
+            self.archive.close()
+            raise
+
+    def read_workbook(self):
+        targets = {}
+        with self.archive.open("xl/_rels/workbook.xml.rels") as source:
+            for _, element in iterparse(source):
+                if element.tag == f"{PACKAGE_REL_NS}Relationship" and element.get("Type") == WORKSHEET_TYPE:
+                    target = element.get("Target")
+                    if target.startswith("/"):
+                        target = target[1:]
+                    else:
+                        target = posixpath.normpath(posixpath.join("xl", target))
+                    targets[element.get("Id")] = target
+
+        names, parts, epoch = [], [], WINDOWS_EPOCH
+        with self.archive.open("xl/workbook.xml") as source:
+            for _, element in iterparse(source):
+                if element.tag == f"{MAIN_NS}sheet" and element.get(f"{REL_NS}id") in targets:
+                    names.append(element.get("name"))
+                    parts.append(targets[element.get(f"{REL_NS}id")])
+                elif element.tag == f"{MAIN_NS}workbookPr" and element.get("date1904") in ("1", "true"):
+                    epoch = MAC_EPOCH
+        return names, parts, epoch
+
+    def read_styles(self):
+        """indexes of the cell styles whose number format is a date"""
+        date_formats = set()
+        if "xl/styles.xml" not in self.archive.namelist():
+            return date_formats
+
+        custom_formats, format_ids = {}, []
+        with self.archive.open("xl/styles.xml") as source:
+            for _, element in iterparse(source):
+                if element.tag == f"{MAIN_NS}numFmt":
+                    custom_formats[int(element.get("numFmtId"))] = element.get("formatCode")
+                elif element.tag == f"{MAIN_NS}cellXfs":
+                    format_ids = [int(xf.get("numFmtId", 0)) for xf in element.iter(f"{MAIN_NS}xf")]
+        for index, format_id in enumerate(format_ids):
+            number_format = custom_formats.get(format_id) or builtin_format_code(format_id)
+            if is_date_format(number_format):
+                date_formats.add(index)
+        return date_formats
+
+    def read_shared_strings(self):
+        if self.shared_strings is None:
+            self.shared_strings = []
+            if "xl/sharedStrings.xml" in self.archive.namelist():
+                with self.archive.open("xl/sharedStrings.xml") as source:
+                    self.shared_strings = read_string_table(source)
+        return self.shared_strings
+
+    def cell_value(self, data_type: str, style: str, value: str):
+        if data_type == "n":
+            number = float(value) if "." in value or "E" in value or "e" in value else int(value)
+            """like openpyxl in read-only mode, duration formats are read as dates too"""
+            if style is not None and int(style) in self.date_formats:
+                try:
+                    return from_excel(number, self.epoch)
+                except (OverflowError, ValueError):
+                    return "#VALUE!"
+            return number
+        if data_type == "s":
+            return self.shared_strings[int(value)]
+        if data_type == "b":
+            return bool(int(value))
+        if data_type == "d":
+            return from_ISO8601(value)
+        return value
+
+    def row_values(self, row) -> tuple:
+        """attributes and children are read in bulk; per-cell lookups are what make element parsing slow"""
+        values = []
+        value_tag, inline_tag, text_tag = f"{MAIN_NS}v", f"{MAIN_NS}is", f"{MAIN_NS}t"
+        for cell in row:
+            reference = style = None
+            data_type = "n"
+            for name, attribute in cell.items():
+                if name == "r":
+                    reference = attribute
+                elif name == "t":
+                    data_type = attribute
+                elif name == "s":
+                    style = attribute
+            if reference:
+                letters = reference.rstrip(DIGITS)
+                column = COLUMN_INDEXES.get(letters) or COLUMN_INDEXES.setdefault(letters, column_index_from_string(letters))
+                if column > len(values) + 1:
+                    values.extend([None] * (column - len(values) - 1))
+
+            value = None
+            for child in cell:
+                if data_type == "inlineStr":
+                    if child.tag == inline_tag:
+                        value = "".join(text.text or "" for text in child.iter(text_tag))
+                elif child.tag == value_tag and child.text:
+                    value = self.cell_value(data_type, style, child.text)
+            values.append(value)
+        return tuple(values)
+
+    def parsed_rows(self, source):
+        """row elements of a worksheet part, discarded once the caller moves on"""
+        row_tag = f"{MAIN_NS}row"
+        if lxml_etree is not None:
+            """lxml filters row elements in C, so cells never surface as separate events"""
+            for _, row in lxml_etree.iterparse(source, events=("end",), tag=row_tag):
+                yield row
+                row.clear()
+                while row.getprevious() is not None:
+                    del row.getparent()[0]
+            return
+
+        for event, element in iterparse(source, events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{MAIN_NS}sheetData":
+                    sheet_data = element
+            elif element.tag == row_tag:
+                yield element
+                sheet_data.clear()
+
+    def iter_rows(self, sheet_number: int):
+        """rows from the first one on, with empty rows for gaps and None for missing cells, like openpyxl"""
+        self.read_shared_strings()
+        next_row = 1
+        with self.archive.open(self.sheet_parts[sheet_number - 1]) as source:
+            for row in self.parsed_rows(source):
+                row_number = int(row.get("r", next_row))
+                while next_row < row_number:
+                    next_row += 1
+                    yield ()
+                next_row = row_number + 1
+                yield self.row_values(row)
+
+    def close(self):
+        self.archive.close()
+
+
+class CalamineReader:
+    """Rust calamine bindings, used only when python-calamine is installed"""
+    def __init__(self, path: str):
+        self.workbook = CalamineWorkbook.from_path(path)
+        self.sheetnames = self.workbook.sheet_names
+
+    def iter_rows(self, sheet_number: int):
+        return iter(self.workbook.get_sheet_by_index(sheet_number - 1).to_python(skip_empty_area=False))
+
+    def close(self):
+        pass
+
+
+READERS = {"openpyxl": OpenpyxlReader, "sax": SaxReader, "calamine": CalamineReader}
+
+
+def reader_available(name: str) -> bool:
+    return name in READERS and (name != "calamine" or CalamineWorkbook is not None)
+
+
+def open_reader(path: str, name: str = None):
+    """open a workbook with the named reader, or the configured one"""
+    return READERS[name or config.EXCEL_READER](path)
@@ -0,0 +1,132 @@
+from openpyxl import Workbook
+from docx import Document
+import datetime
+import random
+import os
+
+"""synthetic documents for the benchmarks; the same seed always gives the same pair of files"""
+WORDS = ("invoice", "contract", "amount", "delivery", "customer", "supplier", "quantity", "payment", "region",
+         "warehouse", "order", "status", "review", "approved", "pending", "shipment", "balance", "account")
+PARAGRAPH_STYLES = ("Normal", "Normal", "Normal", "Heading 1", "List Bullet")
+TABLE_ROWS = 6
+TABLE_COLUMNS = 4
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def cell_value(rng: random.Random, row: int, column: int):
+    """a mix of the types the readers convert: ints, floats, text and dates"""
+    kind = column % 4
+    if kind == 0:
+        return row * 10 + column
+    if kind == 1:
+        return round(rng.uniform(0, 100000), 2)
+    if kind == 2:
+        return f"{rng.choice(WORDS)}-{rng.randrange(1000)}"
+    return datetime.date(2020, 1, 1) + datetime.timedelta(days=rng.randrange(2000))
+
+
+def changed_value(rng: random.Random, value):
+    if isinstance(value, str):
+        return f"{value}-changed"
+    if isinstance(value, datetime.date):
+        return value + datetime.timedelta(days=1 + rng.randrange(30))
+    return value + 1 + rng.randrange(100)
+
+
+def sheet_rows(rng: random.Random, rows: int, columns: int) -> list:
+    header = [f"column_{column + 1}" for column in range(columns)]
+    return [header] + [[cell_value(rng, row, column) for column in range(columns)] for row in range(rows)]
+
+
+def change_rows(rng: random.Random, rows: list, change_density: float) -> list:
+    """change about change_density of the data cells; the header row stays as it is"""
+    changed = [list(rows[0])]
+    for row in rows[1:]:
+        changed.append([changed_value(rng, value) if rng.random() < change_density else value for value in row])
+    return changed
+
+
+def write_workbook(path: str, sheets: list):
+    """write-only mode streams the rows, so big workbooks are generated in constant memory"""
+    workbook = Workbook(write_only=True)
+    for number, rows in enumerate(sheets):
+        sheet = workbook.create_sheet(f"Sheet{number + 1}")
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+
+def generate_workbook_pair(folder: str, rows: int, columns: int, sheets: int = 1, change_density: float = 0.01,
+                           seed: int = 0) -> tuple:
+    """two xlsx workbooks with the same sheets, the second with about change_density of its cells changed"""
+    rng = random.Random(seed)
+    original = [sheet_rows(rng, rows, columns) for _ in range(sheets)]
+    changed = [change_rows(rng, rows_1, change_density) for rows_1 in original]
+    name = f"workbook_{rows}x{columns}x{sheets}_{change_density}_{seed}"
+    path_1, path_2 = os.path.join(folder, f"{name}_1.xlsx"), os.path.join(folder, f"{name}_2.xlsx")
+    write_workbook(path_1, original)
+    write_workbook(path_2, changed)
+    return path_1, path_2
+
+
+def document_blocks(rng: random.Random, paragraphs: int, tables: int) -> list:
+    """("paragraph", style, text) and ("table", rows) entries, with the tables spread evenly over the text"""
+    blocks = [("paragraph", rng.choice(PARAGRAPH_STYLES), sentence(rng, rng.randint(8, 40))) for _ in range(paragraphs)]
+    for number in range(tables):
+        rows = [[f"{rng.choice(WORDS)} {rng.randrange(1000)}" for _ in range(TABLE_COLUMNS)] for _ in range(TABLE_ROWS)]
+        blocks.insert((number + 1) * len(blocks) // (tables + 1), ("table", rows))
+    return blocks
+
+
+def change_blocks(rng: random.Random, blocks: list, change_density: float) -> list:
+    """edit, delete or insert about change_density of the blocks; table edits change one cell"""
+    changed = []
+    for block in blocks:
+        if rng.random() >= change_density:
+            changed.append(block)
+            continue
+        action = rng.choice(("edit", "edit", "delete", "insert"))
+        if action == "delete":
+            continue
+        if action == "insert":
+            changed.append(("paragraph", "Normal", sentence(rng, rng.randint(8, 40))))
+            changed.append(block)
+        elif block[0] == "table":
+            rows = [list(row) for row in block[1]]
+            rows[rng.randrange(TABLE_ROWS)][rng.randrange(TABLE_COLUMNS)] += " changed"
+            changed.append(("table", rows))
+        else:
+            words = block[2].split(" ")
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            changed.append(("paragraph", block[1], " ".join(words)))
+    return changed
+
+
+def write_document(path: str, blocks: list):
+    document = Document()
+    for block in blocks:
+        if block[0] == "table":
+            table = document.add_table(rows=TABLE_ROWS, cols=TABLE_COLUMNS)
+            for row, values in zip(table.rows, block[1]):
+                for cell, value in zip(row.cells, values):
+                    cell.text = value
+        else:
+            document.add_paragraph(block[2], style=block[1])
+    document.save(path)
+
+
+def generate_docx_pair(folder: str, paragraphs: int, tables: int = 0, change_density: float = 0.01,
+                       seed: int = 0) -> tuple:
+    """two docx documents, the second with about change_density of its paragraphs and tables edited, removed or
+    preceded by a new paragraph"""
+    rng = random.Random(seed)
+    original = document_blocks(rng, paragraphs, tables)
+    changed = change_blocks(rng, original, change_density)
+    name = f"document_{paragraphs}x{tables}_{change_density}_{seed}"
+    path_1, path_2 = os.path.join(folder, f"{name}_1.docx"), os.path.join(folder, f"{name}_2.docx")
+    write_document(path_1, original)
+    write_document(path_2, changed)
+    return path_1, path_2
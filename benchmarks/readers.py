@@ -0,0 +1,53 @@
+"""
+Times every available xlsx reader on one sheet of a workbook and checks each against openpyxl.
+
+    python -m benchmarks.readers <file.xlsx> [sheet number] [repeat]
+"""
+import time
+import sys
+
+from app.v1.endpoints.excel_endpoint import convert_cell
+from app.v1.xlsx_readers import READERS, open_reader, reader_available
+
+
+def benchmark(path: str, sheet_number: int = 1, repeat: int = 3):
+    """time every available reader on one sheet and check each returns the same cells as openpyxl"""
+    def read(name):
+        reader = open_reader(path, name)
+        try:
+            return [[convert_cell(value) for value in row] for row in reader.iter_rows(sheet_number)]
+        finally:
+            reader.close()
+
+    def trimmed(rows):
+        """trailing empty cells and rows differ between readers without changing the sheet"""
+        rows = [tuple(row[:max((i + 1 for i, value in enumerate(row) if value != ""), default=0)]) for row in rows]
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    reference = trimmed(read("openpyxl"))
+    results = {}
+    for name in READERS:
+        if not reader_available(name):
+            results[name] = None
+            continue
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = read(name)
+            timings.append(time.perf_counter() - started)
+        results[name] = {"best_s": round(min(timings), 4), "rows": len(rows), "matches_openpyxl": trimmed(rows) == reference}
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python -m benchmarks.readers <file.xlsx> [sheet number] [repeat]")
+    arguments = sys.argv[1:]
+    results = benchmark(arguments[0], *(int(argument) for argument in arguments[1:3]))
+    for name, result in results.items():
+        if result is None:
+            print(f"{name:10} not installed")
+        else:
+            print(f"{name:10} {result['best_s']:9.4f}s  rows={result['rows']}  matches_openpyxl={result['matches_openpyxl']}")
@@ -0,0 +1,296 @@
+"""
+Benchmarks for the Excel and docx comparisons on synthetic documents.
+
+    python -m benchmarks.run --rows 20000 --columns 20 --sheets 3 --paragraphs 2000 --tables 20 --density 0.02
+    python -m benchmarks.run --save before
+    python -m benchmarks.run --compare before
+
+The endpoints are driven in-process through the FastAPI test client, with the result cache off so every run
+compares, and the parse, diff and render stages are also timed directly without the worker pools.
+"""
+import argparse
+import datetime
+import platform
+import resource
+import shutil
+import tempfile
+import json
+import math
+import time
+import sys
+import os
+
+from benchmarks.generators import generate_workbook_pair, generate_docx_pair
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FOLDER = os.path.join(REPOSITORY, "benchmarks", "baselines")
+SCENARIOS = ("excel_endpoint", "excel_workbook_endpoint", "excel_stages", "docx_endpoint", "docx_stages")
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """nearest-rank percentile"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def peak_rss(pid="self"):
+    """high-water mark of the resident set in bytes; VmHWM can be reset, ru_maxrss only covers the whole process life"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid != "self":
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def reset_peak_rss(pid="self"):
+    """writing 5 to clear_refs resets VmHWM to the current RSS (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def worker_pids() -> list:
+    from app.v1.worker_pool import cpu_pool
+    executor = cpu_pool._executor
+    return list(executor._processes) if executor is not None and executor._processes else []
+
+
+def megabytes(size) -> float:
+    return round(size / 1024 ** 2, 1) if size is not None else None
+
+
+def summarize(samples: list, items: int, input_bytes: int) -> dict:
+    p50 = percentile(samples, 0.5)
+    return {"runs": len(samples), "p50_ms": round(p50 * 1000, 2), "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 2), "items": items,
+            "items_per_second": round(items / p50, 1) if p50 else None,
+            "mb_per_second": round(input_bytes / 1024 ** 2 / p50, 2) if p50 else None}
+
+
+def measure(name: str, run, items: int, input_bytes: int, repeat: int, warmup: int) -> dict:
+    """time run() repeat times after warmup runs; run returns seconds per series, "total" being the whole call"""
+    for _ in range(warmup):
+        run()
+    for pid in ["self"] + worker_pids():
+        reset_peak_rss(pid)
+
+    samples = {}
+    for _ in range(repeat):
+        for series, seconds in run().items():
+            samples.setdefault(series, []).append(seconds)
+
+    worker_peaks = [peak for peak in map(peak_rss, worker_pids()) if peak is not None]
+    results = {}
+    for series, values in samples.items():
+        results[name if series == "total" else f"{name}.{series}"] = summarize(values, items, input_bytes)
+    results[name].update({"peak_rss_mb": megabytes(peak_rss()),
+                          "peak_worker_rss_mb": megabytes(max(worker_peaks)) if worker_peaks else None})
+    return results
+
+
+def endpoint_run(client, url: str, body: dict, workspace: str):
+    """one request per run; the session is removed afterwards so repeated runs do not fill the disk"""
+    def run() -> dict:
+        started = time.perf_counter()
+        response = client.post(url, json=body)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} answered {response.status_code}: {response.text}")
+        result = response.json()
+        shutil.rmtree(os.path.join(workspace, result["session_id"]), ignore_errors=True)
+        return {"total": elapsed, **{stage: milliseconds / 1000
+                                     for stage, milliseconds in result.get("timings_ms", {}).items()}}
+    return run
+
+
+def excel_stages_run(path_1: str, path_2: str, scratch: str):
+    """validate, parse, diff and render one sheet pair in this process"""
+    from app.v1.endpoints.excel_endpoint import ExcelFilePath, ExcelComparator, diff_and_render
+    from app.v1.timing import StageTimer
+    file_paths = ExcelFilePath(excel_file_1_path=path_1, excel_file_2_path=path_2)
+
+    def run() -> dict:
+        timer = StageTimer()
+        folder = tempfile.mkdtemp(dir=scratch)
+        started = time.perf_counter()
+        comparator = ExcelComparator(file_paths)
+        comparator.validate_documents(timer)
+        diff_and_render(comparator.dataframe_1, comparator.dataframe_2, file_paths, folder, "/rows",
+                        path_1, 1, path_2, 1, timer)
+        elapsed = time.perf_counter() - started
+        shutil.rmtree(folder, ignore_errors=True)
+        return {"total": elapsed, **{stage: milliseconds / 1000 for stage, milliseconds in timer.timings.items()}}
+    return run
+
+
+def docx_stages_run(path_1: str, path_2: str, scratch: str):
+    """parse, diff and render with the native engine in this process"""
+    from app.v1.endpoints.doc_endpoint import DocxFilePath, compare_docx_native
+    from app.v1.workspace import place_document
+    from app.v1.timing import StageTimer
+    file_paths = DocxFilePath(docx_file_1_path=path_1, docx_file_2_path=path_2, engine="native")
+    """placed the way the endpoint places them, so the comparison finds each side under its session name"""
+    folder = tempfile.mkdtemp(dir=scratch)
+    place_document(path_1, folder, 1, "copy")
+    place_document(path_2, folder, 2, "copy")
+
+    def run() -> dict:
+        timer = StageTimer()
+        started = time.perf_counter()
+        compare_docx_native(file_paths, folder, timer)
+        elapsed = time.perf_counter() - started
+        return {"total": elapsed, **{stage: milliseconds / 1000 for stage, milliseconds in timer.timings.items()}}
+    return run
+
+
+def run_benchmarks(options, scratch: str) -> dict:
+    """generate the documents into the scratch folder, then run every selected scenario"""
+    from fastapi.testclient import TestClient
+    from app.v1.endpoints import excel_endpoint, doc_endpoint
+    import main
+
+    documents = os.path.join(scratch, "documents")
+    os.makedirs(documents)
+    excel_pair = docx_pair = None
+    if any(scenario.startswith("excel") for scenario in options.scenarios):
+        print(f"generating workbooks: {options.rows} rows x {options.columns} columns x {options.sheets} sheets")
+        excel_pair = generate_workbook_pair(documents, options.rows, options.columns, options.sheets,
+                                            options.density, options.seed)
+    if any(scenario.startswith("docx") for scenario in options.scenarios):
+        print(f"generating documents: {options.paragraphs} paragraphs, {options.tables} tables")
+        docx_pair = generate_docx_pair(documents, options.paragraphs, options.tables, options.density, options.seed)
+
+    excel_bytes = sum(map(os.path.getsize, excel_pair)) if excel_pair else 0
+    docx_bytes = sum(map(os.path.getsize, docx_pair)) if docx_pair else 0
+    docx_items = options.paragraphs + options.tables
+    results = {}
+    with TestClient(main.app) as client:
+        def benchmark(name: str, run, items: int, input_bytes: int):
+            print(f"running {name}")
+            results.update(measure(name, run, items, input_bytes, options.repeat, options.warmup))
+
+        if "excel_endpoint" in options.scenarios:
+            benchmark("excel_endpoint", endpoint_run(client, "/v1/generate_url_for_excel_doc", {
+                "excel_file_1_path": excel_pair[0], "excel_file_2_path": excel_pair[1]}, excel_endpoint.EXCEL_WORKSPACE),
+                options.rows, excel_bytes)
+        if "excel_workbook_endpoint" in options.scenarios:
+            benchmark("excel_workbook_endpoint", endpoint_run(client, "/v1/generate_url_for_excel_workbook", {
+                "excel_file_1_path": excel_pair[0], "excel_file_2_path": excel_pair[1]}, excel_endpoint.EXCEL_WORKSPACE),
+                options.rows * options.sheets, excel_bytes)
+        if "excel_stages" in options.scenarios:
+            benchmark("excel_stages", excel_stages_run(*excel_pair, scratch), options.rows, excel_bytes)
+        if "docx_endpoint" in options.scenarios:
+            for engine in options.docx_engines:
+                benchmark(f"docx_endpoint_{engine}", endpoint_run(client, "/v1/generate_url_for_docx", {
+                    "docx_file_1_path": docx_pair[0], "docx_file_2_path": docx_pair[1], "engine": engine},
+                    doc_endpoint.DOCX_WORKSPACE), docx_items, docx_bytes)
+        if "docx_stages" in options.scenarios:
+            benchmark("docx_stages", docx_stages_run(*docx_pair, scratch), docx_items, docx_bytes)
+    return results
+
+
+def print_results(results: dict):
+    columns = ("runs", "p50_ms", "p99_ms", "items_per_second", "mb_per_second", "peak_rss_mb", "peak_worker_rss_mb")
+    width = max(len(name) for name in results)
+    print(f"{'':{width}}  " + "  ".join(f"{column:>18}" for column in columns))
+    for name, result in results.items():
+        print(f"{name:{width}}  " + "  ".join(f"{str(result.get(column, '')):>18}" for column in columns))
+
+
+def baseline_path(name: str) -> str:
+    return name if name.endswith(".json") else os.path.join(BASELINE_FOLDER, f"{name}.json")
+
+
+def compare_results(baseline: dict, parameters: dict, results: dict, tolerance: float) -> list:
+    """print p50 and p99 against the baseline and return the series whose p50 got slower than the tolerance"""
+    regressions = []
+    print(f"\ncompared with the baseline from {baseline['created']}")
+    if baseline["parameters"] != parameters:
+        print("warning: the baseline was taken with other parameters:", json.dumps(baseline["parameters"]))
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        changes = []
+        for metric in ("p50_ms", "p99_ms"):
+            change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0
+            changes.append(f"{metric} {before[metric]} -> {result[metric]} ({change:+.1f}%)")
+        slower = before["p50_ms"] and (result["p50_ms"] - before["p50_ms"]) / before["p50_ms"] > tolerance
+        if slower:
+            regressions.append(name)
+        print(f"{name}: " + ", ".join(changes) + ("  REGRESSION" if slower else ""))
+    return regressions
+
+
+def main(arguments=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the comparison endpoints on synthetic documents")
+    parser.add_argument("--rows", type=int, default=10000, help="data rows per sheet")
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--sheets", type=int, default=3, help="sheets per workbook; the sheet endpoint compares the first")
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--tables", type=int, default=20, help="tables spread over the paragraphs")
+    parser.add_argument("--density", type=float, default=0.01,
+                        help="fraction of cells, paragraphs and tables changed in the second document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="measured runs per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured runs first, which also start the pool workers")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--docx-engines", default="native", help="comma separated docx engines for docx_endpoint")
+    parser.add_argument("--save", metavar="NAME", help="save the results as benchmarks/baselines/NAME.json, or to a .json path")
+    parser.add_argument("--compare", metavar="NAME", help="compare with a saved baseline and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="p50 slowdown counted as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch folder with the documents and sessions")
+    options = parser.parse_args(arguments)
+    options.scenarios = [scenario for scenario in options.scenarios.split(",") if scenario]
+    options.docx_engines = [engine for engine in options.docx_engines.split(",") if engine]
+    unknown = set(options.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios {', '.join(sorted(unknown))}")
+    baseline = None
+    if options.compare:
+        with open(baseline_path(options.compare)) as file:
+            baseline = json.load(file)
+    parameters = {name: getattr(options, name) for name in (
+        "rows", "columns", "sheets", "paragraphs", "tables", "density", "seed", "repeat", "docx_engines")}
+
+    """every run compares from scratch, with the sessions in the scratch folder unless a workspace root is set"""
+    scratch = tempfile.mkdtemp(prefix="docomp-benchmark-")
+    os.environ["RESULT_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("SESSION_REAPER_ENABLED", "0")
+    os.environ.setdefault("WORKSPACE_ROOT", os.path.join(scratch, "static"))
+    try:
+        results = run_benchmarks(options, scratch)
+    finally:
+        if options.keep:
+            print(f"scratch folder kept at {scratch}")
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    print()
+    print_results(results)
+    if options.save:
+        from app.v1 import config
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path(options.save))), exist_ok=True)
+        with open(baseline_path(options.save), "w") as file:
+            json.dump({"created": datetime.datetime.now().isoformat(timespec="seconds"),
+                       "parameters": parameters,
+                       "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                                       "cpus": os.cpu_count(), "cpu_workers": config.COMPARE_CPU_WORKERS,
+                                       "excel_reader": config.EXCEL_READER},
+                       "results": results}, file, indent=2)
+        print(f"\nbaseline saved to {baseline_path(options.save)}")
+    if baseline is not None and compare_results(baseline, parameters, results, options.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,64 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 import uvicorn
+import os
 
-from app.v1.endpoints.excel_endpoint import router as v1_excel_endpoint
-from app.v1.endpoints.doc_endpoint import router as v1_docx_endpoint
+from app.v1.endpoints.excel_endpoint import router as v1_excel_endpoint, excel_session_reaper, excel_result_cache, \
+    EXCEL_WORKSPACE
+from app.v1.endpoints.doc_endpoint import router as v1_docx_endpoint, docx_session_reaper, docx_result_cache, \
+    DOCX_WORKSPACE, legacy_router as docx_legacy_endpoint
+from app.v1.endpoints.csv_endpoint import router as v1_csv_endpoint
+from app.v1.endpoints.batch_endpoint import router as v1_batch_endpoint
+from app.v1.endpoints.upload_endpoint import router as v1_upload_endpoint
+from app.v1.static_files import PrecompressedStaticFiles
+from app.v1.public_urls import BaseUrlMiddleware
+from app.v1 import worker_pool, metrics, config
 
 app = FastAPI()
-app.mount("/static", StaticFiles(directory=r"app\v1\static"), name="static")
+"""the workspaces live under the static folder; with several workers it is on storage they all mount"""
+os.makedirs(EXCEL_WORKSPACE, exist_ok=True)
+os.makedirs(DOCX_WORKSPACE, exist_ok=True)
+"""routes are matched in order, so the redirects of moved static pages come before the static mount"""
+app.include_router(docx_legacy_endpoint)
+app.mount("/static", PrecompressedStaticFiles(directory=config.WORKSPACE_ROOT), name="static")
 app.include_router(v1_excel_endpoint, prefix="/v1")
 app.include_router(v1_docx_endpoint, prefix="/v1")
+app.include_router(v1_csv_endpoint, prefix="/v1")
+app.include_router(v1_batch_endpoint, prefix="/v1")
+app.include_router(v1_upload_endpoint, prefix="/v1")
+app.add_middleware(BaseUrlMiddleware)
+
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.watch_sessions("excel", excel_session_reaper)
+    metrics.watch_sessions("docx", docx_session_reaper)
+    metrics.watch_cache("excel", excel_result_cache)
+    metrics.watch_cache("docx", docx_result_cache)
+    metrics.watch_pool("io", worker_pool.io_pool)
+    metrics.watch_pool("cpu", worker_pool.cpu_pool)
+    metrics.watch_pool("session", worker_pool.session_pool)
+    metrics.watch_pool("upload", worker_pool.upload_pool)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def prometheus_metrics():
+        return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+def start_session_reapers():
+    if config.SESSION_REAPER_ENABLED:
+        excel_session_reaper.start()
+        docx_session_reaper.start()
+
+@app.on_event("shutdown")
+def shutdown_worker_pools():
+    excel_session_reaper.stop()
+    docx_session_reaper.stop()
+    worker_pool.shutdown()
 
 if __name__ == '__main__':
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if config.SERVER_MODE == "production":
+        """each worker is its own process with its own pools; sessions are shared through the workspace root and
+        the session registry"""
+        uvicorn.run("main:app", host=config.SERVER_HOST, port=config.SERVER_PORT, workers=config.SERVER_WORKERS)
+    else:
+        uvicorn.run("main:app", host=config.SERVER_HOST, port=config.SERVER_PORT, reload=True)
@@ -0,0 +1,6 @@
+import tempfile
+import os
+
+"""the app reads its settings on import: sessions go to a scratch workspace and nothing runs in the background"""
+os.environ.setdefault("WORKSPACE_ROOT", tempfile.mkdtemp(prefix="docomp-tests-"))
+os.environ.setdefault("SESSION_REAPER_ENABLED", "0")
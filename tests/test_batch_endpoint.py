@@ -0,0 +1,41 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.v1 import config
+from tests.test_excel_endpoint import write_workbook
+import main
+
+
+def compare_batch(client, pairs: list) -> dict:
+    response = client.post("/v1/compare_batch", json={"pairs": pairs})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return {line["index"]: line for line in lines}
+
+
+def test_duplicate_pairs_are_compared_once(tmp_path):
+    pair = {"kind": "excel", "excel_file_1_path": write_workbook(tmp_path / "1.xlsx", [["a"], [1]]),
+            "excel_file_2_path": write_workbook(tmp_path / "2.xlsx", [["a"], [2]])}
+    missing = {"kind": "csv", "csv_file_1_path": str(tmp_path / "missing.csv"),
+               "csv_file_2_path": str(tmp_path / "missing.csv")}
+    with TestClient(main.app) as client:
+        lines = compare_batch(client, [pair, pair, missing])
+        assert len(lines) == 3
+        assert lines[0]["status"] == lines[1]["status"] == "done"
+        assert lines[1]["duplicate_of"] == 0 and "duplicate_of" not in lines[0]
+        assert lines[0]["session_id"] == lines[1]["session_id"]
+        assert (lines[2]["status"], lines[2]["status_code"]) == ("failed", 404)
+
+        """the next batch is answered from the result cache"""
+        again = compare_batch(client, [pair])[0]
+        assert again["cached"] is True and again["session_id"] == lines[0]["session_id"]
+
+
+def test_batch_limits(monkeypatch):
+    monkeypatch.setattr(config, "BATCH_MAX_PAIRS", 1)
+    pair = {"kind": "docx", "docx_file_1_path": "1.docx", "docx_file_2_path": "2.docx"}
+    with TestClient(main.app) as client:
+        assert client.post("/v1/compare_batch", json={"pairs": []}).status_code == 400
+        assert client.post("/v1/compare_batch", json={"pairs": [pair, pair]}).status_code == 413
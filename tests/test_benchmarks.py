@@ -0,0 +1,9 @@
+from benchmarks import run
+
+
+def test_every_scenario_runs_once(monkeypatch):
+    """tiny documents, one measured run per scenario: catches the benchmarks drifting from the app"""
+    monkeypatch.setenv("RESULT_CACHE_ENABLED", "0")
+    monkeypatch.setattr("app.v1.config.RESULT_CACHE_ENABLED", False)
+    assert run.main(["--rows", "20", "--columns", "4", "--sheets", "2", "--paragraphs", "12", "--tables", "1",
+                     "--repeat", "1", "--warmup", "0"]) == 0
@@ -0,0 +1,56 @@
+import os
+
+from app.v1.csv_diff import CsvSource, MATCH_FOLDER, compare_csv_files
+from app.v1.excel_row_store import read_row_window, export_row_store
+
+
+def write_csv(path, rows: list) -> str:
+    path.write_text("\n".join(",".join(row) for row in rows) + "\n")
+    return str(path)
+
+
+def compare(tmp_path, name: str, key_columns: list, partition_bytes: int) -> dict:
+    rows_1 = [["id", "v"]] + [[str(row), str(row * 2)] for row in range(50)] + [["7", "dup"]]
+    rows_2 = [["id", "v"]] + [[str(row), str(row * 2 if row % 10 else -1)] for row in range(3, 60)] + [["7", "dup"]]
+    source_1 = CsvSource(write_csv(tmp_path / "1.csv", rows_1), ",", "utf-8", 8)
+    source_2 = CsvSource(write_csv(tmp_path / "2.csv", rows_2), ",", "utf-8", 8)
+    session_path = tmp_path / name
+    session_path.mkdir()
+    summary = compare_csv_files(source_1, source_2, str(session_path), key_columns, partition_bytes=partition_bytes)
+    assert not os.path.exists(session_path / MATCH_FOLDER)
+    return summary, read_row_window(str(session_path), 0, 1000)
+
+
+def test_partitions_do_not_change_the_result(tmp_path):
+    for key_columns in ([], ["id"]):
+        single, single_rows = compare(tmp_path, f"single_{len(key_columns)}", key_columns, 1 << 30)
+        many, many_rows = compare(tmp_path, f"many_{len(key_columns)}", key_columns, 64)
+        assert single == many
+        assert single_rows == many_rows
+
+
+def test_key_matching_counts(tmp_path):
+    summary, window = compare(tmp_path, "key", ["id"], 64)
+    assert (summary["deleted_rows"], summary["inserted_rows"], summary["modified_rows"]) == (3, 10, 4)
+    assert summary["rows_compared"] == 61
+    assert window["total"] == summary["changed_rows"]
+
+
+def test_export_lists_source_rows(tmp_path):
+    compare(tmp_path, "export", ["id"], 64)
+    lines = "".join(export_row_store(str(tmp_path / "export"))).splitlines()
+    assert lines[0] == "row,state,row_1,row_2,id (1),id (2),v (1),v (2)"
+    assert lines[1] == "0,deleted,0,,0,,0,"
+    assert "modified,10,7,10,10,20,-1" in lines[4]
+
+
+def test_added_columns_do_not_modify_rows(tmp_path):
+    source_1 = CsvSource(write_csv(tmp_path / "1.csv", [["id", "v"], ["1", "a"], ["2", "b"]]), ",", "utf-8", 8)
+    source_2 = CsvSource(write_csv(tmp_path / "2.csv", [["id", "v", "w"], ["1", "a", "x"], ["2", "c", "y"]]),
+                         ",", "utf-8", 8)
+    summary = compare_csv_files(source_1, source_2, str(tmp_path), [])
+    assert (summary["equal_rows"], summary["deleted_rows"], summary["inserted_rows"]) == (1, 1, 1)
+    assert summary["added_columns"] == ["w"]
+    summary = compare_csv_files(source_1, source_2, str(tmp_path), ["id"])
+    assert (summary["equal_rows"], summary["modified_rows"], summary["changed_cells"]) == (1, 1, 1)
+    assert summary["changed_cells_per_column"] == {"v": 1}
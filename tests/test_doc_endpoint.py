@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+from docx import Document as WordDocument
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.v1 import config
+from app.v1.endpoints.doc_endpoint import DOCX_WORKSPACE, ORIGINAL_PIN, ORIGINALS_FOLDER, prepare_original
+from app.v1.result_cache import file_digest
+import main
+
+
+def make_session(session_id: str, pin: dict) -> str:
+    session_workspace = os.path.join(DOCX_WORKSPACE, session_id)
+    os.makedirs(session_workspace, exist_ok=True)
+    with open(os.path.join(session_workspace, ORIGINAL_PIN), "w") as file:
+        json.dump(pin, file)
+    return session_workspace
+
+
+def test_the_old_wrapper_page_url_redirects():
+    make_session("legacy", {"file_1": "/in/first.docx", "file_2": "/in/second.docx"})
+    with TestClient(main.app) as client:
+        response = client.get("/static/docx/legacy/comparison_result.html", follow_redirects=False)
+        assert response.status_code == 301
+        assert response.headers["location"] == "/v1/docx_session/legacy/comparison_result"
+
+        page = client.get("/static/docx/legacy/comparison_result.html").text
+    assert "/in/first.docx" in page and "/in/second.docx" in page
+    assert "Excel Document Path" not in page
+
+
+def write_docx(path, text: str) -> str:
+    document = WordDocument()
+    document.add_paragraph(text)
+    document.save(path)
+    return str(path)
+
+
+def test_sessions_share_the_export_of_the_same_original(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RESULT_CACHE_ENABLED", False)
+    file_1 = write_docx(tmp_path / "1.docx", "first")
+    with TestClient(main.app) as client:
+        urls = []
+        for second in ("second", "third"):
+            file_paths = {"docx_file_1_path": file_1, "docx_file_2_path": write_docx(tmp_path / f"{second}.docx", second),
+                          "engine": "spire"}
+            session_id = client.post("/v1/generate_url_for_docx", json=file_paths).json()["session_id"]
+            response = client.get(f"/v1/docx_session/{session_id}/original", follow_redirects=False)
+            assert response.status_code == 307
+            urls.append(response.headers["location"])
+        assert urls[0] == urls[1]
+        assert urls[0].startswith(f"/static/docx/{ORIGINALS_FOLDER}/")
+        assert "first" in client.get(urls[0]).text
+
+
+def test_a_changed_original_is_not_exported(tmp_path):
+    document = write_docx(tmp_path / "1.docx", "first")
+    session_workspace = make_session("changed-original", {"document": document, "digest": file_digest(document)})
+    assert prepare_original("changed-original")[0] == document
+
+    write_docx(tmp_path / "1.docx", "edited")
+    with pytest.raises(HTTPException) as error:
+        prepare_original("changed-original")
+    assert error.value.status_code == 410
+    os.remove(os.path.join(session_workspace, ORIGINAL_PIN))
+    with pytest.raises(HTTPException) as error:
+        prepare_original("changed-original")
+    assert error.value.status_code == 404
+
+
+def test_a_native_session_serves_its_change_list(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RESULT_CACHE_ENABLED", False)
+    file_paths = {"docx_file_1_path": write_docx(tmp_path / "1.docx", "first"),
+                  "docx_file_2_path": write_docx(tmp_path / "2.docx", "second"), "engine": "native"}
+    with TestClient(main.app) as client:
+        result = client.post("/v1/generate_url_for_docx", json=file_paths).json()
+        assert result["summary"]["changed_blocks"] == 2
+        changes = client.get(result["changes_url"]).json()
+        assert (changes["file_1"], changes["file_2"]) == (file_paths["docx_file_1_path"], file_paths["docx_file_2_path"])
+        page = client.get(result["comparison_result_url"], follow_redirects=False)
+        assert page.headers["location"] == f"/static/docx/{result['session_id']}/result.html"
+        assert "second" in client.get(page.headers["location"]).text
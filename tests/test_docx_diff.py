@@ -0,0 +1,56 @@
+from docx import Document as WordDocument
+
+from app.v1.docx_diff import read_blocks, compare_blocks
+
+
+def write_document(path, paragraphs: list, table: list = None) -> str:
+    document = WordDocument()
+    for text in paragraphs:
+        if isinstance(text, tuple):
+            document.add_paragraph().add_run(text[0]).bold = True
+        else:
+            document.add_paragraph(text)
+    if table:
+        word_table = document.add_table(rows=len(table), cols=len(table[0]))
+        for row, values in enumerate(table):
+            for column, value in enumerate(values):
+                word_table.cell(row, column).text = value
+    document.save(path)
+    return str(path)
+
+
+def compare(tmp_path, paragraphs_1, paragraphs_2, table_1=None, table_2=None) -> dict:
+    blocks_1 = read_blocks(write_document(tmp_path / "1.docx", paragraphs_1, table_1))
+    blocks_2 = read_blocks(write_document(tmp_path / "2.docx", paragraphs_2, table_2))
+    return compare_blocks(blocks_1, blocks_2)
+
+
+def test_blocks_are_read_in_order(tmp_path):
+    blocks = read_blocks(write_document(tmp_path / "1.docx", ["one", ("two",)], [["a", "b"]]))
+    assert [(block["kind"], block["text"]) for block in blocks] == \
+        [("paragraph", "one"), ("paragraph", "two"), ("table", "a\tb")]
+    assert blocks[1]["runs"] == [["two", True, False, False]]
+
+
+def test_block_states(tmp_path):
+    result = compare(tmp_path, ["kept", "the quick brown fox jumps", "dropped entirely"],
+                     ["kept", "the quick red fox jumps", "something new"])
+    assert [entry["state"] for entry in result["blocks"]] == ["equal", "modified", "deleted", "inserted"]
+    modified = result["blocks"][1]
+    assert [segment for segment in modified["segments_1"] if segment[1]] == [["brown", True]]
+    assert [segment for segment in modified["segments_2"] if segment[1]] == [["red", True]]
+    assert result["summary"]["changed_blocks"] == 3
+    assert "hash" not in modified["block_1"] and "text_hash" not in modified["block_2"]
+
+
+def test_formatting_and_table_changes(tmp_path):
+    result = compare(tmp_path, ["plain"], [("plain",)], [["a", "b"], ["c", "d"]], [["a", "b"], ["c", "e"]])
+    paragraph, table = result["blocks"]
+    assert (paragraph["state"], paragraph.get("formatting_only")) == ("modified", True)
+    assert (table["state"], table["changed_cells"]) == ("modified", [[1, 1]])
+
+
+def test_identical_documents_have_no_changes(tmp_path):
+    result = compare(tmp_path, ["one", "two"], ["one", "two"])
+    assert result["summary"]["changed_blocks"] == 0
+    assert result["summary"]["equal_blocks"] == 2
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from app.v1.excel_diff import compute_diff, ROW_STATES, INSERTED, DELETED
+
+
+def states(diff) -> list:
+    return [ROW_STATES[state] for state in diff.row_states]
+
+
+def test_hash_alignment_without_common_columns():
+    diff = compute_diff(pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"b": [1, 2, 3]}), "N/A", "hash")
+    assert states(diff) == ["deleted", "deleted", "inserted", "inserted", "inserted"]
+    assert diff.positions_1.tolist() == [0, 1, -1, -1, -1]
+    assert diff.positions_2.tolist() == [-1, -1, 0, 1, 2]
+    assert diff.summary(10)["rows_in_sheet_1"] == 2
+    assert diff.summary(10)["rows_in_sheet_2"] == 3
+
+
+def test_hash_alignment_with_an_empty_sheet():
+    diff = compute_diff(pd.DataFrame(), pd.DataFrame({"b": [1, 2]}), "N/A", "hash")
+    assert np.all(diff.row_states == INSERTED)
+    assert diff.row_slice(2, 0, 2) == [(1,), (2,)]
+
+    diff = compute_diff(pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": []}), "N/A", "hash")
+    assert np.all(diff.row_states == DELETED)
+    assert diff.row_slice(1, 0, 2) == [(1,), (2,)]
+
+
+def test_key_alignment_with_an_empty_sheet():
+    diff = compute_diff(pd.DataFrame({"id": [1, 2]}), pd.DataFrame({"id": []}), "N/A", "key", ["id"])
+    assert states(diff) == ["deleted", "deleted"]
+
+
+def test_added_and_removed_columns_do_not_modify_rows():
+    diff = compute_diff(pd.DataFrame({"a": [1, 2], "b": [3, 4]}), pd.DataFrame({"a": [1, 5], "c": [7, 8]}),
+                        "N/A", "position")
+    assert states(diff) == ["equal", "modified"]
+    assert diff.changed_rows.tolist() == [1]
+    assert diff.cell_changes.tolist() == [[False, False, False], [True, False, False]]
+    summary = diff.summary(10)
+    assert (summary["added_columns"], summary["removed_columns"]) == (["c"], ["b"])
+    assert summary["changed_cells_per_column"] == {"a": 1}
@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+import os
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+
+from app.v1 import config
+from app.v1.endpoints.excel_endpoint import EXCEL_WORKSPACE, ExcelFilePath, ExcelComparator, compare_sheet_pair
+from app.v1.worker_pool import cpu_pool
+from app.v1.timing import StageTimer
+import main
+
+
+def write_workbook(path, rows: list) -> str:
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+class StageLog(StageTimer):
+    def __init__(self):
+        super().__init__()
+        self.entered = []
+
+    @contextmanager
+    def stage(self, name: str):
+        self.entered.append(name)
+        with super().stage(name):
+            yield
+
+
+def test_both_sheets_are_parsed_in_one_stage(tmp_path):
+    file_paths = ExcelFilePath(excel_file_1_path=write_workbook(tmp_path / "1.xlsx", [["a", "b"], [1, 2]]),
+                               excel_file_2_path=write_workbook(tmp_path / "2.xlsx", [["a", "b"], [1, 3]]),
+                               reader="openpyxl")
+    timer = StageLog()
+    comparator = ExcelComparator(file_paths)
+    comparator.validate_documents(timer)
+    assert timer.entered == ["validate", "parse"]
+    assert comparator.dataframe_2["b"].tolist() == [3]
+
+
+def test_cached_job_answers_with_a_status_url(tmp_path):
+    body = {"excel_file_1_path": write_workbook(tmp_path / "1.xlsx", [["a"], [1]]),
+            "excel_file_2_path": write_workbook(tmp_path / "2.xlsx", [["a"], [2]]), "reader": "openpyxl"}
+    with TestClient(main.app) as client:
+        first = client.post("/v1/generate_url_for_excel_doc", json=body).json()
+        cached = client.post("/v1/generate_url_for_excel_doc?job=true", json=body).json()
+        assert (cached["session_id"], cached["status"], cached["cached"]) == (first["session_id"], "done", True)
+        status = client.get(cached["status_url"])
+        assert status.status_code == 200
+        assert (status.json()["status"], status.json()["progress"]) == ("done", 1)
+
+
+def test_reading_rows_marks_the_session_used(tmp_path):
+    body = {"excel_file_1_path": write_workbook(tmp_path / "1.xlsx", [["a"], [1], [2]]),
+            "excel_file_2_path": write_workbook(tmp_path / "2.xlsx", [["a"], [1], [3]]), "reader": "openpyxl"}
+    with TestClient(main.app) as client:
+        session_id = client.post("/v1/generate_url_for_excel_doc", json=body).json()["session_id"]
+        session_path = os.path.join(main.EXCEL_WORKSPACE, session_id)
+        os.utime(session_path, (0, 0))
+        assert client.get(f"/v1/excel_session/{session_id}/rows").json()["total"] == 2
+    assert os.stat(session_path).st_mtime > 0
+
+
+def write_sheets(path, sheets: dict) -> str:
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets.items():
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+def write_workbook_pair(tmp_path) -> dict:
+    return {"excel_file_1_path": write_sheets(tmp_path / "1.xlsx", {"Same": [["a"], [1]], "Changed": [["a"], [1]],
+                                                                   "Blank": [], "Only1": [["a"]]}),
+            "excel_file_2_path": write_sheets(tmp_path / "2.xlsx", {"Same": [["a"], [1]], "Changed": [["a"], [2]],
+                                                                   "Blank": [], "Only2": [["a"]]})}
+
+
+def test_a_workbook_reports_every_sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RESULT_CACHE_ENABLED", False)
+    with TestClient(main.app) as client:
+        response = client.post("/v1/generate_url_for_excel_workbook", json=write_workbook_pair(tmp_path))
+        assert response.status_code == 200
+        sheets = {(sheet["sheet_1"] or sheet["sheet_2"])["name"]: sheet for sheet in response.json()["sheets"]}
+        assert {name: sheet["status"] for name, sheet in sheets.items()} == \
+            {"Same": "equal", "Changed": "changed", "Blank": "blank", "Only1": "removed", "Only2": "added"}
+        assert sheets["Changed"]["summary"]["changed_rows"] == 1
+        assert client.get(sheets["Changed"]["comparison_result_url"]).status_code == 200
+
+
+def test_a_busy_pool_fails_the_whole_workbook(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RESULT_CACHE_ENABLED", False)
+    run = cpu_pool.run
+
+    async def failing_run(func, *args, session=None):
+        if func is compare_sheet_pair:
+            raise HTTPException(status_code=504, detail="timed out")
+        return await run(func, *args, session=session)
+
+    monkeypatch.setattr(cpu_pool, "run", failing_run)
+    sessions = set(os.listdir(EXCEL_WORKSPACE))
+    with TestClient(main.app) as client:
+        response = client.post("/v1/generate_url_for_excel_workbook", json=write_workbook_pair(tmp_path))
+    assert response.status_code == 504
+    assert set(os.listdir(EXCEL_WORKSPACE)) == sessions
+
+
+def test_a_failing_sheet_is_reported_and_not_cached(tmp_path, monkeypatch):
+    run = cpu_pool.run
+
+    async def failing_run(func, *args, session=None):
+        if func is compare_sheet_pair:
+            raise HTTPException(status_code=400, detail="unreadable sheet")
+        return await run(func, *args, session=session)
+
+    monkeypatch.setattr(cpu_pool, "run", failing_run)
+    file_paths = write_workbook_pair(tmp_path)
+    with TestClient(main.app) as client:
+        sheets = client.post("/v1/generate_url_for_excel_workbook", json=file_paths).json()["sheets"]
+        failed = [sheet for sheet in sheets if sheet["status"] == "failed"]
+        assert [sheet["error"] for sheet in failed] == ["unreadable sheet"] * 2
+        assert "cached" not in client.post("/v1/generate_url_for_excel_workbook", json=file_paths).json()
@@ -0,0 +1,31 @@
+import pytest
+
+from app.v1.jobs import JobProgress, read_job_status, record_done
+
+
+def test_stage_files_track_a_job(tmp_path):
+    progress = JobProgress(str(tmp_path))
+    progress.queued()
+    assert read_job_status(str(tmp_path))["status"] == "queued"
+    with progress.stage("validate"):
+        running = read_job_status(str(tmp_path))
+    assert (running["status"], running["stages"]["validate"]["state"]) == ("running", "running")
+    with pytest.raises(ValueError):
+        with progress.stage("copy"):
+            raise ValueError
+    progress.finish("failed", status_code=500, error="copy failed")
+    job = read_job_status(str(tmp_path))
+    assert job["stages"]["validate"]["state"] == "done"
+    assert job["stages"]["copy"]["state"] == "failed"
+    assert (job["status"], job["error"], job["progress"]) == ("failed", "copy failed", 0.2)
+
+
+def test_record_done_keeps_an_existing_record(tmp_path):
+    assert read_job_status(str(tmp_path)) is None
+    record_done(str(tmp_path), {"session_id": "s", "cached": True})
+    assert read_job_status(str(tmp_path))["status"] == "done"
+
+    progress = JobProgress(str(tmp_path / "job"))
+    progress.queued()
+    record_done(str(tmp_path / "job"), {"session_id": "job"})
+    assert read_job_status(str(tmp_path / "job"))["status"] == "queued"
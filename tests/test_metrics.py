@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+
+from app.v1 import config
+from app.v1.metrics import Histogram, server_timing
+from app.v1.session_registry import node_name
+from app.v1.timing import StageTimer
+from tests.test_excel_endpoint import write_workbook
+import main
+
+
+def test_stage_timer_adds_up_repeated_stages():
+    timer = StageTimer()
+    for _ in range(2):
+        with timer.stage("diff"):
+            pass
+    assert list(timer.timings) == ["diff"] and timer.timings["diff"] >= 0
+    assert server_timing({"diff": 1.5}, 0.002) == "diff;dur=1.5, total;dur=2.0"
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test", ("kind",), buckets=(1, 10))
+    for value in (0.5, 5, 50):
+        histogram.observe("excel", value=value)
+    assert histogram.samples() == ['test_seconds_bucket{kind="excel",le="1"} 1',
+                                   'test_seconds_bucket{kind="excel",le="10"} 2',
+                                   'test_seconds_bucket{kind="excel",le="+Inf"} 3',
+                                   'test_seconds_sum{kind="excel"} 55.5',
+                                   'test_seconds_count{kind="excel"} 3']
+
+
+def test_comparisons_show_up_in_the_scrape(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RESULT_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "METRICS_SERVER_TIMING", True)
+    file_paths = {"excel_file_1_path": write_workbook(tmp_path / "1.xlsx", [["a"], [1]]),
+                  "excel_file_2_path": write_workbook(tmp_path / "2.xlsx", [["a"], [2]])}
+    with TestClient(main.app) as client:
+        response = client.post("/v1/generate_url_for_excel_doc", json=file_paths)
+        assert "parse;dur=" in response.headers["server-timing"]
+        missing = {**file_paths, "excel_file_1_path": str(tmp_path / "missing.xlsx")}
+        assert client.post("/v1/generate_url_for_excel_doc", json=missing).status_code == 404
+        scrape = client.get("/metrics").text
+    assert 'docomp_comparisons_total{kind="excel"}' in scrape
+    assert 'docomp_comparison_errors_total{kind="excel",status="404"}' in scrape
+    assert 'docomp_stage_duration_seconds_count{kind="excel",stage="diff"}' in scrape
+    assert f'docomp_process_info{{process="{node_name()}"}} 1' in scrape
+    assert 'docomp_http_requests_total{method="POST",route="/v1/generate_url_for_excel_doc",status="200"}' in scrape
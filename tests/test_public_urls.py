@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+
+from app.v1.public_urls import rebase_urls, request_base_url
+from tests.test_excel_endpoint import write_workbook
+import main
+
+
+def test_links_follow_the_request_host(tmp_path):
+    body = {"excel_file_1_path": write_workbook(tmp_path / "1.xlsx", [["a"], [1]]),
+            "excel_file_2_path": write_workbook(tmp_path / "2.xlsx", [["a"], [2]]), "reader": "openpyxl"}
+    with TestClient(main.app, base_url="http://compare.example") as client:
+        first = client.post("/v1/generate_url_for_excel_doc", json=body).json()
+        cached = client.post("/v1/generate_url_for_excel_doc", json=body, headers={"host": "other.example:8080"}).json()
+    assert first["comparison_result_url"] == \
+        f"http://compare.example/static/excel/{first['session_id']}/comparison_result.html"
+    assert cached["cached"]
+    assert cached["comparison_result_url"] == \
+        f"http://other.example:8080/static/excel/{first['session_id']}/comparison_result.html"
+
+
+def test_stored_links_are_rebased():
+    token = request_base_url.set("https://lb.example/docomp/")
+    try:
+        result = rebase_urls({"session_id": "s", "status_url": "http://old:8000/v1/excel_session/s/status",
+                              "sheets": [{"comparison_result_url": "http://old:8000/static/excel/s/1.html"}]})
+    finally:
+        request_base_url.reset(token)
+    assert result == {"session_id": "s", "status_url": "https://lb.example/docomp/v1/excel_session/s/status",
+                      "sheets": [{"comparison_result_url": "https://lb.example/docomp/static/excel/s/1.html"}]}
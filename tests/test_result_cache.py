@@ -0,0 +1,80 @@
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+from app.v1 import config
+from app.v1.endpoints.excel_endpoint import EXCEL_WORKSPACE, excel_result_cache
+from app.v1.result_cache import CACHED_MARKER, ResultCache, _digest_memo, file_digest
+import main
+
+
+def make_session(workspace, session_id: str, size: int) -> str:
+    session_path = workspace / session_id
+    session_path.mkdir()
+    (session_path / "result.html").write_bytes(b"x" * size)
+    return session_id
+
+
+def test_keys_cover_every_part():
+    key = ResultCache.make_key("excel", "digest", 1, None)
+    assert key == ResultCache.make_key("excel", "digest", 1, None)
+    assert key != ResultCache.make_key("excel", "digest", 2, None)
+    assert key != ResultCache.make_key("excel-workbook", "digest", 1, None)
+    assert ResultCache.make_key("ab", "c") != ResultCache.make_key("a", "bc")
+
+
+def test_least_recently_used_sessions_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=2500, max_age=3600)
+    for name in ("a", "b"):
+        cache.store(name, make_session(tmp_path, name, 1000), {"session_id": name})
+    os.utime(cache.entry_path("a"), (time.time() - 60, time.time() - 60))
+    os.utime(cache.entry_path("b"), (time.time() - 30, time.time() - 30))
+    assert cache.lookup("a") == {"session_id": "a"}
+
+    cache.store("c", make_session(tmp_path, "c", 1000), {"session_id": "c"})
+    assert cache.lookup("b") is None and not os.path.exists(tmp_path / "b")
+    assert cache.lookup("a") is not None and cache.lookup("c") is not None
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 30, max_age=0)
+    cache.store("old", make_session(tmp_path, "old", 10), {})
+    assert cache.lookup("old") is None
+    assert not os.path.exists(tmp_path / "old")
+
+
+def test_the_cached_marker_pins_the_session(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 30, max_age=3600)
+    make_session(tmp_path, "plain", 10)
+    cache.store("key", make_session(tmp_path, "shared", 10), {})
+    assert os.path.isfile(tmp_path / "shared" / CACHED_MARKER)
+    assert cache.holds("shared") and not cache.holds("plain")
+    """an entry replaced by a newer session no longer holds the old one"""
+    cache.store("key", make_session(tmp_path, "newer", 10), {})
+    assert not cache.holds("shared") and cache.holds("newer")
+
+
+def test_removing_a_cached_session_keeps_it_for_other_clients():
+    session_path = os.path.join(EXCEL_WORKSPACE, "cached-session")
+    os.makedirs(session_path)
+    excel_result_cache.store("remove-test", "cached-session", {"session_id": "cached-session"})
+    with TestClient(main.app) as client:
+        response = client.post("/v1/remove_excel_session", json={"session_id": "cached-session"})
+    assert response.status_code == 200
+    assert os.path.isdir(session_path)
+
+
+def test_digests_follow_file_changes_and_stay_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RESULT_CACHE_DIGEST_ENTRIES", 2)
+    path = tmp_path / "input.xlsx"
+    path.write_bytes(b"first")
+    first = file_digest(str(path))
+    path.write_bytes(b"second version")
+    assert file_digest(str(path)) != first
+
+    for index in range(3):
+        (tmp_path / f"{index}.xlsx").write_bytes(str(index).encode())
+        file_digest(str(tmp_path / f"{index}.xlsx"))
+    assert len(_digest_memo) == 2
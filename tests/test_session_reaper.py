@@ -0,0 +1,49 @@
+import time
+import os
+
+from app.v1.session_reaper import SessionReaper
+from app.v1.jobs import JobProgress
+
+
+def make_session(workspace, name: str, age: float, size: int = 10) -> str:
+    folder = workspace / name
+    folder.mkdir()
+    (folder / "comparison_result.html").write_bytes(b"x" * size)
+    used = time.time() - age
+    os.utime(folder, (used, used))
+    return name
+
+
+def test_expired_sessions_are_reaped(tmp_path):
+    reaper = SessionReaper(str(tmp_path), 3600, 10 ** 9, 60)
+    make_session(tmp_path, "old", 7200)
+    make_session(tmp_path, "new", 10)
+    assert reaper.reap() == 1
+    assert sorted(os.listdir(tmp_path)) == [".trash", "new"]
+    assert os.listdir(tmp_path / ".trash") == []
+    assert (reaper.stats()["live_sessions"], reaper.stats()["reaped_sessions"]) == (1, 1)
+
+
+def test_least_recently_used_sessions_go_first_over_the_quota(tmp_path):
+    reaper = SessionReaper(str(tmp_path), 10 ** 6, 250, 60)
+    for name, age in (("a", 3000), ("b", 2000), ("c", 1000)):
+        make_session(tmp_path, name, age, 100)
+    assert reaper.reap() == 1
+    assert not (tmp_path / "a").exists()
+    assert reaper.stats()["live_bytes"] == 200
+
+
+def test_running_jobs_are_never_reaped(tmp_path):
+    reaper = SessionReaper(str(tmp_path), 1, 0, 60)
+    make_session(tmp_path, "job", 5)
+    JobProgress(str(tmp_path / "job")).queued()
+    assert reaper.reap() == 0
+
+
+def test_a_read_keeps_the_session_alive(tmp_path):
+    reaper = SessionReaper(str(tmp_path), 3600, 10 ** 9, 60)
+    make_session(tmp_path, "read", 7200)
+    reaper.touch("read")
+    reaper.touch("..")
+    assert time.time() - os.stat(tmp_path / "read").st_mtime < 60
+    assert reaper.reap() == 0
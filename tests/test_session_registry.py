@@ -0,0 +1,31 @@
+import time
+
+from app.v1.session_registry import SqliteSessionRegistry, open_registry, SessionRegistry
+
+
+def test_sessions_are_shared_through_the_registry(tmp_path):
+    path = str(tmp_path / "registry" / "sessions.db")
+    registry, other_worker = SqliteSessionRegistry(path, 5), SqliteSessionRegistry(path, 5)
+    registry.register("excel", "a")
+    registry.register("excel", "b")
+    registry.register("docx", "a")
+    assert other_worker.contains("excel", "a")
+    assert other_worker.count("excel") == 2
+    other_worker.forget("excel", "a")
+    assert not registry.contains("excel", "a")
+    registry.expire("excel", time.time() + 1)
+    assert (registry.count("excel"), registry.count("docx")) == (0, 1)
+
+
+def test_one_holder_at_a_time_keeps_a_lease(tmp_path, monkeypatch):
+    registry = SqliteSessionRegistry(str(tmp_path / "sessions.db"), 5)
+    assert registry.acquire_lease("reaper:excel", 60)
+    assert registry.acquire_lease("reaper:excel", 60)
+    monkeypatch.setattr("app.v1.session_registry.node_name", lambda: "other-node:1")
+    assert not registry.acquire_lease("reaper:excel", 60)
+    assert registry.acquire_lease("reaper:docx", 60)
+
+
+def test_registry_urls():
+    assert type(open_registry("")) is SessionRegistry
+    assert isinstance(open_registry("sqlite:///sessions.db"), SqliteSessionRegistry)
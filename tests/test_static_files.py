@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from app.v1.static_files import PrecompressedStaticFiles, precompress, MANIFEST_FILE
+from app.v1.jobs import read_json
+
+
+def static_client(directory) -> TestClient:
+    return TestClient(Starlette(routes=[Mount("/static", PrecompressedStaticFiles(directory=str(directory)))]))
+
+
+def test_artifacts_are_served_precompressed_with_a_strong_etag(tmp_path):
+    session = tmp_path / "excel" / "session"
+    session.mkdir(parents=True)
+    (session / "comparison_result.html").write_text("<tr><td>changed</td></tr>" * 200)
+    precompress(str(session / "comparison_result.html"))
+    client = static_client(tmp_path)
+
+    response = client.get("/static/excel/session/comparison_result.html", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == "<tr><td>changed</td></tr>" * 200
+    etag = response.headers["etag"]
+    assert etag.endswith('-gzip"')
+
+    response = client.get("/static/excel/session/comparison_result.html",
+                          headers={"accept-encoding": "gzip", "if-none-match": etag})
+    assert response.status_code == 304
+    response = client.get("/static/excel/session/comparison_result.html", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] != etag
+
+
+def test_internal_files_and_inputs_are_not_served(tmp_path):
+    session = tmp_path / "excel" / "session"
+    for folder in (session / ".job", session / "frames", tmp_path / "excel" / ".cache"):
+        folder.mkdir(parents=True)
+    for path in (session / ".job" / "job.json", session / "frames" / "frames.json", session / "1_input.xlsx",
+                 tmp_path / "excel" / ".cache" / "key.json", session / "result_styles.css"):
+        path.write_text("{}")
+    (session / "comparison_summary.json").write_text("{}")
+    precompress(str(session / "comparison_summary.json"))
+    client = static_client(tmp_path)
+
+    for path in (".job/job.json", "frames/frames.json", "1_input.xlsx", MANIFEST_FILE, "../.cache/key.json"):
+        assert client.get(f"/static/excel/session/{path}").status_code == 404
+    assert client.get("/static/excel/.cache/key.json").status_code == 404
+    assert client.get("/static/excel/session/comparison_summary.json").status_code == 200
+    assert client.get("/static/excel/session/result_styles.css").status_code == 200
+
+
+def test_concurrent_precompress_keeps_every_manifest_entry(tmp_path):
+    names = [f"page_{number}.html" for number in range(32)]
+    for name in names:
+        (tmp_path / name).write_text(name * 100)
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(precompress, [str(tmp_path / name) for name in names]))
+    assert sorted(read_json(os.path.join(tmp_path, MANIFEST_FILE))) == sorted(names)
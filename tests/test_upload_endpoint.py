@@ -0,0 +1,55 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from app.v1.worker_pool import io_pool
+from tests.test_excel_endpoint import write_workbook
+import main
+
+
+def write_pair(tmp_path, values: tuple) -> list:
+    return [write_workbook(tmp_path / f"{side}.xlsx", [["a"], [value]]) for side, value in enumerate(values, start=1)]
+
+
+def upload_pair(client, paths: list) -> str:
+    session_id = client.post("/v1/uploads/excel").json()["session_id"]
+    for side, path in enumerate(paths, start=1):
+        with open(path, "rb") as file:
+            response = client.put(f"/v1/uploads/excel/{session_id}/documents/{side}.xlsx", content=file.read())
+        assert response.status_code == 200
+    return session_id
+
+
+def compare(client, session_id: str):
+    return client.post(f"/v1/uploads/excel/{session_id}/compare",
+                       json={"kind": "excel", "excel_file_1_path": "1.xlsx", "excel_file_2_path": "2.xlsx",
+                             "reader": "openpyxl"})
+
+
+def test_uploads_are_written_while_the_comparison_queue_is_full(tmp_path, monkeypatch):
+    with TestClient(main.app) as client:
+        session_id = client.post("/v1/uploads/excel").json()["session_id"]
+        monkeypatch.setattr(io_pool, "max_queue", -io_pool.max_workers)
+        response = client.put(f"/v1/uploads/excel/{session_id}/documents/1.xlsx", content=b"x" * 4096)
+    assert response.status_code == 200
+    assert response.json()["size"] == 4096
+
+
+def test_a_compared_session_refuses_uploads(tmp_path):
+    with TestClient(main.app) as client:
+        session_id = upload_pair(client, write_pair(tmp_path, ("upload-1", "upload-2")))
+        assert compare(client, session_id).json()["session_id"] == session_id
+        response = client.put(f"/v1/uploads/excel/{session_id}/documents/1.xlsx", content=b"changed")
+        assert response.status_code == 409
+        assert compare(client, session_id).status_code == 409
+
+
+def test_a_cache_hit_names_and_removes_the_upload_session(tmp_path):
+    with TestClient(main.app) as client:
+        paths = write_pair(tmp_path, ("cached-1", "cached-2"))
+        first = compare(client, upload_pair(client, paths)).json()
+        session_id = upload_pair(client, paths)
+        cached = compare(client, session_id).json()
+    assert (cached["session_id"], cached["upload_session_id"], cached["cached"]) == \
+        (first["session_id"], session_id, True)
+    assert not os.path.exists(os.path.join(main.EXCEL_WORKSPACE, session_id))
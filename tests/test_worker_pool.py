@@ -0,0 +1,78 @@
+import threading
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from app.v1 import worker_pool
+from app.v1.worker_pool import WorkerPool, TRASH_FOLDER
+
+
+def blocked_job(release: threading.Event):
+    release.wait(5)
+
+
+def test_full_queue_is_rejected():
+    pool = WorkerPool("thread", 1, 0, 5)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(blocked_job, release))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as error:
+            await pool.run(blocked_job, release)
+        release.set()
+        await running
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert pool.pending == 0
+    pool.shutdown()
+
+
+def test_timed_out_jobs_are_tracked_per_session(tmp_path):
+    pool = WorkerPool("thread", 1, None, 0.05)
+    release = threading.Event()
+    session = str(tmp_path / "a")
+
+    async def scenario():
+        with pytest.raises(HTTPException) as error:
+            await pool.run(blocked_job, release, session=session)
+        assert error.value.status_code == 504
+        assert len(pool.overdue_jobs(session)) == 1
+        assert len(pool.overdue_jobs(os.path.join(session, "sheets"))) == 1
+        assert pool.overdue_jobs(str(tmp_path / "b")) == []
+        release.set()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert pool.overdue_jobs(session) == []
+    pool.shutdown()
+
+
+def test_removal_waits_only_for_the_jobs_of_its_session(tmp_path, monkeypatch):
+    pool = WorkerPool("thread", 2, None, 0.05)
+    monkeypatch.setattr(worker_pool, "io_pool", pool)
+    release = threading.Event()
+    stuck, other = tmp_path / "stuck", tmp_path / "other"
+    stuck.mkdir()
+    other.mkdir()
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await pool.run(blocked_job, release, session=str(stuck))
+        await worker_pool.remove_folder(str(other))
+        assert not other.exists()
+
+        """the stuck session leaves the tree at once and is deleted when its job ends"""
+        await worker_pool.remove_folder(str(stuck))
+        assert not stuck.exists()
+        assert len(os.listdir(tmp_path / TRASH_FOLDER)) == 1
+        release.set()
+        await asyncio.gather(*worker_pool._removals)
+
+    asyncio.run(scenario())
+    assert os.listdir(tmp_path / TRASH_FOLDER) == []
+    pool.shutdown()
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from app.v1.workspace import REFERENCE_SUFFIX, place_document, resolve_document, session_document
+
+
+def write_source(tmp_path, content: bytes = b"document") -> str:
+    source = tmp_path / "input" / "a.docx"
+    source.parent.mkdir(exist_ok=True)
+    source.write_bytes(content)
+    return str(source)
+
+
+def session(tmp_path) -> str:
+    session_path = tmp_path / "session"
+    session_path.mkdir(exist_ok=True)
+    return str(session_path)
+
+
+@pytest.mark.parametrize("strategy", ["auto", "reflink", "hardlink", "copy"])
+def test_placed_documents_read_like_the_source(tmp_path, strategy):
+    source, session_path = write_source(tmp_path), session(tmp_path)
+    method = place_document(source, session_path, 1, strategy)
+    assert method in {"reflink", "hardlink", "copy"}
+    target = session_document(session_path, 1, source)
+    assert resolve_document(target) == target
+    with open(target, "rb") as file:
+        assert file.read() == b"document"
+
+
+def test_same_file_names_get_a_path_per_side(tmp_path):
+    source, session_path = write_source(tmp_path), session(tmp_path)
+    place_document(source, session_path, 1, "copy")
+    place_document(source, session_path, 2, "copy")
+    assert session_document(session_path, 1, source) != session_document(session_path, 2, source)
+    assert place_document(session_document(session_path, 1, source), session_path, 1) == "in_place"
+
+
+def test_references_are_checked_against_the_source(tmp_path):
+    source, session_path = write_source(tmp_path), session(tmp_path)
+    assert place_document(source, session_path, 1, "reference") == "reference"
+    target = session_document(session_path, 1, source)
+    assert not os.path.exists(target) and os.path.exists(f"{target}{REFERENCE_SUFFIX}")
+    assert resolve_document(target) == os.path.abspath(source)
+
+    with open(source, "wb") as file:
+        file.write(b"edited")
+    with pytest.raises(HTTPException) as error:
+        resolve_document(target)
+    assert error.value.status_code == 409
+    os.remove(source)
+    with pytest.raises(HTTPException) as error:
+        resolve_document(target)
+    assert error.value.status_code == 404
+
+
+def test_missing_sources_are_not_copied(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        place_document(str(tmp_path / "missing.docx"), session(tmp_path), 1, "auto")
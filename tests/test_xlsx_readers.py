@@ -0,0 +1,93 @@
+from xml.sax.saxutils import escape, unescape
+import datetime
+import zipfile
+import re
+
+import pytest
+from openpyxl import Workbook
+from openpyxl.chart import BarChart, Reference
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+from app.v1.xlsx_readers import open_reader
+
+SHARED_STRINGS_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+SHARED_STRINGS_RELATIONSHIP = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+MAIN_NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+
+
+def share_strings(path: str, keep_inline: str):
+    """openpyxl writes every string inline; move all but one into a shared string table, as Excel does, with one
+    entry in rich text runs"""
+    with zipfile.ZipFile(path) as package:
+        parts = {item.filename: package.read(item.filename) for item in package.infolist()}
+    strings = []
+
+    def shared(match):
+        text = unescape(match.group(2).decode())
+        if text == keep_inline:
+            return match.group(0)
+        strings.append(text)
+        return b'<c r="%s" t="s"><v>%d</v></c>' % (match.group(1), len(strings) - 1)
+
+    for name in [name for name in parts if name.startswith("xl/worksheets/")]:
+        parts[name] = re.sub(rb'<c r="(\w+)" t="inlineStr"><is><t>([^<]*)</t></is></c>', shared, parts[name])
+    items = [f"<si><r><t>{escape(text[:2])}</t></r><r><t>{escape(text[2:])}</t></r></si>" if text == "rich text"
+             else f"<si><t>{escape(text)}</t></si>" for text in strings]
+    parts["xl/sharedStrings.xml"] = (f'<sst xmlns="{MAIN_NAMESPACE}" count="{len(items)}" '
+                                     f'uniqueCount="{len(items)}">{"".join(items)}</sst>').encode()
+    parts["[Content_Types].xml"] = parts["[Content_Types].xml"].replace(
+        b"</Types>", f'<Override PartName="/xl/sharedStrings.xml" ContentType="{SHARED_STRINGS_TYPE}"/></Types>'.encode())
+    parts["xl/_rels/workbook.xml.rels"] = parts["xl/_rels/workbook.xml.rels"].replace(
+        b"</Relationships>",
+        f'<Relationship Type="{SHARED_STRINGS_RELATIONSHIP}" Target="sharedStrings.xml" Id="rIdStrings"/>'
+        f'</Relationships>'.encode())
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as package:
+        for name, data in parts.items():
+            package.writestr(name, data)
+
+
+def edge_case_workbook(path, epoch=None) -> str:
+    """a chartsheet before the worksheets, shared, rich and inline strings, dates, times, booleans, number formats,
+    formulas without cached values and gaps in rows and columns"""
+    workbook = Workbook()
+    if epoch is not None:
+        workbook.epoch = epoch
+    sheet = workbook.active
+    sheet.title = "data"
+    sheet.append(["text", "number", "float", "date", "datetime", "bool", "time"])
+    sheet.append(["shared", 1, 2.5, datetime.date(2021, 3, 4), datetime.datetime(2021, 3, 4, 5, 6, 7), True,
+                  datetime.time(12, 30)])
+    sheet.append(["shared", -3, 1e20, datetime.date(1900, 3, 1), None, False, None])
+    sheet.append(["rich text", "<&>", 0.1, "2021-03-04"])
+    sheet["J7"] = "inline"
+    sheet["B9"] = "=1+1"
+    sheet["C9"] = 0.25
+    sheet["C9"].number_format = "0.00%"
+    sheet["D9"] = 45000
+    sheet["D9"].number_format = "yyyy-mm-dd hh:mm"
+    chart = BarChart()
+    chart.add_data(Reference(sheet, min_col=2, min_row=1, max_row=3))
+    workbook.create_chartsheet("chart", 0).add_chart(chart)
+    workbook.create_sheet("second").append(["x", 1])
+    workbook.save(path)
+    share_strings(str(path), "inline")
+    return str(path)
+
+
+def read_all(path: str, name: str) -> dict:
+    reader = open_reader(path, name)
+    try:
+        return {sheet: [tuple(row) for row in reader.iter_rows(number)]
+                for number, sheet in enumerate(reader.sheetnames, start=1)}
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize("epoch", [None, CALENDAR_MAC_1904])
+def test_sax_reads_what_openpyxl_reads(tmp_path, epoch):
+    path = edge_case_workbook(tmp_path / "edge.xlsx", epoch)
+    expected = read_all(path, "openpyxl")
+    assert list(expected) == ["data", "second"]
+    assert expected["data"][3][:2] == ("rich text", "<&>")
+    assert expected["data"][6][9] == "inline"
+    assert read_all(path, "sax") == expected